@@ -5,31 +5,76 @@ import urllib.parse
 import random
 import requests
 from collections import Counter
+from operator import itemgetter
 import time
 import os
+import math
+import uuid
+import queue
+import tempfile
+import threading
+import contextvars
 from datetime import datetime, timedelta
 import logging
+from array import array
+import numpy as np
+from echomood_cache import PlaylistCache, StageCache
+from echomood_executor import AdaptiveExecutor, CircuitOpenError
+from echomood_workers import FairWorkerPool, CancelToken, OperationCancelled, work_context
+from echomood_cassette import Cassette, CassetteSession, REPLAY
+from echomood_features import FeatureStore
+from echomood_coalesce import BatchCoalescer
+from echomood_jobs import JobRunner, DONE, FAILED, CANCELLED
+from echomood_genres import GenreStats
+from echomood_playlist import select_diverse, sequence_tracks
+from echomood_moods import kmeans, name_cluster
+from echomood_similar import SimilarityIndex
+from echomood_sessions import SessionMemoryManager, estimate_bytes
+from echomood_quota import QuotaScheduler, QuotaSession
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize session state
-def initialize_session_state():
-    """Initialize all session state variables with default values."""
-    defaults = {
+def session_defaults():
+    """Default value of every session state variable, as fresh objects."""
+    return {
         "page": "fetch_music",
+        "session_id": uuid.uuid4().hex,
         "music_data": [],
         "spotify_genres": [],
+        "genre_stats": None,
+        "genre_confidence": None,
+        "genre_job_id": None,
         "selected_genres": [],
         "selected_mood": {},
         "selected_familiarity": 50,
-        "filtered_music_data": [],
+        "filtered_indices": array('I'),
+        "filter_version": 0,
+        "library_version": 0,
+        "track_features": {},
+        "artist_genres": {},
+        "stage_cache": StageCache(),
+        "candidate_order": None,
+        "playlist_selection": None,
+        "preset_results": {},
+        "mood_clusters": [],
+        "similarity_index": None,
+        "listening_history": {},
+        "data_modes": {},
+        "load_data_modes": {},
+        "load_job_id": None,
+        "load_request": None,
+        "run_cancel": None,
         "playlist_name": "",
         "spotify_client": None,
         "auth_manager": None
     }
-    for key, value in defaults.items():
+
+# Initialize session state
+def initialize_session_state():
+    """Initialize all session state variables with default values."""
+    for key, value in session_defaults().items():
         if key not in st.session_state:
             st.session_state[key] = value
 
@@ -41,6 +86,35 @@ class Config:
     # IMPORTANT: Update this to match your Spotify app settings
     REDIRECT_URI = "https://echomood-ydeurclvwvw8u7zvpeedjc.streamlit.app/"
     CACHE_PATH = ".cache"
+    PLAYLIST_CACHE_ENTRIES = 64
+    # Spotify's per-request maximums; the executor tunes how many run at once
+    SAVED_TRACKS_PAGE_SIZE = 50
+    PLAYLIST_PAGE_SIZE = 100
+    ARTISTS_BATCH_SIZE = 50
+    # Genres offered in the genre picker, most common first
+    TOP_GENRES = 30
+    # Moods discovered in each library, and the mini-batch size used for big libraries
+    MOOD_CLUSTERS = 6
+    MOOD_CLUSTER_BATCH_SIZE = 5000
+    # Tracks shown (and used) by "More like this"
+    SIMILAR_TRACKS = 25
+    # Default diversity caps when picking a playlist's tracks
+    MAX_TRACKS_PER_ARTIST = 2
+    MAX_TRACKS_PER_ALBUM = 2
+    MAX_GENRE_SHARE = 0.5
+    # Above this many unresolved artists the genre list is first estimated from a sample this size
+    GENRE_SAMPLE_SIZE = 1000
+    AUDIO_FEATURES_BATCH_SIZE = 100
+    MAX_CONCURRENT_REQUESTS = 8
+    WORKER_POOL_SIZE = 16
+    # Every session shares one client id's rate limit: at most this many Spotify requests per
+    # rolling window, granted fairly across sessions (0 turns the quota off)
+    SPOTIFY_QUOTA_REQUESTS = int(os.getenv("ECHOMOOD_QUOTA_REQUESTS", "600"))
+    SPOTIFY_QUOTA_WINDOW = float(os.getenv("ECHOMOOD_QUOTA_WINDOW_SECONDS", "30"))
+    # Server-side projection of playlist pages to just the fields EchoMood uses
+    PLAYLIST_ITEM_FIELDS = (
+        "items(added_at,track(id,name,type,artists(id,name),album(id,images),external_ids(isrc)))"
+    )
     SCOPES = [
         "user-library-read",
         "playlist-modify-public", 
@@ -48,6 +122,59 @@ class Config:
         "user-top-read",
         "user-read-recently-played"
     ]
+    RESULTS_PAGE_SIZES = [25, 50, 100]
+    # Retries for failed library pages before a load stops (it can be resumed from its checkpoint)
+    PAGE_RETRIES = 3
+    PAGE_RETRY_BACKOFF = 1.0
+    # Record/replay of Spotify traffic: "record", "replay" or unset
+    CASSETTE_MODE = os.getenv("ECHOMOOD_CASSETTE_MODE")
+    CASSETTE_PATH = os.getenv("ECHOMOOD_CASSETTE_PATH", "echomood_cassette.jsonl.gz")
+    # Fixed replay latency per request; unset replays the recorded timings
+    CASSETTE_LATENCY_MS = os.getenv("ECHOMOOD_CASSETTE_LATENCY_MS")
+    # Offline audio-features store built with echomood_features.py, used before the API if present
+    FEATURE_STORE_PATH = os.getenv("ECHOMOOD_FEATURE_STORE", "echomood_features.db")
+    # Idle sessions' library data is spilled here, after SESSION_IDLE_SECONDS or sooner
+    # (least recently used first) while resident sessions exceed the memory budget
+    SESSION_SPILL_DIR = os.getenv("ECHOMOOD_SPILL_DIR", os.path.join(tempfile.gettempdir(), "echomood-sessions"))
+    SESSION_MEMORY_BUDGET_MB = int(os.getenv("ECHOMOOD_SESSION_BUDGET_MB", "1024"))
+    SESSION_IDLE_SECONDS = int(os.getenv("ECHOMOOD_SESSION_IDLE_SECONDS", "900"))
+
+# Audio features kept per track (the six mood dimensions plus tempo)
+MOOD_FEATURES = ["valence", "energy", "danceability", "acousticness", "instrumentalness", "liveness"]
+STORED_FEATURES = MOOD_FEATURES + ["tempo"]
+
+# Named target moods over the six mood dimensions
+MOOD_PRESETS = {
+    "Happy": {"valence": 0.8, "energy": 0.7, "danceability": 0.7,
+              "acousticness": 0.2, "instrumentalness": 0.05, "liveness": 0.2},
+    "Sad": {"valence": 0.2, "energy": 0.3, "danceability": 0.35,
+            "acousticness": 0.6, "instrumentalness": 0.15, "liveness": 0.15},
+    "Workout": {"valence": 0.6, "energy": 0.9, "danceability": 0.75,
+                "acousticness": 0.05, "instrumentalness": 0.1, "liveness": 0.2},
+    "Chill": {"valence": 0.5, "energy": 0.3, "danceability": 0.5,
+              "acousticness": 0.6, "instrumentalness": 0.3, "liveness": 0.1},
+}
+
+# Playlist order choices -> sequence_tracks arc, or "best" (closest match first) / "shuffle"
+PLAYLIST_ORDERS = {
+    "Smooth transitions": "smooth",
+    "Build up": "build up",
+    "Wind down": "wind down",
+    "Build up, then wind down": "peak",
+    "Best match first": "best",
+    "Shuffle": "shuffle",
+}
+
+# Session state holding a loaded library, spilled to disk while a session is idle
+SPILLED_SESSION_KEYS = [
+    "music_data", "filtered_indices", "track_features", "artist_genres", "listening_history", "genre_stats",
+    "stage_cache", "candidate_order", "playlist_selection", "preset_results", "mood_clusters", "similarity_index",
+]
+
+# Where a result's data came from, recorded in data_modes when an endpoint is degraded
+MODE_LIVE = "live"
+MODE_CACHED = "cached"
+MODE_SKIPPED = "skipped"
 
 def get_spotify_credentials():
     """Get Spotify credentials from Streamlit secrets or environment variables."""
@@ -119,9 +246,22 @@ def clear_spotify_cache():
     except Exception as e:
         logger.warning(f"Could not clear cache: {e}")
 
+@st.cache_resource
+def get_cassette():
+    """Shared record/replay cassette, or None when ECHOMOOD_CASSETTE_MODE isn't set."""
+    if not Config.CASSETTE_MODE:
+        return None
+    latency = float(Config.CASSETTE_LATENCY_MS) / 1000 if Config.CASSETTE_LATENCY_MS else None
+    return Cassette(Config.CASSETTE_PATH, Config.CASSETTE_MODE, latency=latency)
+
 def get_spotify_client():
     """Get authenticated Spotify client - REMOVED @st.cache_resource to fix widget error."""
     try:
+        cassette = get_cassette()
+        if cassette and cassette.mode == REPLAY:
+            # Replay needs no credentials or login: every response comes from the cassette
+            return spotipy.Spotify(auth="replay", requests_session=CassetteSession(cassette))
+
         client_id, client_secret = get_spotify_credentials()
         
         auth_manager = SpotifyOAuth(
@@ -154,18 +294,101 @@ def get_spotify_client():
                 st.info("After logging in, you'll be redirected back to this app.")
                 st.stop()
 
-        return spotipy.Spotify(auth_manager=auth_manager)
+        if cassette:
+            requests_session = CassetteSession(cassette)
+        elif get_quota_scheduler():
+            requests_session = QuotaSession(get_quota_scheduler())
+        else:
+            requests_session = True
+        return spotipy.Spotify(auth_manager=auth_manager, requests_session=requests_session)
     
     except Exception as e:
         st.error(f"Failed to authenticate with Spotify: {e}")
         st.write("Please check your credentials and try again.")
         st.stop()
 
-def calculate_real_familiarity_batch(track_ids, sp):
-    """Calculate familiarity scores for multiple tracks efficiently."""
+@st.cache_resource
+def get_playlist_cache():
+    """Playlist content cache shared by every session in this process."""
+    return PlaylistCache(max_entries=Config.PLAYLIST_CACHE_ENTRIES)
+
+@st.cache_resource
+def get_worker_pool():
+    """Bounded worker pool shared by every session, with per-session fair queuing."""
+    return FairWorkerPool(max_workers=Config.WORKER_POOL_SIZE)
+
+@st.cache_resource
+def get_quota_scheduler():
+    """Spotify request quota shared by every session, or None when it is turned off."""
+    if Config.SPOTIFY_QUOTA_REQUESTS <= 0:
+        return None
+    return QuotaScheduler(Config.SPOTIFY_QUOTA_REQUESTS, window=Config.SPOTIFY_QUOTA_WINDOW)
+
+@st.cache_resource
+def get_coalescer(endpoint):
+    """Cross-session single-flight batching for one catalog lookup endpoint."""
+    batch_sizes = {"artists": Config.ARTISTS_BATCH_SIZE, "audio_features": Config.AUDIO_FEATURES_BATCH_SIZE}
+    return BatchCoalescer(endpoint, get_executor(), batch_sizes[endpoint])
+
+@st.cache_resource
+def get_job_runner():
+    """Background job runner shared by every session."""
+    return JobRunner()
+
+@st.cache_resource
+def get_session_manager():
+    # Results and checkpoints a session's jobs still hold count towards its memory too
+    job_runner = get_job_runner()
+    return SessionMemoryManager(
+        Config.SESSION_SPILL_DIR, SPILLED_SESSION_KEYS, session_defaults,
+        Config.SESSION_MEMORY_BUDGET_MB * 2 ** 20, idle_seconds=Config.SESSION_IDLE_SECONDS,
+        held_bytes=lambda session_id: sum(estimate_bytes(value) for value in job_runner.held(session_id))
+    )
+
+def current_session_state():
+    """This session's underlying state mapping and the lock Streamlit guards it with.
+
+    Both stay valid between the session's script runs. Returns (None, None)
+    outside a Streamlit session.
+    """
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        safe_state = get_script_run_ctx().session_state
+        return safe_state._state, safe_state._lock
+    except Exception:
+        return None, None
+
+@st.cache_resource
+def get_feature_store():
+    """Offline audio-features store shared by every session, or None if none has been imported."""
+    if not os.path.exists(Config.FEATURE_STORE_PATH):
+        return None
+    try:
+        return FeatureStore(Config.FEATURE_STORE_PATH)
+    except Exception as e:
+        logger.warning(f"Could not open feature store {Config.FEATURE_STORE_PATH}: {e}")
+        return None
+
+@st.cache_resource
+def get_executor():
+    """Adaptive-concurrency executor for Spotify batch calls, shared by every session."""
+    return AdaptiveExecutor(max_workers=Config.MAX_CONCURRENT_REQUESTS, pool=get_worker_pool())
+
+def calculate_real_familiarity_batch(track_ids, sp, history_cache=None, modes=None):
+    """Calculate familiarity scores for multiple tracks efficiently.
+
+    The listening history behind the scores is kept in history_cache, so if
+    Spotify is unavailable the scores are recomputed deterministically from
+    the last good history instead of being guessed.
+    """
+    if history_cache is None:
+        history_cache = {}
+    if modes is None:
+        modes = {}
+    executor = get_executor()
     try:
         # Get recently played tracks once
-        recent_tracks = sp.current_user_recently_played(limit=50)
+        recent_tracks = executor.call("recently_played", sp.current_user_recently_played, limit=50)
         recent_track_ids = [item['track']['id'] for item in recent_tracks['items']]
         recent_counts = Counter(recent_track_ids)
         
@@ -173,190 +396,494 @@ def calculate_real_familiarity_batch(track_ids, sp):
         top_track_ids = set()
         try:
             for time_range in ['short_term', 'medium_term']:
-                top_tracks = sp.current_user_top_tracks(time_range=time_range, limit=50)
+                top_tracks = executor.call("top_tracks", sp.current_user_top_tracks, time_range=time_range, limit=50)
                 top_track_ids.update(track['id'] for track in top_tracks['items'])
         except Exception:
             pass  # Continue without top tracks if it fails
-        
-        # Calculate scores for all tracks
-        familiarity_scores = {}
-        for track_id in track_ids:
-            play_count = recent_counts.get(track_id, 0)
-            base_score = min(play_count * 15, 60)
-            top_bonus = 40 if track_id in top_track_ids else 0
-            familiarity_scores[track_id] = min(base_score + top_bonus, 100)
-        
-        return familiarity_scores
+
+        history_cache['recent_counts'] = recent_counts
+        history_cache['top_track_ids'] = top_track_ids
+        modes['familiarity'] = MODE_LIVE
         
     except Exception as e:
-        logger.warning(f"Could not calculate familiarity batch: {e}")
-        # Return random scores as fallback
-        return {track_id: random.randint(0, 100) for track_id in track_ids}
-
-def get_spotify_genres_from_tracks(tracks, sp):
-    """Fetch genres from tracks' artists."""
+        if 'recent_counts' not in history_cache:
+            logger.warning(f"Could not calculate familiarity batch: {e}")
+            # No history to fall back on: scores are unknown, so Apply skips the familiarity filter
+            modes['familiarity'] = MODE_SKIPPED
+            return {track_id: 0 for track_id in track_ids}
+        logger.warning(f"Using cached listening history for familiarity: {e}")
+        recent_counts = history_cache['recent_counts']
+        top_track_ids = history_cache['top_track_ids']
+        modes['familiarity'] = MODE_CACHED
+
+    # Calculate scores for all tracks
+    familiarity_scores = {}
+    for track_id in track_ids:
+        play_count = recent_counts.get(track_id, 0)
+        base_score = min(play_count * 15, 60)
+        top_bonus = 40 if track_id in top_track_ids else 0
+        familiarity_scores[track_id] = min(base_score + top_bonus, 100)
+    
+    return familiarity_scores
+
+def fetch_artist_genres(artist_ids, sp, genre_cache=None, modes=None, cancel=None):
+    """Look up genres for artist IDs in batches of 50, coalesced with other sessions' lookups.
+
+    Artists already in genre_cache (artist id -> genres) skip the API and newly
+    fetched ones are added to it. If some batches fail, modes['genres'] is set
+    to "cached" (or "skipped" when no genres are known at all).
+    """
+    if genre_cache is None:
+        genre_cache = {}
+    if modes is None:
+        modes = {}
+    modes['genres'] = MODE_LIVE
+    artist_genres = {}
+    missing = []
+    for artist_id in artist_ids:
+        if artist_id in genre_cache:
+            artist_genres[artist_id] = genre_cache[artist_id]
+        else:
+            missing.append(artist_id)
+
+    # Sorted so the same library always produces the same batches (and cassette keys)
+    missing.sort()
+    results, errors = get_coalescer("artists").fetch(
+        missing, lambda batch: sp.artists(batch)['artists'], cancel=cancel
+    )
+    for artist_id, artist in results.items():
+        # Unknown artists come back as null; remember them as genre-less
+        genres = artist.get('genres', []) if artist else []
+        genre_cache[artist_id] = genres
+        artist_genres[artist_id] = genres
+
+    if errors:
+        error = next(iter(errors.values()))
+        if not isinstance(error, CircuitOpenError):
+            logger.warning(f"Failed to fetch genres for {len(errors)} artists: {error}")
+        modes['genres'] = MODE_CACHED if artist_genres else MODE_SKIPPED
+    return artist_genres
+
+def get_spotify_genres_from_tracks(tracks, sp, genre_cache=None, cancel=None, modes=None, genre_stats=None,
+                                   sample_size=None):
+    """Fetch genres from tracks' artists, ranked by how many tracks carry each.
+
+    genre_stats, if given, has already counted the tracks (e.g. while they
+    loaded) and is updated in place. With sample_size, when more artists
+    than that are unresolved only a track-weighted sample of them is looked
+    up and the list is an estimate; refine_genres_job makes it exact later.
+    Returns (genres, confidence), confidence being None for an exact list.
+    """
     try:
-        artist_ids = set()
-        
-        # Collect all unique artist IDs
-        for item in tracks:
-            if 'track' in item and item['track'] and 'artists' in item['track']:
-                for artist in item['track']['artists']:
-                    if artist.get('id'):
-                        artist_ids.add(artist['id'])
-
-        if not artist_ids:
-            return []
-
-        artist_ids = list(artist_ids)
-        artist_genres = {}
-
-        # Fetch artist information in batches of 50
-        for i in range(0, len(artist_ids), 50):
-            batch = artist_ids[i:i+50]
-            try:
-                results = sp.artists(batch)
-                for artist in results['artists']:
-                    if artist:
-                        artist_genres[artist['id']] = artist.get('genres', [])
-            except Exception as e:
-                logger.warning(f"Failed to fetch artists batch {i//50 + 1}: {e}")
-                continue
-
-        # Collect all genres and count them
-        all_genres = []
-        for artist_id, genres in artist_genres.items():
-            all_genres.extend(genres)
-
-        # Return most common genres
-        genre_counts = Counter(all_genres)
-        return [genre for genre, count in genre_counts.most_common(30)]
-        
+        if genre_stats is None:
+            genre_stats = GenreStats()
+            genre_stats.add_tracks(tracks)
+        unresolved = genre_stats.unresolved_artists()
+
+        if sample_size and len(unresolved) > sample_size:
+            # Seeded, so a replayed load samples (and requests) the same artists
+            sample = genre_stats.sample_unresolved(sample_size, random.Random(0))
+            genre_stats.add_artist_genres(fetch_artist_genres(sample[0], sp, genre_cache, modes, cancel=cancel))
+            ranked, confidence = genre_stats.estimate_top(sample, Config.TOP_GENRES)
+            if not ranked and confidence == 0.0:
+                # Too little of the sample resolved to estimate from: show what is known, unconfidently
+                return genre_stats.top(Config.TOP_GENRES), 0.0
+            return [genre for genre, _, _ in ranked], confidence
+
+        if unresolved:
+            genre_stats.add_artist_genres(fetch_artist_genres(unresolved, sp, genre_cache, modes, cancel=cancel))
+        return genre_stats.top(Config.TOP_GENRES), None
+
+    except OperationCancelled:
+        raise
     except Exception as e:
         logger.error(f"Error fetching genres: {e}")
-        return []
+        return [], None
+
+def refine_genres_job(job, genre_stats, sp, genre_cache):
+    """Background job: resolve the artists a sampled genre estimate skipped, for exact counts."""
+    modes = {}
+    unresolved = genre_stats.unresolved_artists()
+    chunk_size = 10 * Config.ARTISTS_BATCH_SIZE
+    for start in range(0, len(unresolved), chunk_size):
+        job.report(start / len(unresolved), f"Refining genres... ({start}/{len(unresolved)} artists)")
+        chunk = unresolved[start:start + chunk_size]
+        genre_stats.add_artist_genres(fetch_artist_genres(chunk, sp, genre_cache, modes, cancel=job.cancel_token))
+    return {"spotify_genres": genre_stats.top(Config.TOP_GENRES), "data_modes": modes}
+
+def start_genre_resolver(stats, sp, genre_cache, cancel=None):
+    """Look up artist genres on a background thread while library pages are still arriving.
+
+    Returns (artist_queue, thread). Put each page's newly seen artist ids on
+    the queue as one list, and None after the last page; the thread feeds
+    each resolved batch into stats and exits once everything queued before
+    the None is done. Whenever a page brings the backlog to a full batch,
+    the backlog's full batches are looked up in sorted order, so the same
+    library always makes the same requests (and cassette keys) however the
+    pages are timed.
+    """
+    artist_queue = queue.Queue()
+    batch_size = Config.ARTISTS_BATCH_SIZE
+
+    def resolve():
+        pending = []
+        try:
+            while True:
+                page_ids = artist_queue.get()
+                if page_ids is None:
+                    ready, pending = sorted(pending), []
+                else:
+                    pending.extend(page_ids)
+                    if len(pending) < batch_size:
+                        continue
+                    pending.sort()
+                    full = len(pending) - len(pending) % batch_size
+                    ready, pending = pending[:full], pending[full:]
+                if ready:
+                    stats.add_artist_genres(fetch_artist_genres(ready, sp, genre_cache, cancel=cancel))
+                if page_ids is None:
+                    return
+        except OperationCancelled:
+            pass
+        except Exception as e:
+            # Whatever is left unresolved is looked up again once loading finishes
+            logger.warning(f"Background genre lookup stopped: {e}")
+
+    # Copy the context so lookups stay attributed to the job's session in the worker pool
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(resolve,), daemon=True,
+                              name="echomood-genres")
+    thread.start()
+    return artist_queue, thread
+
+def project_track_item(item):
+    """Keep only the fields EchoMood uses from a saved-track or playlist item.
+
+    Raw items carry large available_markets arrays on both the track and its
+    album; dropping them as each page arrives keeps a big library small.
+    """
+    track = item.get('track')
+    if not track or track.get('type', 'track') != 'track':
+        return {'added_at': item.get('added_at'), 'track': None}
+    album = track.get('album') or {}
+    images = album.get('images') or []
+    return {
+        'added_at': item.get('added_at'),
+        'track': {
+            'id': track.get('id'),
+            'name': track.get('name'),
+            'artists': [{'id': a.get('id'), 'name': a.get('name')} for a in track.get('artists') or []],
+            'album': {'id': album.get('id'), 'images': images[:1]},
+            'external_ids': {'isrc': (track.get('external_ids') or {}).get('isrc')},
+        },
+    }
+
+def project_page(response):
+    """Project a page of items as soon as it's parsed, so the raw page can be freed."""
+    return [project_track_item(item) for item in response['items']]
+
+def fetch_library(fetch_type, playlist_url=None, sp=None, checkpoint=None, on_progress=None, on_page=None,
+                  cancel=None):
+    """Fetch and project every track in Liked Songs or a playlist, without touching the UI.
+
+    Pages already in checkpoint['pages'] (offset -> projected items) are
+    reused and every page fetched is added to it, so a failed load can be
+    resumed from where it stopped by passing the same checkpoint again.
+    Failed pages are retried with backoff before the last error is raised.
+    on_progress(loaded, total) is called as pages arrive, and on_page(items)
+    once for every page, reused ones included. If cancel is cancelled,
+    queued pages are dropped and OperationCancelled is raised.
+    """
+    if sp is None:
+        sp = get_spotify_client()
+    if checkpoint is None:
+        checkpoint = {}
+    executor = get_executor()
+
+    if fetch_type == "Liked Songs":
+        # market="from_token" makes Spotify omit the available_markets arrays
+        page_size = Config.SAVED_TRACKS_PAGE_SIZE
+        source = ("liked",)
+        fetch_page = lambda offset: project_page(
+            sp.current_user_saved_tracks(limit=page_size, offset=offset, market="from_token")
+        )
+        if checkpoint.get('source') != source:
+            checkpoint.clear()
+            # The first page also tells us the total count
+            first_page = executor.call("saved_tracks", sp.current_user_saved_tracks,
+                                       limit=page_size, market="from_token")
+            checkpoint.update(source=source, total=first_page['total'], pages={0: project_page(first_page)})
+        endpoint = "saved_tracks"
+        playlist_id = snapshot_id = None
+
+    elif fetch_type == "Playlist" and playlist_url:
+        # Extract playlist ID from URL
+        if "/playlist/" not in playlist_url:
+            raise ValueError("Invalid playlist URL format")
+        playlist_id = playlist_url.split("/playlist/")[1].split("?")[0]
+
+        # Get lightweight playlist info (snapshot_id changes only on edits)
+        playlist_info = executor.call("playlist", sp.playlist, playlist_id, fields="snapshot_id,tracks.total")
+        snapshot_id = playlist_info['snapshot_id']
+        source = ("playlist", playlist_id, snapshot_id)
+        if checkpoint.get('source') != source:
+            # A checkpoint from an older snapshot can't be mixed with the new one
+            checkpoint.clear()
+            checkpoint.update(source=source, total=playlist_info['tracks']['total'], pages={})
+
+        # Reuse the tracks if any session already loaded this snapshot
+        cached_items = get_playlist_cache().get(playlist_id, snapshot_id)
+        if cached_items is not None:
+            if on_page:
+                on_page(cached_items)
+            if on_progress:
+                on_progress(len(cached_items), len(cached_items))
+            return [item for item in cached_items if item['track'] and item['track'].get('id')
+                    and item['track'].get('name')]
+
+        page_size = Config.PLAYLIST_PAGE_SIZE
+        fetch_page = lambda offset: project_page(sp.playlist_items(
+            playlist_id, fields=Config.PLAYLIST_ITEM_FIELDS, limit=page_size,
+            offset=offset, additional_types=("track",)
+        ))
+        endpoint = "playlist_items"
 
-def get_spotify_data(fetch_type, playlist_url=None, progress_bar=None):
+    else:
+        raise ValueError(f"Unknown music source: {fetch_type}")
+
+    total = checkpoint['total']
+    pages = checkpoint['pages']
+    offsets = range(0, total, page_size)
+
+    # Fetch the missing pages concurrently; on errors keep what arrived and retry only the rest
+    loaded = sum(len(page) for page in pages.values())
+    if on_page:
+        for page in pages.values():
+            on_page(page)
+    for attempt in range(Config.PAGE_RETRIES + 1):
+        last_error = None
+        missing = [o for o in offsets if o not in pages]
+        for offset, page, error in executor.map(endpoint, fetch_page, missing, cancel=cancel):
+            if error:
+                last_error = error
+                continue
+            pages[offset] = page
+            loaded += len(page)
+            if on_page:
+                on_page(page)
+            if on_progress:
+                on_progress(min(loaded, total), total)
+        if last_error is None:
+            break
+        if attempt == Config.PAGE_RETRIES or isinstance(last_error, CircuitOpenError):
+            raise last_error
+        missing = sum(1 for o in offsets if o not in pages)
+        logger.warning(f"{missing} {endpoint} pages failed, retrying: {last_error}")
+        backoff = Config.PAGE_RETRY_BACKOFF * 2 ** attempt
+        if cancel is not None and cancel.wait(backoff):
+            cancel.raise_if_cancelled()
+        elif cancel is None:
+            time.sleep(backoff)
+
+    results = [item for offset in offsets for item in pages[offset]]
+    if playlist_id:
+        get_playlist_cache().put(playlist_id, snapshot_id, results)
+
+    # Filter out tracks without valid IDs
+    return [item for item in results if item['track'] and item['track'].get('id') and item['track'].get('name')]
+
+def get_spotify_data(fetch_type, playlist_url=None, progress_bar=None, sp=None, cancel=None):
     """Fetch music data from Spotify."""
+    def on_progress(loaded, total):
+        if progress_bar:
+            progress = min(int(loaded / total * 100), 100) if total else 100
+            progress_bar.progress(progress, text=f"Loading tracks... ({loaded}/{total})")
+
     try:
-        sp = get_spotify_client()
-        results = []
-        offset = 0
-        total = 0
+        data = fetch_library(fetch_type, playlist_url, sp=sp, on_progress=on_progress, cancel=cancel)
+    except OperationCancelled:
+        raise
+    except Exception as e:
+        source = "liked songs" if fetch_type == "Liked Songs" else "playlist"
+        st.error(f"Failed to fetch {source}: {e}")
+        return []
 
+    if not data:
         if fetch_type == "Liked Songs":
-            try:
-                # Get total count first
-                initial_response = sp.current_user_saved_tracks(limit=1)
-                total = initial_response['total']
-                
-                if total == 0:
-                    st.warning("No liked songs found. Please like some songs on Spotify first!")
-                    return []
-
-                # Fetch all liked songs
-                while True:
-                    response = sp.current_user_saved_tracks(limit=50, offset=offset)
-                    batch = response['items']
-                    results.extend(batch)
-                    offset += 50
-                    
-                    if progress_bar:
-                        progress = min(int(len(results) / total * 100), 100)
-                        progress_bar.progress(progress, text=f"Loading tracks... ({len(results)}/{total})")
-                    
-                    if len(batch) < 50:
-                        break
-                        
-            except Exception as e:
-                st.error(f"Failed to fetch liked songs: {e}")
-                return []
+            st.warning("No liked songs found. Please like some songs on Spotify first!")
+        else:
+            st.warning("This playlist is empty!")
+    return data
 
-        elif fetch_type == "Playlist" and playlist_url:
-            try:
-                # Extract playlist ID from URL
-                if "/playlist/" in playlist_url:
-                    playlist_id = playlist_url.split("/playlist/")[1].split("?")[0]
-                else:
-                    st.error("Invalid playlist URL format")
-                    return []
+def load_library_job(job, fetch_type, playlist_url, sp, history_cache, feature_cache, genre_cache):
+    """Background job: fetch the library (resuming from job.checkpoint), then enrich it.
 
-                # Get playlist info
-                playlist_info = sp.playlist(playlist_id)
-                total = playlist_info['tracks']['total']
-                
-                if total == 0:
-                    st.warning("This playlist is empty!")
-                    return []
-
-                # Fetch all playlist tracks
-                while True:
-                    response = sp.playlist_tracks(playlist_id, limit=100, offset=offset)
-                    batch = response['items']
-                    results.extend(batch)
-                    offset += 100
-                    
-                    if progress_bar:
-                        progress = min(int(len(results) / total * 100), 100)
-                        progress_bar.progress(progress, text=f"Loading tracks... ({len(results)}/{total})")
-                    
-                    if len(batch) < 100:
-                        break
-                        
-            except Exception as e:
-                st.error(f"Failed to fetch playlist: {e}")
-                return []
-
-        # Filter out tracks without valid IDs
-        valid_results = []
-        for item in results:
-            if (item.get('track') and 
-                item['track'] and 
-                item['track'].get('id') and 
-                item['track'].get('name')):
-                valid_results.append(item)
-
-        return valid_results
-        
-    except Exception as e:
-        st.error(f"Error fetching music data: {e}")
-        return []
+    Genre statistics build up page by page while the fetch runs. If many
+    artists are still unresolved at the end, the genre list is estimated
+    from a sample and a genre_refine job is started to make it exact.
+    """
+    def on_progress(loaded, total):
+        job.report(0.8 * loaded / total if total else 0.8, f"Loading tracks... ({loaded}/{total})")
+
+    genre_stats = GenreStats()
+    # The resolver has its own token so sampling can stop it without stopping the job
+    resolver_cancel = CancelToken()
+    artist_queue, resolver = start_genre_resolver(genre_stats, sp, genre_cache, cancel=resolver_cancel)
+
+    def on_page(items):
+        artist_queue.put(genre_stats.add_tracks(items))
 
-def filter_by_audio_features(tracks, mood_params, sp, tolerance=0.3):
-    """Filter tracks based on audio features matching mood parameters."""
     try:
-        if not tracks:
-            return []
-            
-        track_ids = [t['track']['id'] for t in tracks if t.get('track', {}).get('id')]
-        
-        if not track_ids:
-            return []
+        try:
+            data = fetch_library(fetch_type, playlist_url, sp=sp, checkpoint=job.checkpoint,
+                                 on_progress=on_progress, on_page=on_page, cancel=job.cancel_token)
+        finally:
+            artist_queue.put(None)
+        modes = {}
+        preset_results = {}
+        mood_clusters = []
+        similarity_index = None
+        spotify_genres, genre_confidence, genre_job_id = [], None, None
+        if data:
+            job.report(0.8, "Calculating familiarity scores...")
+            add_familiarity_scores(data, sp, history_cache, modes)
+
+            # Load every track's audio features now so each preset's matches are ready instantly
+            job.report(0.9, "Analyzing audio features...")
+            load_audio_features(data, sp, feature_cache, cancel=job.cancel_token)
+            preset_results = precompute_presets(data, feature_cache)
+            mood_clusters = discover_mood_clusters(data, feature_cache)
+            similarity_index = build_similarity_index(data, feature_cache)
+
+            job.report(0.95, "Finishing genre analysis...")
+            if len(genre_stats.unresolved_artists()) > Config.GENRE_SAMPLE_SIZE:
+                # Too many artists left to wait for: estimate now, refine in the background
+                resolver_cancel.cancel("Switching to a sampled estimate")
+                resolver.join()
+                spotify_genres, genre_confidence = get_spotify_genres_from_tracks(
+                    data, sp, genre_cache, cancel=job.cancel_token, modes=modes, genre_stats=genre_stats,
+                    sample_size=Config.GENRE_SAMPLE_SIZE
+                )
+                genre_job_id = get_job_runner().submit(
+                    "genre_refine", refine_genres_job, genre_stats, sp, genre_cache, session_id=job.session_id
+                ).id
+            else:
+                resolver.join()
+                spotify_genres, _ = get_spotify_genres_from_tracks(
+                    data, sp, genre_cache, cancel=job.cancel_token, modes=modes, genre_stats=genre_stats
+                )
+    except BaseException:
+        resolver_cancel.cancel("Library load stopped")
+        raise
+    return {
+        "music_data": data,
+        "data_modes": modes,
+        "preset_results": preset_results,
+        "mood_clusters": mood_clusters,
+        "similarity_index": similarity_index,
+        "genre_stats": genre_stats,
+        "spotify_genres": spotify_genres,
+        "genre_confidence": genre_confidence,
+        "genre_job_id": genre_job_id,
+    }
 
-        filtered_tracks = []
+def load_audio_features(tracks, sp, feature_cache, indices=None, cancel=None):
+    """Make sure feature_cache (track id -> features) covers the tracks at indices.
+
+    Tracks are looked up in the offline feature store first (by id or ISRC);
+    the rest are fetched in batches of 100, coalesced with other sessions'
+    lookups. Returns the indices whose batch failed, so their features are
+    unknown.
+    """
+    if indices is None:
+        indices = range(len(tracks))
+    uncached = [
+        (i, tracks[i]['track']['id']) for i in indices
+        if tracks[i].get('track', {}).get('id') and tracks[i]['track']['id'] not in feature_cache
+    ]
+    unavailable = array('I')
+
+    # The offline dataset covers tracks the API may no longer serve
+    store = get_feature_store()
+    if store is not None and uncached:
+        try:
+            stored = store.lookup(
+                (track_id, (tracks[index]['track'].get('external_ids') or {}).get('isrc'))
+                for index, track_id in uncached
+            )
+        except Exception as e:
+            logger.warning(f"Feature store lookup failed: {e}")
+            stored = {}
+        feature_cache.update(stored)
+        uncached = [(index, track_id) for index, track_id in uncached if track_id not in stored]
+
+    # Batches of 100 (Spotify API limit), shared with any other session asking for the same tracks
+    results, errors = get_coalescer("audio_features").fetch(
+        [track_id for _, track_id in uncached], sp.audio_features, cancel=cancel
+    )
+    for track_id, features in results.items():
+        if features:
+            feature_cache[track_id] = {key: features.get(key) for key in STORED_FEATURES}
+
+    if errors:
+        error = next(iter(errors.values()))
+        if not isinstance(error, CircuitOpenError):
+            logger.warning(f"Failed to get audio features for {len(errors)} tracks: {error}")
+        unavailable.extend(index for index, track_id in uncached if track_id in errors)
+    return unavailable
+
+def filter_by_audio_features(tracks, mood_params, sp, tolerance=0.3, indices=None, feature_cache=None, modes=None,
+                             cancel=None):
+    """Return the indices (into tracks) of candidates whose audio features match the mood.
+
+    If feature_cache (track id -> features) is given, cached tracks skip the API
+    and newly fetched features are added to it. Tracks in the offline feature
+    store (matched by id or ISRC) also skip the API. When the audio-features
+    endpoint fails, only tracks with known features are matched
+    (modes['audio_features'] = "cached"); if no features are known at all the
+    mood filter is skipped ("skipped").
+    """
+    if indices is None:
+        indices = range(len(tracks))
+    if feature_cache is None:
+        feature_cache = {}
+    if modes is None:
+        modes = {}
+    modes['audio_features'] = MODE_LIVE
+    try:
+        candidates = [(i, tracks[i]['track']['id']) for i in indices if tracks[i].get('track', {}).get('id')]
         
-        # Process tracks in batches of 100 (Spotify API limit)
-        for i in range(0, len(track_ids), 100):
-            batch_ids = track_ids[i:i+100]
-            batch_tracks = tracks[i:i+100]
-            
-            try:
-                features_list = sp.audio_features(batch_ids)
-                
-                for track, features in zip(batch_tracks, features_list):
-                    if features and matches_mood(features, mood_params, tolerance):
-                        filtered_tracks.append(track)
-                        
-            except Exception as e:
-                logger.warning(f"Failed to get audio features for batch {i//100 + 1}: {e}")
-                # If audio features fail, include tracks anyway
-                filtered_tracks.extend(batch_tracks)
+        if not candidates:
+            return array('I')
+
+        unavailable = load_audio_features(tracks, sp, feature_cache, [index for index, _ in candidates], cancel)
+
+        matched = array('I')
+        known = 0
+        for index, track_id in candidates:
+            features = feature_cache.get(track_id)
+            if features is None:
+                continue
+            known += 1
+            if matches_mood(features, mood_params, tolerance):
+                matched.append(index)
+
+        if unavailable:
+            if known:
+                # Degraded: match on the features we do know, drop the rest
+                modes['audio_features'] = MODE_CACHED
+            else:
+                # Nothing to match against, so the mood filter can't be applied
+                modes['audio_features'] = MODE_SKIPPED
+                return array('I', sorted(matched + unavailable))
                 
-        return filtered_tracks
-        
+        return matched
+
+    except OperationCancelled:
+        raise
     except Exception as e:
         logger.error(f"Error filtering by audio features: {e}")
-        return tracks  # Return original tracks if filtering fails
+        modes['audio_features'] = MODE_SKIPPED
+        return array('I', indices)  # Keep every candidate if filtering fails
 
 def matches_mood(features, mood_params, tolerance=0.3):
     """Check if track's audio features match the desired mood."""
@@ -369,6 +896,352 @@ def matches_mood(features, mood_params, tolerance=0.3):
     except Exception:
         return True  # Include track if we can't determine fit
 
+def mood_distance(features, mood_params):
+    """Euclidean distance between a track's features and the target mood (None if unknown)."""
+    if not features:
+        return None
+    total = 0.0
+    for param, target_value in mood_params.items():
+        if features.get(param) is not None:
+            total += (features[param] - target_value) ** 2
+    return math.sqrt(total)
+
+def mood_matrix(music_data, track_features):
+    """(positions, matrix): indices of tracks with known features and their MOOD_FEATURES rows.
+
+    Unknown values are NaN.
+    """
+    positions = []
+    rows = []
+    row_of = itemgetter(*MOOD_FEATURES)
+    for i, item in enumerate(music_data):
+        features = track_features.get(item.get('track', {}).get('id'))
+        if features:
+            positions.append(i)
+            try:
+                rows.append(row_of(features))
+            except KeyError:
+                rows.append([features.get(f) for f in MOOD_FEATURES])
+    # None becomes NaN
+    return np.array(positions, dtype=np.int64), np.array(rows, dtype=float).reshape(len(rows), len(MOOD_FEATURES))
+
+def precompute_presets(music_data, track_features, presets=None, tolerance=0.3, chunk_size=50000):
+    """Rank the library's matches for every mood preset in one vectorized pass.
+
+    Known features form a (tracks x mood dimensions) matrix that is compared
+    with all preset target vectors at once, using the same rule as
+    matches_mood (unknown values never rule a track out). Returns
+    {preset name: array of indices into music_data, closest match first}.
+    """
+    if presets is None:
+        presets = MOOD_PRESETS
+    names = list(presets)
+    targets = np.array([[presets[name].get(f, np.nan) for f in MOOD_FEATURES] for name in names], dtype=float)
+
+    positions, matrix = mood_matrix(music_data, track_features)
+    if not len(matrix):
+        return {name: array('I') for name in names}
+
+    hits = [[] for _ in names]
+    distances = [[] for _ in names]
+    # Chunked so a million-track library doesn't need a presets x tracks x dimensions array at once
+    for start in range(0, len(matrix), chunk_size):
+        diff = np.abs(matrix[start:start + chunk_size][None, :, :] - targets[:, None, :])
+        within = np.all((diff <= tolerance) | np.isnan(diff), axis=2)
+        distance = np.sqrt(np.nansum(diff ** 2, axis=2))
+        for p in range(len(names)):
+            matched = np.nonzero(within[p])[0]
+            hits[p].append(matched + start)
+            distances[p].append(distance[p, matched])
+
+    results = {}
+    for p, name in enumerate(names):
+        matched = np.concatenate(hits[p])
+        order = matched[np.argsort(np.concatenate(distances[p]), kind="stable")]
+        results[name] = array('I', positions[order].tolist())
+    return results
+
+def discover_mood_clusters(music_data, track_features, k=None):
+    """Group the library into k moods with k-means over the audio-feature matrix.
+
+    Returns a list of clusters, largest first, each a dict with a name,
+    its centroid (a mood dict like MOOD_PRESETS), size and indices (into
+    music_data, closest to the centroid first). Large libraries use
+    mini-batch k-means.
+    """
+    if k is None:
+        k = Config.MOOD_CLUSTERS
+    positions, matrix = mood_matrix(music_data, track_features)
+    if len(matrix) < 2 * k:
+        return []
+    # Unknown values count as the library average on that dimension
+    average = np.array([np.nanmean(column) if not np.isnan(column).all() else 0.5 for column in matrix.T])
+    matrix = np.where(np.isnan(matrix), average, matrix)
+    batch_size = Config.MOOD_CLUSTER_BATCH_SIZE if len(matrix) > 4 * Config.MOOD_CLUSTER_BATCH_SIZE else None
+    centroids, labels = kmeans(matrix, k, batch_size=batch_size)
+
+    clusters = []
+    names = Counter()
+    for c, centroid in enumerate(centroids):
+        members = np.nonzero(labels == c)[0]
+        if not len(members):
+            continue
+        distance = np.sqrt(((matrix[members] - centroid) ** 2).sum(axis=1))
+        name = name_cluster(centroid, average, MOOD_FEATURES)
+        names[name] += 1
+        clusters.append({
+            "name": name if names[name] == 1 else f"{name} {names[name]}",
+            "centroid": {f: round(float(v), 2) for f, v in zip(MOOD_FEATURES, centroid)},
+            "size": len(members),
+            "indices": array('I', positions[members[np.argsort(distance, kind="stable")]].tolist()),
+        })
+    clusters.sort(key=lambda cluster: cluster["size"], reverse=True)
+    return clusters
+
+def build_similarity_index(music_data, track_features):
+    """Index every track with known features for "more like this" queries (None if too few)."""
+    positions, matrix = mood_matrix(music_data, track_features)
+    if len(matrix) < 2:
+        return None
+    average = np.array([np.nanmean(column) if not np.isnan(column).all() else 0.5 for column in matrix.T])
+    return SimilarityIndex(positions, np.where(np.isnan(matrix), average, matrix))
+
+def find_similar_tracks(music_data, index, track_index, genre_cache=None, k=10):
+    """The k tracks most like music_data[track_index] by mood features and shared genres.
+
+    Returns [(music_data index, feature distance, shared genres)], or [] if
+    the track has no features. Needs no API calls: genres come from
+    genre_cache as far as they are known.
+    """
+    if index is None or track_index not in index:
+        return []
+    if genre_cache is None:
+        genre_cache = {}
+
+    def genres_of(i):
+        return {genre for artist in music_data[i]['track']['artists'] for genre in genre_cache.get(artist['id'], ())}
+
+    return index.query(track_index, k=k, genres_of=genres_of)
+
+def sort_candidates(music_data, indices, sort_by, mood_params, track_features):
+    """Order candidate indices by mood distance, familiarity or artist name."""
+    if sort_by == "Familiarity":
+        key = lambda i: -music_data[i].get('familiarity_score', 0)
+    elif sort_by == "Artist":
+        key = lambda i: (music_data[i]['track']['artists'][0]['name'].lower()
+                         if music_data[i]['track']['artists'] else "")
+    else:
+        def key(i):
+            distance = mood_distance(track_features.get(music_data[i]['track']['id']), mood_params)
+            # Tracks without features sort last
+            return (distance is None, distance or 0.0)
+    return array('I', sorted(indices, key=key))
+
+def mood_distances(music_data, indices, mood_params, track_features):
+    """Vectorized mood_distance for each of indices; tracks without features get inf."""
+    row_of = itemgetter(*MOOD_FEATURES)
+    unknown = (math.nan,) * len(MOOD_FEATURES)
+    rows = []
+    for features in map(track_features.get, [music_data[i]['track']['id'] for i in indices]):
+        if not features:
+            rows.append(unknown)
+            continue
+        try:
+            rows.append(row_of(features))
+        except KeyError:
+            rows.append([features.get(f) for f in MOOD_FEATURES])
+    if not rows:
+        return np.zeros(0)
+    matrix = np.array(rows, dtype=float)
+    known = ~np.all(np.isnan(matrix), axis=1)
+    target = np.array([mood_params.get(f, np.nan) for f in MOOD_FEATURES], dtype=float)
+    distances = np.sqrt(np.nansum((matrix - target) ** 2, axis=1))
+    distances[~known] = np.inf
+    return distances
+
+def choose_playlist_tracks(music_data, indices, num_songs, mood_params, track_features, genre_cache=None,
+                           max_per_artist=None, max_per_album=None, max_genre_share=None):
+    """The num_songs closest mood matches among indices, capped per artist, album and genre.
+
+    Caps default to Config; genres come from genre_cache (artist id ->
+    genres), so artists not looked up yet don't count towards a genre cap.
+    Returns indices into music_data, closest match first.
+    """
+    if max_per_artist is None:
+        max_per_artist = Config.MAX_TRACKS_PER_ARTIST
+    if max_per_album is None:
+        max_per_album = Config.MAX_TRACKS_PER_ALBUM
+    if max_genre_share is None:
+        max_genre_share = Config.MAX_GENRE_SHARE
+    if genre_cache is None:
+        genre_cache = {}
+    tracks = [music_data[i]['track'] for i in indices]
+
+    def artists_of(p):
+        return [artist['id'] for artist in tracks[p]['artists'] if artist.get('id')]
+
+    def album_of(p):
+        return (tracks[p].get('album') or {}).get('id')
+
+    def genres_of(p):
+        return {genre for artist_id in artists_of(p) for genre in genre_cache.get(artist_id, ())}
+
+    scores = mood_distances(music_data, indices, mood_params, track_features).tolist()
+    chosen = select_diverse(scores, num_songs, artists_of, album_of, genres_of,
+                            max_per_artist=max_per_artist, max_per_album=max_per_album,
+                            max_genre_share=max_genre_share)
+    return array('I', [indices[p] for p in chosen])
+
+def order_playlist_tracks(music_data, chosen, track_features, order="smooth"):
+    """Play order for the chosen indices: an arc from PLAYLIST_ORDERS, "best" (as given) or "shuffle".
+
+    Arcs sequence tracks by energy, valence and tempo (scaled to about 0-1);
+    unknown values count as the playlist's average.
+    """
+    chosen = list(chosen)
+    if order == "best" or len(chosen) < 2:
+        return chosen
+    if order == "shuffle":
+        random.shuffle(chosen)
+        return chosen
+    vectors = np.array([
+        [(track_features.get(music_data[i]['track']['id']) or {}).get(f) for f in ("energy", "valence", "tempo")]
+        for i in chosen
+    ], dtype=float)
+    vectors[:, 2] = np.clip((vectors[:, 2] - 60.0) / 120.0, 0.0, 1.0)
+    means = [0.5 if np.isnan(column).all() else np.nanmean(column) for column in vectors.T]
+    vectors = np.where(np.isnan(vectors), means, vectors)
+    return [chosen[p] for p in sequence_tracks(vectors, order)]
+
+def add_familiarity_scores(tracks, sp, history_cache=None, modes=None):
+    """Annotate each track item with its familiarity_score."""
+    track_ids = [track['track']['id'] for track in tracks if track.get('track', {}).get('id')]
+    familiarity_scores = calculate_real_familiarity_batch(track_ids, sp, history_cache, modes)
+
+    for track in tracks:
+        track_id = track.get('track', {}).get('id')
+        if track_id:
+            track['familiarity_score'] = familiarity_scores.get(track_id, 0)
+    return tracks
+
+def filter_by_genres(library, indices, selected_genres, sp, genre_cache=None, modes=None, cancel=None):
+    """Narrow indices to tracks whose artists match any selected genre (unchanged if none match)."""
+    genre_filtered = array('I')
+    wanted = {genre.lower() for genre in selected_genres}
+
+    # Get genres for filtering
+    artist_ids = set()
+    for item in library:
+        if 'track' in item and item['track'] and 'artists' in item['track']:
+            for artist in item['track']['artists']:
+                if artist.get('id'):
+                    artist_ids.add(artist['id'])
+
+    # Fetch artist genres in batches
+    artist_genres = fetch_artist_genres(artist_ids, sp, genre_cache, modes, cancel)
+
+    # Filter tracks by genre
+    for index in indices:
+        track = library[index]
+        if 'track' in track and track['track'] and 'artists' in track['track']:
+            track_artist_ids = [artist['id'] for artist in track['track']['artists'] if artist.get('id')]
+            track_genres = set()
+            for artist_id in track_artist_ids:
+                track_genres.update(genre.lower() for genre in artist_genres.get(artist_id, []))
+            
+            # Check if any selected genre matches track genres
+            if not wanted.isdisjoint(track_genres):
+                genre_filtered.append(index)
+    
+    return genre_filtered if genre_filtered else indices
+
+def apply_mood_filters(music_data, selected_genres, mood_params, familiarity, sp, feature_cache=None, modes=None,
+                       genre_cache=None, stage_cache=None, library_version=None, cancel=None):
+    """Run the familiarity, genre and audio feature filters over the library.
+
+    Every stage narrows an array of indices into music_data, so no track lists
+    are copied; pages materialize only the tracks they display or write.
+
+    With a stage_cache, each stage's output is memoized under (library_version,
+    its settings and those of the stages before it), so changing only a mood
+    slider reuses the familiarity and genre results. Degraded results are
+    never memoized, so they are retried on the next Apply. A cancelled cancel
+    token stops the remaining batches and raises OperationCancelled.
+    """
+    if modes is None:
+        modes = {}
+    if stage_cache is None:
+        stage_cache = StageCache()
+
+    # Filter by familiarity (scores are all unknown if the history couldn't be loaded)
+    familiarity_threshold = familiarity if modes.get('familiarity') != MODE_SKIPPED else 0
+    familiarity_key = (library_version, familiarity_threshold)
+    indices = stage_cache.get("familiarity", familiarity_key)
+    if indices is None:
+        indices = array('I', (
+            i for i, track in enumerate(music_data)
+            if track.get('familiarity_score', 0) >= familiarity_threshold
+        ))
+        stage_cache.put("familiarity", familiarity_key, indices)
+    
+    # Filter by genres if any selected
+    genre_key = (familiarity_key, tuple(sorted(genre.lower() for genre in selected_genres)))
+    cached = stage_cache.get("genres", genre_key)
+    modes['genres'] = MODE_LIVE
+    if cached is not None:
+        indices = cached
+    else:
+        if selected_genres:
+            indices = filter_by_genres(music_data, indices, selected_genres, sp, genre_cache, modes, cancel)
+        if modes['genres'] == MODE_LIVE:
+            stage_cache.put("genres", genre_key, indices)
+
+    # Filter by audio features/mood
+    mood_key = (genre_key, tuple(sorted(mood_params.items())))
+    cached = stage_cache.get("mood", mood_key)
+    if cached is not None:
+        modes['audio_features'] = MODE_LIVE
+        return cached
+    matched = filter_by_audio_features(
+        music_data, mood_params, sp, indices=indices, feature_cache=feature_cache, modes=modes, cancel=cancel
+    )
+    if modes['audio_features'] == MODE_LIVE:
+        stage_cache.put("mood", mood_key, matched)
+    return matched
+
+def create_playlist(sp, playlist_name, track_ids, public=False, progress_bar=None, cancel=None):
+    """Create a playlist for the current user and add the tracks in batches of 100.
+
+    If cancel is cancelled part way, the half-written playlist is removed
+    and OperationCancelled is raised.
+    """
+    user_id = sp.current_user()['id']
+    
+    # Create the playlist
+    new_playlist = sp.user_playlist_create(
+        user_id, 
+        playlist_name, 
+        public=public,
+        description=f"Created with EchoMood - A playlist matching your current vibe"
+    )
+    playlist_id = new_playlist['id']
+
+    for i in range(0, len(track_ids), 100):
+        if cancel is not None and cancel.cancelled:
+            try:
+                sp.current_user_unfollow_playlist(playlist_id)
+            except Exception as e:
+                logger.warning(f"Could not remove cancelled playlist {playlist_id}: {e}")
+            cancel.raise_if_cancelled()
+        batch = track_ids[i:i + 100]
+        sp.playlist_add_items(playlist_id, batch)
+        
+        if progress_bar:
+            progress = int((i + len(batch)) / len(track_ids) * 100)
+            progress_bar.progress(progress, text=f"Added {i + len(batch)}/{len(track_ids)} tracks...")
+
+    return new_playlist
+
 def validate_playlist_url(url):
     """Validate Spotify playlist URL."""
     if not url:
@@ -395,13 +1268,25 @@ def render_fetch_music_page():
         with col2:
             if st.button("🚪 Logout", key="logout_main"):
                 clear_spotify_cache()
+                # The session id stays: the session manager still tracks this session under it
                 for key in list(st.session_state.keys()):
-                    del st.session_state[key]
+                    if key != 'session_id':
+                        del st.session_state[key]
                 st.query_params.clear()
                 st.rerun()
     except:
         # This will trigger the authentication flow in get_spotify_client()
         return
+
+    # A load started earlier in this session is still running, or needs attention
+    if st.session_state.load_job_id:
+        job = get_job_runner().get(st.session_state.load_job_id)
+        if job is None:
+            st.session_state.load_job_id = None
+        else:
+            render_load_job(job)
+            if st.session_state.load_job_id:
+                return
     
     # Music source selection
     st.markdown("### 📀 Select Music Source")
@@ -434,45 +1319,130 @@ def render_fetch_music_page():
             if fetch_choice == "Specific Playlist" and not playlist_url:
                 st.error("Please enter a playlist URL first!")
                 return
-                
-            with st.spinner('🎶 Fetching your music... This may take a moment!'):
-                progress_bar = st.progress(0, text="Initializing...")
-                
-                # Fetch the data
-                if fetch_choice == "Liked Songs":
-                    data = get_spotify_data("Liked Songs", progress_bar=progress_bar)
-                else:
-                    data = get_spotify_data("Playlist", playlist_url, progress_bar=progress_bar)
 
-                if not data:
-                    st.error("No music data could be fetched. Please try again.")
-                    return
+            # Load in the background so a slow or failing fetch never blocks or loses the page
+            st.session_state.load_request = {
+                "fetch_type": "Liked Songs" if fetch_choice == "Liked Songs" else "Playlist",
+                "playlist_url": playlist_url,
+            }
+            start_library_load()
+            st.rerun()
 
-                progress_bar.progress(80, text="Calculating familiarity scores...")
-                
-                sp = get_spotify_client()
-                
-                # Get all track IDs at once
-                track_ids = [track['track']['id'] for track in data if track.get('track', {}).get('id')]
-                
-                # Calculate familiarity scores in batch
-                familiarity_scores = calculate_real_familiarity_batch(track_ids, sp)
-                
-                # Assign scores to tracks
-                for track in data:
-                    track_id = track.get('track', {}).get('id')
-                    if track_id:
-                        track['familiarity_score'] = familiarity_scores.get(track_id, 0)
+def start_library_load(checkpoint=None):
+    """Start (or resume from a checkpoint) the background load for this session's load_request."""
+    # A new load supersedes any load this session still has running
+    for job_id in (st.session_state.load_job_id, st.session_state.genre_job_id):
+        previous = get_job_runner().get(job_id) if job_id else None
+        if previous is not None and not previous.done:
+            previous.cancel("Superseded by a new load")
+    st.session_state.genre_job_id = None
+    request = st.session_state.load_request
+    job = get_job_runner().submit(
+        "library_load", load_library_job,
+        request["fetch_type"], request["playlist_url"], get_spotify_client(),
+        st.session_state.listening_history, st.session_state.track_features, st.session_state.artist_genres,
+        session_id=st.session_state.session_id, checkpoint=checkpoint
+    )
+    st.session_state.load_job_id = job.id
+
+def render_load_job(job):
+    """Show a library load's progress, hand over its result, or offer to resume it."""
+    if job.status == DONE:
+        result = job.result
+        # The session holds the library from here on, so the job record doesn't have to
+        job.release()
+        st.session_state.load_job_id = None
+        if not result["music_data"]:
+            if st.session_state.load_request["fetch_type"] == "Liked Songs":
+                st.warning("No liked songs found. Please like some songs on Spotify first!")
+            else:
+                st.warning("This playlist is empty!")
+            return
+
+        # Store data and move to next page; stage results for the old library no longer apply
+        st.session_state.music_data = result["music_data"]
+        st.session_state.data_modes = result["data_modes"]
+        # Apply changes data_modes in place; precomputed results go back to these
+        st.session_state.load_data_modes = dict(result["data_modes"])
+        st.session_state.preset_results = result["preset_results"]
+        st.session_state.mood_clusters = result["mood_clusters"]
+        st.session_state.similarity_index = result["similarity_index"]
+        st.session_state.genre_stats = result["genre_stats"]
+        st.session_state.spotify_genres = result["spotify_genres"]
+        st.session_state.genre_confidence = result["genre_confidence"]
+        st.session_state.genre_job_id = result["genre_job_id"]
+        st.session_state.library_version += 1
+        st.session_state.stage_cache.clear()
+        st.session_state.page = 'mood_and_genre'
+        st.rerun()
 
-                progress_bar.progress(100, text="Complete!")
-                
-                # Store data and move to next page
-                st.session_state.music_data = data
-                st.session_state.page = 'mood_and_genre'
-                
-                st.success(f"✅ Successfully loaded {len(data)} tracks!")
-                time.sleep(1)
+    if job.status in (FAILED, CANCELLED):
+        loaded = sum(len(page) for page in job.checkpoint.get('pages', {}).values())
+        total = job.checkpoint.get('total')
+        if job.status == CANCELLED:
+            st.warning("⏹️ Loading was stopped.")
+        else:
+            st.error(f"Loading stopped: {job.error}")
+        if loaded:
+            st.info(f"{loaded} of {total} tracks were loaded and will be kept if you resume.")
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("🔁 Resume Loading", type="primary", use_container_width=True):
+                start_library_load(checkpoint=job.checkpoint)
+                job.release()
+                st.rerun()
+        with col2:
+            if st.button("✖️ Cancel", use_container_width=True):
+                job.release()
+                st.session_state.load_job_id = None
                 st.rerun()
+        return
+
+    render_load_progress(job.id)
+
+@st.fragment(run_every=1.0)
+def render_load_progress(job_id):
+    """Poll a running load once a second without rerunning the whole page."""
+    job = get_job_runner().get(job_id)
+    if job is None or job.done:
+        st.rerun()
+    status = job.snapshot()
+    st.progress(status["progress"], text=f"🎶 {status['message']}")
+    if st.button("⏹️ Stop Loading", key="stop_load"):
+        job.cancel("Stopped by user")
+        st.rerun()
+
+@st.fragment(run_every=1.0)
+def render_genre_refinement(job_id):
+    """While genres are estimated from a sample, show the estimate's confidence and swap in exact counts when ready."""
+    job = get_job_runner().get(job_id)
+    if job is None or job.done:
+        st.session_state.genre_job_id = None
+        if job is not None and job.status == DONE:
+            st.session_state.spotify_genres = job.result["spotify_genres"]
+            st.session_state.data_modes.update(job.result["data_modes"])
+            st.session_state.load_data_modes.update(job.result["data_modes"])
+            st.session_state.genre_confidence = None
+            job.release()
+        st.rerun()
+    status = job.snapshot()
+    st.caption(
+        f"🧪 Genres estimated from a sample of your artists "
+        f"({st.session_state.genre_confidence:.0%} confident in the top {len(st.session_state.spotify_genres)}). "
+        f"{status['message']}"
+    )
+
+def open_precomputed_results(mood, indices):
+    """Go straight to the playlist page with results computed at load time, skipping Apply."""
+    st.session_state.selected_genres = []
+    st.session_state.selected_mood = dict(mood)
+    st.session_state.filtered_indices = indices
+    # They were computed at load time, so an earlier Apply's cached/skipped notes don't apply
+    st.session_state.data_modes = dict(st.session_state.load_data_modes)
+    st.session_state.filter_version += 1
+    st.session_state.candidate_order = None
+    st.session_state.page = "playlist_details"
+    st.rerun()
 
 def render_mood_selection_page():
     """Render the mood and genre selection page."""
@@ -482,11 +1452,44 @@ def render_mood_selection_page():
     if not st.session_state.spotify_genres:
         with st.spinner("🔍 Analyzing genres in your music..."):
             sp = get_spotify_client()
-            st.session_state.spotify_genres = get_spotify_genres_from_tracks(
-                st.session_state.music_data, sp
-            )
+            try:
+                st.session_state.spotify_genres, _ = get_spotify_genres_from_tracks(
+                    st.session_state.music_data, sp, st.session_state.artist_genres,
+                    cancel=st.session_state.run_cancel
+                )
+            except OperationCancelled:
+                # A newer run of this page has taken over
+                return
 
     spotify_genres = st.session_state.spotify_genres
+    if st.session_state.genre_job_id:
+        render_genre_refinement(st.session_state.genre_job_id)
+
+    preset_results = st.session_state.preset_results
+    if preset_results:
+        st.subheader("⚡ Quick Presets")
+        columns = st.columns(len(preset_results))
+        for column, (preset, indices) in zip(columns, preset_results.items()):
+            with column:
+                if st.button(f"{preset} ({len(indices)})", key=f"preset_{preset}",
+                             disabled=not indices, use_container_width=True):
+                    open_precomputed_results(MOOD_PRESETS[preset], indices)
+
+    mood_clusters = st.session_state.mood_clusters
+    if mood_clusters:
+        st.subheader("🧭 Moods in Your Library")
+        music_data = st.session_state.music_data
+        columns = st.columns(3)
+        for n, cluster in enumerate(mood_clusters):
+            with columns[n % 3]:
+                centroid = ", ".join(f"{f} {v:.2f}" for f, v in cluster["centroid"].items())
+                if st.button(f"{cluster['name']} ({cluster['size']})", key=f"cluster_{n}",
+                             help=centroid, use_container_width=True):
+                    open_precomputed_results(cluster["centroid"], cluster["indices"])
+                samples = [music_data[i]['track'] for i in cluster["indices"][:2]]
+                st.caption("e.g. " + "; ".join(
+                    f"{t['name']} – {t['artists'][0]['name'] if t['artists'] else 'Unknown'}" for t in samples
+                ))
 
     if not spotify_genres:
         st.warning("⚠️ Couldn't detect genres from your music. You can still create a playlist based on mood!")
@@ -496,11 +1499,18 @@ def render_mood_selection_page():
         col1, col2 = st.columns([3, 1])
         
         with col1:
+            if "genre_picker" in st.session_state:
+                # Keep the user's picks when the options change (e.g. refined genres replace the estimate)
+                st.session_state.genre_picker = [g for g in st.session_state.genre_picker if g in spotify_genres]
+                default_genres = None
+            else:
+                default_genres = [g for g in ["pop", "rock", "indie", "electronic", "hip hop"] 
+                                  if g in spotify_genres][:3]
             selected_genres = st.multiselect(
                 "Pick genres that match your current vibe:",
                 spotify_genres,
-                default=[g for g in ["pop", "rock", "indie", "electronic", "hip hop"] 
-                        if g in spotify_genres][:3],
+                default=default_genres,
+                key="genre_picker",
                 help="Select the genres you're in the mood for right now"
             )
         
@@ -570,71 +1580,36 @@ def render_mood_selection_page():
             }
             st.session_state.selected_familiarity = familiarity
 
+            # Clicking anything, this button included, starts a new run that cancels this one's batches
+            st.button("⏹️ Cancel", key="cancel_apply")
+
             # Filter music based on selections
             with st.spinner("🎯 Filtering tracks to match your mood..."):
                 sp = get_spotify_client()
                 
-                # Start with all tracks
-                filtered_tracks = st.session_state.music_data.copy()
-                
-                # Filter by familiarity
-                familiarity_threshold = familiarity
-                filtered_tracks = [
-                    track for track in filtered_tracks 
-                    if track.get('familiarity_score', 0) >= familiarity_threshold
-                ]
-                
-                # Filter by genres if any selected
-                if selected_genres:
-                    genre_filtered = []
-                    track_genres_map = {}
-                    
-                    # Get genres for filtering
-                    artist_ids = set()
-                    for item in st.session_state.music_data:
-                        if 'track' in item and item['track'] and 'artists' in item['track']:
-                            for artist in item['track']['artists']:
-                                if artist.get('id'):
-                                    artist_ids.add(artist['id'])
-
-                    # Fetch artist genres in batches
-                    artist_genres = {}
-                    artist_ids = list(artist_ids)
-                    
-                    for i in range(0, len(artist_ids), 50):
-                        batch = artist_ids[i:i+50]
-                        try:
-                            results = sp.artists(batch)
-                            for artist in results['artists']:
-                                if artist:
-                                    artist_genres[artist['id']] = artist.get('genres', [])
-                        except Exception as e:
-                            logger.warning(f"Failed to fetch artist genres: {e}")
-                            continue
-
-                    # Filter tracks by genre
-                    for track in filtered_tracks:
-                        if 'track' in track and track['track'] and 'artists' in track['track']:
-                            track_artist_ids = [artist['id'] for artist in track['track']['artists'] if artist.get('id')]
-                            track_genres = set()
-                            for artist_id in track_artist_ids:
-                                track_genres.update(artist_genres.get(artist_id, []))
-                            
-                            # Check if any selected genre matches track genres
-                            if any(genre.lower() in [tg.lower() for tg in track_genres] for genre in selected_genres):
-                                genre_filtered.append(track)
-                    
-                    filtered_tracks = genre_filtered if genre_filtered else filtered_tracks
-
-                # Filter by audio features/mood
-                filtered_tracks = filter_by_audio_features(
-                    filtered_tracks, st.session_state.selected_mood, sp
-                )
+                try:
+                    filtered_indices = apply_mood_filters(
+                        st.session_state.music_data,
+                        selected_genres,
+                        st.session_state.selected_mood,
+                        familiarity,
+                        sp,
+                        feature_cache=st.session_state.track_features,
+                        modes=st.session_state.data_modes,
+                        genre_cache=st.session_state.artist_genres,
+                        stage_cache=st.session_state.stage_cache,
+                        library_version=st.session_state.library_version,
+                        cancel=st.session_state.run_cancel
+                    )
+                except OperationCancelled:
+                    return
 
-                st.session_state.filtered_music_data = filtered_tracks
+                st.session_state.filtered_indices = filtered_indices
+                st.session_state.filter_version += 1
+                st.session_state.candidate_order = None
 
-            if filtered_tracks:
-                st.success(f"🎯 Found {len(filtered_tracks)} tracks matching your criteria!")
+            if filtered_indices:
+                st.success(f"🎯 Found {len(filtered_indices)} tracks matching your criteria!")
                 st.session_state.page = "playlist_details"
                 st.rerun()
             else:
@@ -644,9 +1619,10 @@ def render_playlist_details_page():
     """Render the playlist creation page."""
     st.header("🎶 Create Your Playlist")
     
-    filtered_data = st.session_state.filtered_music_data
+    music_data = st.session_state.music_data
+    filtered_indices = st.session_state.filtered_indices
     
-    if not filtered_data:
+    if not filtered_indices:
         st.warning("No tracks found matching your criteria.")
         if st.button("← Go Back to Mood Selection"):
             st.session_state.page = "mood_and_genre"
@@ -666,20 +1642,46 @@ def render_playlist_details_page():
     with col2:
         num_songs = st.slider(
             "Number of Songs", 
-            1, min(len(filtered_data), 50), 
-            min(20, len(filtered_data)),
-            help=f"Choose up to {min(len(filtered_data), 50)} songs"
+            1, min(len(filtered_indices), 50), 
+            min(20, len(filtered_indices)),
+            help=f"Choose up to {min(len(filtered_indices), 50)} songs"
         )
 
     # Advanced options
     with st.expander("⚙️ Advanced Options"):
-        shuffle_enabled = st.checkbox("Shuffle playlist order", value=True)
+        order_choice = st.selectbox("Playlist order", list(PLAYLIST_ORDERS),
+                                    help="Smooth orders keep energy, mood and tempo from jumping between songs")
         make_public = st.checkbox("Make playlist public", value=False)
-
-    # Preview some tracks
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            max_per_artist = st.number_input("Max songs per artist", 1, 50, Config.MAX_TRACKS_PER_ARTIST)
+        with col2:
+            max_per_album = st.number_input("Max songs per album", 1, 50, Config.MAX_TRACKS_PER_ALBUM)
+        with col3:
+            max_genre_share = st.slider("Max share of one genre", 0.1, 1.0, Config.MAX_GENRE_SHARE, 0.05)
+
+    # Best mood matches under the diversity caps, picked and ordered once per Apply and settings
+    selection_key = (st.session_state.filter_version, num_songs, max_per_artist, max_per_album, max_genre_share)
+    order = PLAYLIST_ORDERS[order_choice]
+    cached = st.session_state.playlist_selection
+    if cached is None or cached[0] != selection_key:
+        chosen = choose_playlist_tracks(
+            music_data, filtered_indices, num_songs, st.session_state.selected_mood,
+            st.session_state.track_features, st.session_state.artist_genres,
+            max_per_artist=max_per_artist, max_per_album=max_per_album, max_genre_share=max_genre_share
+        )
+        cached = (selection_key, chosen, None, None)
+    if cached[2] != order:
+        cached = cached[:2] + (order, order_playlist_tracks(music_data, cached[1], st.session_state.track_features,
+                                                             order))
+    st.session_state.playlist_selection = cached
+    chosen = cached[3]
+
+    # Preview the opening tracks
     st.subheader("🎵 Track Preview")
-    preview_count = min(5, len(filtered_data))
-    preview_tracks = random.sample(filtered_data, preview_count) if shuffle_enabled else filtered_data[:preview_count]
+    preview_count = min(5, len(chosen))
+    preview_indices = chosen[:preview_count]
+    preview_tracks = [music_data[i] for i in preview_indices]
     
     for i, track in enumerate(preview_tracks):
         track_info = track['track']
@@ -694,8 +1696,13 @@ def render_playlist_details_page():
         with col3:
             st.write(f"Familiarity: {familiarity}%")
 
-    if preview_count < len(filtered_data):
-        st.write(f"... and {len(filtered_data) - preview_count} more tracks")
+    if preview_count < len(chosen):
+        st.write(f"... and {len(chosen) - preview_count} more of your {len(chosen)} songs "
+                 f"(picked from {len(filtered_indices)} matches)")
+
+    render_data_modes(st.session_state.data_modes)
+    render_candidates_table(music_data, filtered_indices)
+    render_similar_tracks(music_data, chosen)
 
     # Create playlist button
     st.markdown("<br>", unsafe_allow_html=True)
@@ -709,39 +1716,17 @@ def render_playlist_details_page():
             try:
                 with st.spinner("🎵 Creating your playlist..."):
                     sp = get_spotify_client()
-                    user_id = sp.current_user()['id']
                     
-                    # Create the playlist
-                    new_playlist = sp.user_playlist_create(
-                        user_id, 
-                        playlist_name.strip(), 
-                        public=make_public,
-                        description=f"Created with EchoMood - A playlist matching your current vibe"
-                    )
-                    playlist_id = new_playlist['id']
-                    
-                    # Prepare track IDs
-                    track_ids = [
-                        track['track']['id'] 
-                        for track in filtered_data 
-                        if track.get('track', {}).get('id')
-                    ]
-
-                    if shuffle_enabled:
-                        random.shuffle(track_ids)
-
-                    # Limit to requested number of songs
-                    track_ids = track_ids[:num_songs]
+                    # Already in play order; materialize only their IDs
+                    track_ids = [music_data[i]['track']['id'] for i in chosen]
 
                     # Add tracks in batches of 100
                     progress_bar = st.progress(0, text="Adding tracks to playlist...")
-                    
-                    for i in range(0, len(track_ids), 100):
-                        batch = track_ids[i:i + 100]
-                        sp.playlist_add_items(playlist_id, batch)
-                        
-                        progress = int((i + len(batch)) / len(track_ids) * 100)
-                        progress_bar.progress(progress, text=f"Added {i + len(batch)}/{len(track_ids)} tracks...")
+                    new_playlist = create_playlist(
+                        sp, playlist_name.strip(), track_ids,
+                        public=make_public, progress_bar=progress_bar,
+                        cancel=st.session_state.run_cancel
+                    )
 
                     progress_bar.progress(100, text="Playlist created successfully!")
 
@@ -762,10 +1747,96 @@ def render_playlist_details_page():
                     st.session_state.playlist_name = playlist_name
                     st.session_state.page = "playlist_created"
 
+            except OperationCancelled:
+                return
             except Exception as e:
                 st.error(f"Failed to create playlist: {e}")
                 logger.error(f"Playlist creation error: {e}")
 
+def render_data_modes(modes):
+    """Tell the user when results came from a degraded mode."""
+    if modes.get('audio_features') == MODE_CACHED:
+        st.info("⚠️ Spotify's audio features are unavailable right now, "
+                "so only tracks with previously loaded features were matched to your mood.")
+    elif modes.get('audio_features') == MODE_SKIPPED:
+        st.warning("⚠️ Spotify's audio features are unavailable right now, "
+                   "so these tracks were not filtered by mood.")
+    if modes.get('genres') in (MODE_CACHED, MODE_SKIPPED):
+        st.info("⚠️ Some artists' genres couldn't be loaded, so the genre filter may have missed tracks.")
+    if modes.get('familiarity') == MODE_CACHED:
+        st.info("ℹ️ Familiarity is based on your last loaded listening history.")
+    elif modes.get('familiarity') == MODE_SKIPPED:
+        st.warning("⚠️ Your listening history couldn't be loaded, so familiarity was not applied.")
+
+def render_candidates_table(music_data, filtered_indices):
+    """Render one page of the full candidate list in a single sortable table."""
+    with st.expander(f"📋 All {len(filtered_indices)} Candidate Tracks", expanded=False):
+        col1, col2, col3 = st.columns([2, 1, 1])
+        with col1:
+            sort_by = st.selectbox("Sort by", ["Mood match", "Familiarity", "Artist"], key="candidates_sort")
+        with col2:
+            page_size = st.selectbox("Rows per page", Config.RESULTS_PAGE_SIZES, index=1, key="candidates_page_size")
+        total_pages = max(1, math.ceil(len(filtered_indices) / page_size))
+        with col3:
+            page = st.number_input("Page", 1, total_pages, 1, key="candidates_page")
+
+        # Sort once per Apply and sort key; paging just slices the cached order
+        order_key = (st.session_state.filter_version, sort_by)
+        cached = st.session_state.candidate_order
+        if cached is None or cached[0] != order_key:
+            order = sort_candidates(
+                music_data, filtered_indices, sort_by,
+                st.session_state.selected_mood, st.session_state.track_features
+            )
+            st.session_state.candidate_order = (order_key, order)
+        else:
+            order = cached[1]
+
+        start = (page - 1) * page_size
+        rows = []
+        for rank, i in enumerate(order[start:start + page_size], start=start + 1):
+            track_info = music_data[i]['track']
+            distance = mood_distance(
+                st.session_state.track_features.get(track_info['id']), st.session_state.selected_mood
+            )
+            rows.append({
+                "#": rank,
+                "Track": track_info['name'],
+                "Artists": ", ".join(artist['name'] for artist in track_info['artists']),
+                "Familiarity": music_data[i].get('familiarity_score', 0),
+                "Mood distance": round(distance, 3) if distance is not None else None,
+            })
+
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+        st.caption(f"Page {page} of {total_pages}")
+
+def render_similar_tracks(music_data, chosen):
+    """Let the user pick one of the playlist's tracks and see the library's closest matches to it."""
+    index = st.session_state.similarity_index
+    if index is None:
+        return
+    with st.expander("🔎 More Like This", expanded=False):
+        labels = {i: f"{music_data[i]['track']['name']} – "
+                     f"{', '.join(a['name'] for a in music_data[i]['track']['artists'])}" for i in chosen}
+        seed = st.selectbox("Find songs like", list(labels), format_func=labels.get, key="similar_seed")
+        if seed is None:
+            return
+        similar = find_similar_tracks(music_data, index, seed, st.session_state.artist_genres,
+                                      k=Config.SIMILAR_TRACKS)
+        if not similar:
+            st.info("This song has no audio features, so similar songs can't be found.")
+            return
+        st.dataframe([{
+            "Track": music_data[i]['track']['name'],
+            "Artists": ", ".join(artist['name'] for artist in music_data[i]['track']['artists']),
+            "Feature distance": round(distance, 3),
+            "Shared genres": ", ".join(shared),
+        } for i, distance, shared in similar], use_container_width=True, hide_index=True)
+        if st.button("🎯 Build a playlist from these", key="similar_use"):
+            features = st.session_state.track_features.get(music_data[seed]['track']['id']) or {}
+            mood = {f: features[f] for f in MOOD_FEATURES if features.get(f) is not None}
+            open_precomputed_results(mood, array('I', [seed] + [i for i, _, _ in similar]))
+
 def render_playlist_created_page():
     """Render the success page after playlist creation."""
     st.header("🎉 Playlist Created Successfully!")
@@ -785,15 +1856,29 @@ def render_playlist_created_page():
         if st.button("📱 Different Music", use_container_width=True):
             st.session_state.page = "fetch_music"
             # Clear previous data
+            genre_job = get_job_runner().get(st.session_state.genre_job_id) if st.session_state.genre_job_id else None
+            if genre_job is not None:
+                genre_job.cancel("Library discarded")
             st.session_state.music_data = []
             st.session_state.spotify_genres = []
-            st.session_state.filtered_music_data = []
+            st.session_state.genre_stats = None
+            st.session_state.genre_confidence = None
+            st.session_state.genre_job_id = None
+            st.session_state.filtered_indices = array('I')
+            st.session_state.track_features = {}
+            st.session_state.artist_genres = {}
+            st.session_state.stage_cache.clear()
+            st.session_state.candidate_order = None
+            st.session_state.playlist_selection = None
+            st.session_state.preset_results = {}
+            st.session_state.mood_clusters = []
+            st.session_state.similarity_index = None
             st.rerun()
     
     with col3:
         if st.button("🏠 Start Over", use_container_width=True):
-            # Clear all session state except auth
-            keys_to_keep = ['spotify_client', 'auth_manager']
+            # Clear all session state except auth and the session's identity
+            keys_to_keep = ['spotify_client', 'auth_manager', 'session_id']
             for key in list(st.session_state.keys()):
                 if key not in keys_to_keep:
                     del st.session_state[key]
@@ -872,6 +1957,49 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
+def render_quota_usage():
+    """The shared Spotify quota: requests in the current window and who is waiting."""
+    scheduler = get_quota_scheduler()
+    if scheduler is None:
+        st.caption("Spotify quota is off")
+        return
+    stats = scheduler.stats(st.session_state.get('session_id'))
+    text = f"{stats['used']} / {stats['limit']} requests in the last {stats['window_s']:g}s"
+    if stats["paused_s"]:
+        text += f" (paused {stats['paused_s']}s after a 429)"
+    st.progress(min(1.0, stats["utilization"]), text=text)
+    st.json(stats)
+
+@st.fragment(run_every=2.0)
+def render_live_quota_usage():
+    """Refresh the quota view every 2 seconds; only rendered while the tab has the live view on."""
+    render_quota_usage()
+
+def render_diagnostics():
+    """Sidebar view of the shared worker pool and per-endpoint request tuning."""
+    with st.sidebar.expander("🔧 Diagnostics", expanded=False):
+        st.write("**Spotify quota**")
+        # Polling in every open tab would add load in proportion to the tab count, so it's opt-in
+        if st.toggle("Live", key="quota_live_view"):
+            render_live_quota_usage()
+        else:
+            render_quota_usage()
+        st.write("**Worker pool**")
+        st.json(get_worker_pool().stats())
+        st.write("**Spotify endpoints**")
+        st.json(get_executor().stats())
+        st.write("**Background jobs**")
+        st.json(get_job_runner().stats())
+        st.write("**Coalesced lookups**")
+        st.json({endpoint: get_coalescer(endpoint).stats() for endpoint in ("artists", "audio_features")})
+        st.write("**Session memory**")
+        st.json(get_session_manager().stats())
+        st.write("**Apply stage cache (this session)**")
+        st.json(st.session_state.stage_cache.stats())
+        if st.session_state.genre_stats is not None:
+            st.write("**Genre statistics (this session)**")
+            st.json(st.session_state.genre_stats.stats())
+
 # Main App
 def main():
     # App title and subtitle
@@ -886,14 +2014,39 @@ def main():
         "playlist_created": render_playlist_created_page
     }
     
-    # Render current page
-    current_page = st.session_state.page
-    if current_page in pages:
-        pages[current_page]()
-    else:
-        st.error("Unknown page. Redirecting...")
+    # With fast reruns a new run starts while the previous one may still be
+    # working; stop whatever Spotify batches that run has left
+    if st.session_state.run_cancel is not None:
+        st.session_state.run_cancel.cancel("Superseded by a newer run")
+    st.session_state.run_cancel = CancelToken()
+
+    # Bring back this session's library if it was spilled while idle. The id is
+    # captured so end() is called for the same session even if the page resets state.
+    session_id = st.session_state.session_id
+    session_manager = get_session_manager()
+    session_state, session_state_lock = current_session_state()
+    if session_state is not None and not session_manager.begin(session_id, session_state, session_state_lock):
+        st.warning("⚠️ Your loaded music couldn't be restored after being idle. Please load it again.")
         st.session_state.page = "fetch_music"
-        st.rerun()
+
+    # Render current page (pool work from this run is queued under this session)
+    try:
+        current_page = st.session_state.page
+        if current_page in pages:
+            with work_context(session_id):
+                pages[current_page]()
+        else:
+            st.error("Unknown page. Redirecting...")
+            st.session_state.page = "fetch_music"
+            st.rerun()
+    finally:
+        if session_state is not None:
+            # Sessions with a background job still running must stay in memory
+            jobs = [get_job_runner().get(job_id) for job_id in
+                    (st.session_state.get('load_job_id'), st.session_state.get('genre_job_id')) if job_id]
+            session_manager.end(session_id, busy=any(job is not None and not job.done for job in jobs))
+
+    render_diagnostics()
 
     # Footer
     st.markdown("---")
@@ -0,0 +1,216 @@
+"""Micro-benchmarks for EchoMood's hot functions.
+
+Times matches_mood, filter_by_audio_features, calculate_real_familiarity_batch,
+get_spotify_genres_from_tracks and the Apply genre filter on synthetic
+libraries against an in-process mock Spotify client, and writes the results
+as JSON so runs can be compared. Runs offline with no Spotify credentials:
+
+    python echomood_bench.py --sizes 1000,10000,100000 --output bench.json
+    python echomood_bench.py --sizes 1000,10000 --compare bench.json
+"""
+import argparse
+import json
+import logging
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import warnings
+from datetime import datetime, timezone
+
+from echomood_fake_spotify import AUDIO_FEATURES, GENRES
+
+DEFAULT_MOOD = {name: 0.5 for name in AUDIO_FEATURES}
+
+
+class SyntheticLibrary:
+    """Ingested-shape library with power-law artists, skewed genres and random features.
+
+    Built directly in the projected item shape the app keeps after ingest, so
+    a million tracks can be generated in seconds.
+    """
+
+    def __init__(self, num_tracks, seed=0):
+        rng = random.Random(seed)
+        num_artists = max(1, num_tracks // 8)
+        genre_weights = [1.0 / (rank + 1) for rank in range(len(GENRES))]
+
+        self.artist_genres = {}
+        artists = []
+        for i in range(num_artists):
+            artist_id = f"a{i:021d}"
+            self.artist_genres[artist_id] = sorted(set(
+                rng.choices(GENRES, weights=genre_weights, k=rng.randint(0, 4))
+            ))
+            artists.append({'id': artist_id, 'name': f"Artist {i}"})
+
+        self.items = []
+        self.audio_features = {}
+        for i in range(num_tracks):
+            track_id = f"t{i:021d}"
+            # Power law: a few prolific artists own most of the library
+            credited = [artists[int(num_artists * rng.random() ** 3)]]
+            if rng.random() < 0.15:
+                credited.append(rng.choice(artists))
+            self.items.append({
+                'added_at': "2024-01-01T12:00:00Z",
+                'track': {
+                    'id': track_id,
+                    'name': f"Track {i}",
+                    'artists': credited,
+                    'album': {'id': f"l{i // 10:021d}", 'images': []},
+                    'external_ids': {'isrc': None},
+                },
+            })
+            features = {name: rng.random() for name in AUDIO_FEATURES}
+            features['tempo'] = rng.uniform(60, 180)
+            self.audio_features[track_id] = features
+
+        self.track_ids = [item['track']['id'] for item in self.items]
+
+
+class MockSpotify:
+    """In-process stand-in for the spotipy client, serving a SyntheticLibrary."""
+
+    def __init__(self, library, latency=0.0):
+        self.library = library
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _call(self):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def artists(self, ids):
+        self._call()
+        return {'artists': [
+            {'id': i, 'genres': self.library.artist_genres.get(i, [])} for i in ids
+        ]}
+
+    def audio_features(self, ids):
+        self._call()
+        return [self.library.audio_features.get(i) for i in ids]
+
+    def current_user_recently_played(self, limit=50):
+        self._call()
+        return {'items': [{'track': item['track']} for item in self.library.items[:limit]]}
+
+    def current_user_top_tracks(self, time_range="medium_term", limit=50):
+        self._call()
+        return {'items': [item['track'] for item in self.library.items[::7][:limit]]}
+
+
+def time_call(fn, repeat):
+    """Run fn repeat times, returning the list of wall-clock durations."""
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def bench_size(app, num_tracks, repeat, latency):
+    library = SyntheticLibrary(num_tracks)
+    items = library.items
+    genres = [GENRES[0], GENRES[3], GENRES[7]]
+    all_indices = range(len(items))
+
+    def matches_mood_all():
+        for features in library.audio_features.values():
+            app.matches_mood(features, DEFAULT_MOOD)
+
+    cases = [
+        ("matches_mood", matches_mood_all),
+        ("filter_by_audio_features", lambda sp: app.filter_by_audio_features(items, DEFAULT_MOOD, sp)),
+        ("calculate_real_familiarity_batch", lambda sp: app.calculate_real_familiarity_batch(library.track_ids, sp)),
+        ("get_spotify_genres_from_tracks", lambda sp: app.get_spotify_genres_from_tracks(items, sp)),
+        ("filter_by_genres", lambda sp: app.filter_by_genres(items, all_indices, genres, sp)),
+    ]
+
+    results = []
+    for name, fn in cases:
+        sp = MockSpotify(library, latency=latency)
+        run = fn if name == "matches_mood" else (lambda fn=fn, sp=sp: fn(sp))
+        durations = time_call(run, repeat)
+        results.append({
+            "name": name,
+            "tracks": num_tracks,
+            "repeat": repeat,
+            "min_s": round(min(durations), 6),
+            "median_s": round(statistics.median(durations), 6),
+            "mean_s": round(statistics.fmean(durations), 6),
+            "per_track_us": round(min(durations) / num_tracks * 1e6, 3),
+            "api_calls": sp.calls // repeat,
+        })
+        print(f"{name:<34}{num_tracks:>9}{results[-1]['median_s'] * 1000:>12.2f} ms"
+              f"{results[-1]['per_track_us']:>10.3f} us/track{results[-1]['api_calls']:>7} calls")
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline_path):
+    """Print median time ratios against a previous results file (< 1.0 is faster)."""
+    with open(baseline_path) as f:
+        baseline = {(r["name"], r["tracks"]): r for r in json.load(f)["results"]}
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        previous = baseline.get((result["name"], result["tracks"]))
+        if previous and previous["median_s"]:
+            ratio = result["median_s"] / previous["median_s"]
+            print(f"{result['name']:<34}{result['tracks']:>9}{ratio:>10.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark EchoMood's hot functions offline")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="Comma-separated library sizes (up to 1000000)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Simulated latency per mock API call")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Previous results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    warnings.simplefilter("ignore", DeprecationWarning)
+    import streamlit.logger
+    streamlit.logger.set_log_level("error")
+    logging.getLogger().setLevel(logging.WARNING)
+    import echomood_app as app
+
+    results = []
+    for size in [int(s) for s in args.sizes.split(",") if s]:
+        results.extend(bench_size(app, size, args.repeat, args.latency_ms / 1000))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "latency_ms": args.latency_ms,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class PlaylistCache:
+    """Thread-safe LRU cache of playlist items keyed by (playlist id, snapshot_id).
+
+    Spotify only changes a playlist's snapshot_id when the playlist is edited,
+    so a cached entry stays valid until the snapshot moves on. One instance is
+    shared by every session in the process.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, playlist_id, snapshot_id):
+        """Return a copy of the cached items, or None if this snapshot isn't cached."""
+        key = (playlist_id, snapshot_id)
+        with self._lock:
+            items = self._entries.get(key)
+            if items is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # Sessions annotate their items (e.g. familiarity_score), so hand out
+        # shallow copies and keep the shared entry untouched
+        return [dict(item) for item in items]
+
+    def put(self, playlist_id, snapshot_id, items):
+        """Store the items for a snapshot, dropping older snapshots of the same playlist."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == playlist_id and k[1] != snapshot_id]:
+                del self._entries[key]
+            self._entries[(playlist_id, snapshot_id)] = [dict(item) for item in items]
+            self._entries.move_to_end((playlist_id, snapshot_id))
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                logger.info(f"Evicted playlist {evicted[0]} from cache")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class StageCache:
+    """Recent outputs of each Apply pipeline stage, keyed by that stage's inputs.
+
+    Each stage's key includes the key of the stage before it, so changing one
+    setting recomputes that stage and the ones after it while earlier stage
+    outputs are reused. Held per session, so it needs no locking.
+    """
+
+    def __init__(self, max_entries_per_stage=8):
+        self.max_entries_per_stage = max_entries_per_stage
+        self._stages = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, stage, key):
+        """Return the stored output for this stage and key, or None."""
+        entries = self._stages.get(stage)
+        if entries is None or key not in entries:
+            self.misses += 1
+            return None
+        entries.move_to_end(key)
+        self.hits += 1
+        return entries[key]
+
+    def put(self, stage, key, value):
+        entries = self._stages.setdefault(stage, OrderedDict())
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries_per_stage:
+            entries.popitem(last=False)
+
+    def clear(self):
+        self._stages.clear()
+
+    def stats(self):
+        return {
+            "entries": {stage: len(entries) for stage, entries in self._stages.items()},
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,146 @@
+import atexit
+import gzip
+import json
+import threading
+import time
+import logging
+from collections import defaultdict, deque
+from urllib.parse import urlparse, parse_qsl
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+RECORD = "record"
+REPLAY = "replay"
+
+
+def request_key(method, url, params=None, data=None):
+    """Host-independent key for a Web API request: method, path, sorted query and body."""
+    parsed = urlparse(url)
+    query = parse_qsl(parsed.query, keep_blank_values=True)
+    query += [(k, str(v)) for k, v in (params or {}).items() if v is not None]
+    path = parsed.path[len("/v1"):] if parsed.path.startswith("/v1/") else parsed.path
+    if isinstance(data, bytes):
+        data = data.decode("utf-8", errors="replace")
+    return f"{method.upper()} {path.rstrip('/')}?{'&'.join(f'{k}={v}' for k, v in sorted(query))} {data or ''}"
+
+
+def loose_key(key):
+    """Method and path only, for writes whose bodies vary run to run (e.g. shuffled track lists)."""
+    return key.split("?", 1)[0]
+
+
+class Cassette:
+    """Gzipped JSON-lines log of Spotify requests and responses.
+
+    In record mode every exchange is appended (and flushed) as it happens, so
+    a crashed session still leaves a usable cassette. In replay mode the file
+    is loaded once; identical requests are answered in recorded order and the
+    last answer repeats once they run out. Writes that don't match exactly
+    fall back to a recorded write to the same path. Request headers are never
+    stored, so cassettes carry no access tokens.
+    """
+
+    def __init__(self, path, mode, latency=None):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        # Seconds added to every replayed response; None replays the recorded timings
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._responses = defaultdict(deque)
+        self._file = None
+
+        if mode == REPLAY:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._responses[entry["key"]].append(entry)
+                        if not entry["key"].startswith("GET "):
+                            self._responses[loose_key(entry["key"])].append(entry)
+            logger.info(f"Loaded {sum(len(v) for v in self._responses.values())} responses from {path}")
+        else:
+            self._file = gzip.open(path, "at", encoding="utf-8")
+            atexit.register(self.close)
+
+    def record(self, key, response, elapsed):
+        try:
+            body = response.json() if response.content else None
+        except ValueError:
+            body = response.text
+        entry = {
+            "key": key,
+            "status": response.status_code,
+            "headers": {k: v for k, v in response.headers.items() if k.lower() in ("retry-after", "content-type")},
+            "body": body,
+            "elapsed_ms": round(elapsed * 1000, 1),
+        }
+        with self._lock:
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+
+    def lookup(self, key):
+        with self._lock:
+            queue = self._responses.get(key)
+            if not queue and not key.startswith("GET "):
+                queue = self._responses.get(loose_key(key))
+            if not queue:
+                return None
+            return queue.popleft() if len(queue) > 1 else queue[0]
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class CassetteSession(requests.Session):
+    """requests session for spotipy that records to, or replays from, a Cassette."""
+
+    def __init__(self, cassette, retries=3, backoff_factor=0.3):
+        super().__init__()
+        self.cassette = cassette
+        if cassette.mode == RECORD:
+            # spotipy only mounts its retry adapter on sessions it builds itself
+            retry = Retry(
+                total=retries, connect=None, read=False, status=retries,
+                allowed_methods=frozenset(["GET", "POST", "PUT", "DELETE"]),
+                backoff_factor=backoff_factor, status_forcelist=(429, 500, 502, 503, 504),
+            )
+            self.mount("https://", HTTPAdapter(max_retries=retry))
+            self.mount("http://", HTTPAdapter(max_retries=retry))
+
+    def request(self, method, url, params=None, data=None, **kwargs):
+        key = request_key(method, url, params, data)
+        if self.cassette.mode == RECORD:
+            started = time.perf_counter()
+            response = super().request(method, url, params=params, data=data, **kwargs)
+            self.cassette.record(key, response, time.perf_counter() - started)
+            return response
+        return self._replay(key, url)
+
+    def _replay(self, key, url):
+        entry = self.cassette.lookup(key)
+        if entry is None:
+            logger.warning(f"No recorded response for {key[:120]}")
+            entry = {"status": 404, "headers": {}, "elapsed_ms": 0,
+                     "body": {"error": {"status": 404, "message": "Request not found in cassette"}}}
+
+        delay = entry.get("elapsed_ms", 0) / 1000 if self.cassette.latency is None else self.cassette.latency
+        if delay:
+            time.sleep(delay)
+
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.headers.update(entry.get("headers") or {})
+        response.url = url
+        response.reason = "Replayed"
+        response._content = json.dumps(entry["body"]).encode() if entry["body"] is not None else b""
+        response.encoding = "utf-8"
+        return response
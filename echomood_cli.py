@@ -0,0 +1,232 @@
+"""Generate EchoMood playlists from the command line, without Streamlit.
+
+Fetches a user's library once (liked songs or a playlist), enriches it with
+familiarity, genres and audio features, then builds one playlist per mood
+preset from the same enriched library:
+
+    python echomood_cli.py --source liked --preset Happy:30 --preset Chill:20
+    python echomood_cli.py --source https://open.spotify.com/playlist/... --preset Workout:50 --dry-run
+
+For nightly runs over many users, pass a JSON-lines jobs file. Each line may
+set name, cache_path (a spotipy token cache written when the user logged in
+through the app) or token, source, presets, genres, familiarity and order; anything
+left out falls back to the command-line options:
+
+    python echomood_cli.py --jobs nightly.jsonl --concurrency 4 --json report.json
+
+SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET must be set to refresh cached tokens.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from echomood_workers import work_context
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PLAYLIST_SIZE = 20
+DEFAULT_NAME_TEMPLATE = "EchoMood - {preset} - {date}"
+DEFAULT_ORDER = "smooth"
+
+
+def parse_preset(app, spec):
+    """'Happy:30' -> ('Happy', 30); the size defaults to DEFAULT_PLAYLIST_SIZE."""
+    name, _, size = spec.partition(":")
+    matches = [preset for preset in app.MOOD_PRESETS if preset.lower() == name.strip().lower()]
+    if not matches:
+        raise ValueError(f"Unknown preset {name!r} (choose from {', '.join(app.MOOD_PRESETS)})")
+    return matches[0], int(size) if size else DEFAULT_PLAYLIST_SIZE
+
+
+def make_client(app, job):
+    """Spotify client for a job, from a raw access token or a cached (refreshable) login."""
+    import spotipy
+    from spotipy.oauth2 import SpotifyOAuth
+
+    if job.get("token"):
+        return spotipy.Spotify(auth=job["token"])
+
+    cache_path = job.get("cache_path") or app.Config.CACHE_PATH
+    auth_manager = SpotifyOAuth(
+        client_id=os.getenv("SPOTIFY_CLIENT_ID"),
+        client_secret=os.getenv("SPOTIFY_CLIENT_SECRET"),
+        redirect_uri=app.Config.REDIRECT_URI,
+        scope=" ".join(app.Config.SCOPES),
+        open_browser=False,
+        cache_path=cache_path
+    )
+    if not auth_manager.get_cached_token():
+        raise RuntimeError(f"No cached Spotify login in {cache_path}; log in through the app first")
+    return spotipy.Spotify(auth_manager=auth_manager)
+
+
+def load_library(app, sp, source):
+    """Fetch and enrich a library once; the returned state is reused for every preset."""
+    if source == "liked":
+        data = app.get_spotify_data("Liked Songs", sp=sp)
+    else:
+        is_valid, error_msg = app.validate_playlist_url(source)
+        if not is_valid:
+            raise ValueError(error_msg)
+        data = app.get_spotify_data("Playlist", source, sp=sp)
+    if not data:
+        raise RuntimeError(f"No tracks could be fetched from {source}")
+
+    library = {
+        "data": data,
+        "modes": {},
+        "history": {},
+        "track_features": {},
+        "artist_genres": {},
+        "stage_cache": app.StageCache(),
+    }
+    app.add_familiarity_scores(data, sp, library["history"], library["modes"])
+    return library
+
+
+def generate_playlist(app, sp, library, preset, size, genres=(), familiarity=0,
+                      name_template=DEFAULT_NAME_TEMPLATE, order=DEFAULT_ORDER, dry_run=False):
+    """Filter the library to a preset's mood and create a playlist of its closest matches, capped per artist."""
+    data = library["data"]
+    mood = app.MOOD_PRESETS[preset]
+    indices = app.apply_mood_filters(
+        data, list(genres), mood, familiarity, sp,
+        feature_cache=library["track_features"],
+        modes=library["modes"],
+        genre_cache=library["artist_genres"],
+        stage_cache=library["stage_cache"],
+        library_version=0
+    )
+    # Closest mood matches first (within the diversity caps), so a batch run is repeatable
+    chosen = app.choose_playlist_tracks(data, indices, size, mood, library["track_features"],
+                                        library["artist_genres"])
+    chosen = app.order_playlist_tracks(data, chosen, library["track_features"], order)
+    track_ids = [data[i]['track']['id'] for i in chosen]
+    name = name_template.format(preset=preset, date=datetime.now().strftime('%B %d'))
+
+    result = {
+        "preset": preset,
+        "name": name,
+        "candidates": len(indices),
+        "tracks": len(track_ids),
+        "modes": dict(library["modes"]),
+        "playlist_url": None,
+    }
+    if track_ids and not dry_run:
+        playlist = app.create_playlist(sp, name, track_ids)
+        result["playlist_url"] = playlist['external_urls']['spotify']
+    return result
+
+
+def run_job(app, job, sp=None):
+    """Run one user's job: fetch once, then one playlist per preset."""
+    name = job.get("name") or job.get("cache_path") or "default"
+    started = time.perf_counter()
+    # Queue this job's pool work as its own session so concurrent jobs share the pool fairly
+    with work_context(name):
+        if sp is None:
+            sp = make_client(app, job)
+        library = load_library(app, sp, job["source"])
+        playlists = [
+            generate_playlist(
+                app, sp, library, preset, size,
+                genres=job.get("genres", ()),
+                familiarity=job.get("familiarity", 0),
+                name_template=job.get("name_template", DEFAULT_NAME_TEMPLATE),
+                order=job.get("order", DEFAULT_ORDER),
+                dry_run=job.get("dry_run", False)
+            )
+            for preset, size in (parse_preset(app, spec) for spec in job["presets"])
+        ]
+    return {
+        "name": name,
+        "source": job["source"],
+        "library_tracks": len(library["data"]),
+        "elapsed_s": round(time.perf_counter() - started, 3),
+        "playlists": playlists,
+    }
+
+
+def load_jobs(path, defaults):
+    with open(path) as f:
+        return [dict(defaults, **json.loads(line)) for line in f if line.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate EchoMood playlists without the web app")
+    parser.add_argument("--source", default="liked", help="'liked' or a Spotify playlist URL")
+    parser.add_argument("--preset", action="append", dest="presets",
+                        help="Preset and playlist size, e.g. Happy:30 (repeatable)")
+    parser.add_argument("--genre", action="append", dest="genres", default=[], help="Genre filter (repeatable)")
+    parser.add_argument("--familiarity", type=int, default=0, help="Minimum familiarity score, 0-100")
+    parser.add_argument("--name-template", default=DEFAULT_NAME_TEMPLATE)
+    parser.add_argument("--order", default=DEFAULT_ORDER,
+                        help="Track order: smooth, 'build up', 'wind down', peak, best or shuffle")
+    parser.add_argument("--cache-path", help="spotipy token cache to log in with")
+    parser.add_argument("--token", help="Use this access token instead of a token cache")
+    parser.add_argument("--jobs", help="JSON-lines file with one job per user")
+    parser.add_argument("--concurrency", type=int, default=4, help="Jobs to run at the same time")
+    parser.add_argument("--dry-run", action="store_true", help="Filter and rank, but don't create playlists")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args(argv)
+
+    warnings.simplefilter("ignore", DeprecationWarning)
+    # Imported late so the Streamlit bare-mode warnings can be silenced first
+    import streamlit.logger
+    streamlit.logger.set_log_level("error")
+    logging.getLogger().setLevel(logging.WARNING)
+    import echomood_app as app
+
+    defaults = {
+        "source": args.source,
+        "presets": args.presets or list(app.MOOD_PRESETS),
+        "genres": args.genres,
+        "familiarity": args.familiarity,
+        "name_template": args.name_template,
+        "order": args.order,
+        "cache_path": args.cache_path,
+        "token": args.token,
+        "dry_run": args.dry_run,
+    }
+    jobs = load_jobs(args.jobs, defaults) if args.jobs else [defaults]
+    try:
+        for job in jobs:
+            for spec in job["presets"]:
+                parse_preset(app, spec)
+            if job["order"] not in app.PLAYLIST_ORDERS.values():
+                raise ValueError(f"Unknown order {job['order']!r} (choose from {', '.join(app.PLAYLIST_ORDERS.values())})")
+    except ValueError as e:
+        parser.error(str(e))
+
+    report = []
+    failures = 0
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [(job, pool.submit(run_job, app, job)) for job in jobs]
+        for job, future in futures:
+            try:
+                result = future.result()
+            except Exception as e:
+                failures += 1
+                logger.warning(f"Job {job.get('name') or job.get('cache_path') or 'default'} failed: {e}")
+                report.append({"name": job.get("name"), "error": str(e)})
+                continue
+            report.append(result)
+            print(f"{result['name']}: {result['library_tracks']} tracks in {result['elapsed_s']}s")
+            for playlist in result["playlists"]:
+                print(f"  {playlist['preset']:<10}{playlist['tracks']:>4}/{playlist['candidates']:<6} "
+                      f"{playlist['playlist_url'] or '(not created)'}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if failures == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
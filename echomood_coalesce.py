@@ -0,0 +1,156 @@
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import Future, wait
+
+from echomood_executor import CircuitOpenError, is_endpoint_failure
+
+logger = logging.getLogger(__name__)
+
+
+class _Abandoned(Exception):
+    """The caller that claimed a batch didn't get an answer every caller can share; waiters claim it again."""
+
+
+class BatchCoalescer:
+    """Single-flight, cross-session batching for id lookups such as sp.artists.
+
+    Every id being looked up has one shared Future. A caller asking for an
+    id that is already queued or in flight waits on that Future instead of
+    requesting it again. Callers pack queued ids, their own and other
+    sessions', into full batches and fetch them through the shared executor.
+    While other lookups are running, a caller holding a partial batch waits
+    up to linger seconds for more ids to fill it.
+
+    Lookups are for catalog data that is the same for every user, so a batch
+    can carry ids from several sessions and run with any one caller's client.
+    Only errors about the endpoint (see is_endpoint_failure) are passed on to
+    waiters. Others, such as a 401 from the claiming caller's expired token,
+    go to that caller alone, and waiters fetch the ids with their own client.
+    """
+
+    def __init__(self, endpoint, executor, batch_size, linger=0.01, max_attempts=3):
+        self.endpoint = endpoint
+        self.executor = executor
+        self.batch_size = batch_size
+        self.linger = linger
+        self.max_attempts = max_attempts
+        self._futures = {}
+        self._queue = deque()
+        self._callers = 0
+        self._lock = threading.Lock()
+        self.requested = 0
+        self.shared = 0
+        self.batches = 0
+        self.batched_ids = 0
+
+    def _take(self, full_only):
+        # Called with the lock held: claim queued ids as batches for the calling thread
+        batches = []
+        while len(self._queue) >= self.batch_size or (self._queue and not full_only):
+            count = min(self.batch_size, len(self._queue))
+            batches.append([self._queue.popleft() for _ in range(count)])
+        self.batches += len(batches)
+        self.batched_ids += sum(len(batch) for batch in batches)
+        return batches
+
+    def _claim(self, ids):
+        with self._lock:
+            futures = {}
+            for item_id in ids:
+                if item_id in futures:
+                    continue
+                self.requested += 1
+                future = self._futures.get(item_id)
+                if future is None:
+                    future = self._futures[item_id] = Future()
+                    self._queue.append(item_id)
+                else:
+                    self.shared += 1
+                futures[item_id] = future
+            batches = self._take(full_only=True)
+            others_active = self._callers > 1
+
+        if others_active and self.linger:
+            # Give concurrent sessions a moment to top up the partial batch
+            time.sleep(self.linger)
+        with self._lock:
+            batches += self._take(full_only=False)
+        return futures, batches
+
+    def _settle(self, batch, results=None, error=None):
+        with self._lock:
+            futures = [self._futures.pop(item_id) for item_id in batch]
+        for index, future in enumerate(futures):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(results[index] if index < len(results) else None)
+
+    def fetch(self, ids, call, cancel=None):
+        """Look ids up with call(batch) -> results in batch order.
+
+        Returns ({id: result}, {id: error}); ids whose batch failed appear
+        only in the second dict. A cancelled caller raises OperationCancelled
+        and hands its unfetched batches to anyone else waiting on them.
+        """
+        results = {}
+        errors = {}
+        pending = list(ids)
+        for _ in range(self.max_attempts):
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            with self._lock:
+                self._callers += 1
+            batches = []
+            settled = 0
+            own_errors = {}
+            try:
+                futures, batches = self._claim(pending)
+                for batch, batch_results, error in self.executor.map(self.endpoint, call, batches, cancel=cancel):
+                    if error is None or isinstance(error, CircuitOpenError) or is_endpoint_failure(error, self.endpoint):
+                        self._settle(batch, batch_results, error)
+                    else:
+                        # The error may be about this caller's request, so other callers retry with their own
+                        own_errors.update((item_id, error) for item_id in batch if item_id in futures)
+                        self._settle(batch, error=_Abandoned(f"{self.endpoint} lookup failed for another caller"))
+                    settled += 1
+            finally:
+                with self._lock:
+                    self._callers -= 1
+                # Batches claimed but never fetched (e.g. the caller was stopped) go back to waiters
+                for batch in batches[settled:]:
+                    self._settle(batch, error=_Abandoned(f"{self.endpoint} lookup abandoned"))
+
+            # Wait for ids other callers are fetching, checking for cancellation while we do
+            waiting = list(futures.values())
+            while waiting:
+                _, waiting = wait(waiting, timeout=0.1 if cancel is not None else None)
+                if waiting and cancel is not None:
+                    cancel.raise_if_cancelled()
+
+            pending = []
+            for item_id, future in futures.items():
+                error = own_errors.get(item_id) or future.exception()
+                if isinstance(error, _Abandoned):
+                    pending.append(item_id)
+                elif error is not None:
+                    errors[item_id] = error
+                else:
+                    results[item_id] = future.result()
+            if not pending:
+                break
+        for item_id in pending:
+            errors[item_id] = _Abandoned(f"{self.endpoint} lookup abandoned")
+        return results, errors
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requested_ids": self.requested,
+                "shared_ids": self.shared,
+                "batches": self.batches,
+                "avg_batch_fill": round(self.batched_ids / self.batches / self.batch_size, 2) if self.batches else 0.0,
+                "in_flight_ids": len(self._futures),
+            }
@@ -0,0 +1,304 @@
+import threading
+import time
+import logging
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+
+import requests
+
+from echomood_workers import FairWorkerPool, OperationCancelled, current_work_context
+
+logger = logging.getLogger(__name__)
+
+
+def is_rate_limited(error):
+    """True if an exception is a Spotify 429 (after spotipy's own retries)."""
+    return getattr(error, 'http_status', None) == 429
+
+
+# Extra statuses that mean an endpoint is unusable, not that one request was bad. Spotify answers
+# audio-features with 403 for every call from an app that wasn't granted access to it.
+ENDPOINT_FAILURE_STATUSES = {
+    "audio_features": frozenset({403}),
+}
+
+
+def is_endpoint_failure(error, endpoint=None):
+    """True if an exception says the endpoint is unhealthy: a 5xx, a 429, a timeout or a connection error.
+
+    Other 4xx errors (a bad id, one user's expired token or missing scope)
+    are about the request, so they shouldn't open a breaker every session shares,
+    unless ENDPOINT_FAILURE_STATUSES lists them for endpoint.
+    """
+    status = getattr(error, 'http_status', None)
+    if status is not None:
+        return status == 429 or status >= 500 or status in ENDPOINT_FAILURE_STATUSES.get(endpoint, ())
+    return isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError,
+                              requests.exceptions.RetryError, TimeoutError, ConnectionError))
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Stops calling an endpoint after repeated failures.
+
+    After failure_threshold consecutive failures (see is_endpoint_failure)
+    the circuit opens and calls fail immediately with CircuitOpenError.
+    Once reset_timeout has passed a single trial call is let through;
+    success closes the circuit again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._trial_running = False
+            self.state = self.CLOSED
+
+    def release(self):
+        """Give back a trial call that was cancelled or said nothing about the endpoint's health."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit opened for {self.name} after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "failures": self.failures}
+
+
+class AIMDLimiter:
+    """Concurrency limit for one endpoint, tuned by additive increase / multiplicative decrease.
+
+    Each fast success grows the limit by roughly one request per round trip.
+    A 429, or a latency well above the best seen so far (spotipy retries and
+    server queueing both show up as latency), cuts the limit.
+    """
+
+    def __init__(self, name, initial=2, min_limit=1, max_limit=16,
+                 latency_tolerance=2.0, backoff=0.5, slow_backoff=0.8):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self.slow_backoff = slow_backoff
+        self.baseline = None
+        self.in_flight = 0
+        self.successes = 0
+        self.throttled = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self):
+        with self._lock:
+            return max(self.min_limit, int(self.limit)) - self.in_flight
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finished(self, latency, error=None):
+        with self._lock:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if error is not None and is_rate_limited(error):
+                self.throttled += 1
+                self._decrease(self.backoff, now)
+                return
+            if error is not None:
+                return
+
+            self.successes += 1
+            # Baseline drifts up slowly so one lucky fast call doesn't pin it forever
+            if self.baseline is None or latency < self.baseline:
+                self.baseline = latency
+            else:
+                self.baseline += (latency - self.baseline) * 0.01
+
+            if latency > self.baseline * self.latency_tolerance:
+                self._decrease(self.slow_backoff, now)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def _decrease(self, factor, now):
+        # Only back off once per round trip; a burst of slow replies is one signal
+        if now - self._last_decrease < (self.baseline or 0.0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * factor)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "baseline_ms": round((self.baseline or 0.0) * 1000, 1),
+                "successes": self.successes,
+                "throttled": self.throttled,
+            }
+
+
+class AdaptiveExecutor:
+    """Runs Spotify batch calls with a per-endpoint AIMD concurrency limit.
+
+    Each endpoint also has a circuit breaker, so a failing endpoint is skipped
+    instead of timing out batch after batch. Calls run on a FairWorkerPool and
+    are attributed to the caller's work_context (session and priority lane).
+    One instance is shared by the whole process, so what is learned about an
+    endpoint applies to every session calling it.
+    """
+
+    def __init__(self, max_workers=16, initial_limit=2, failure_threshold=3, reset_timeout=30.0, pool=None):
+        self.max_workers = max_workers
+        self.initial_limit = initial_limit
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._pool = pool or FairWorkerPool(max_workers=max_workers)
+        self._limiters = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, endpoint):
+        with self._lock:
+            if endpoint not in self._limiters:
+                self._limiters[endpoint] = AIMDLimiter(
+                    endpoint, initial=self.initial_limit, max_limit=self.max_workers
+                )
+            return self._limiters[endpoint]
+
+    def breaker(self, endpoint):
+        with self._lock:
+            if endpoint not in self._breakers:
+                self._breakers[endpoint] = CircuitBreaker(
+                    endpoint, failure_threshold=self.failure_threshold, reset_timeout=self.reset_timeout
+                )
+            return self._breakers[endpoint]
+
+    def _run(self, limiter, breaker, fn, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            limiter.finished(time.perf_counter() - started, e)
+            if is_endpoint_failure(e, breaker.name):
+                breaker.record_failure()
+            else:
+                breaker.release()
+            raise
+        limiter.finished(time.perf_counter() - started)
+        breaker.record_success()
+        return result
+
+    def call(self, endpoint, fn, *args, **kwargs):
+        """Run a single call in the caller's thread, guarded by the endpoint's breaker."""
+        breaker = self.breaker(endpoint)
+        if not breaker.allow():
+            raise CircuitOpenError(f"{endpoint} is temporarily unavailable")
+        limiter = self.limiter(endpoint)
+        limiter.started()
+        return self._run(limiter, breaker, fn, *args, **kwargs)
+
+    def map(self, endpoint, fn, items, cancel=None):
+        """Run fn over items with adaptive concurrency.
+
+        Yields (item, result, error) tuples in input order as soon as each
+        prefix completes, so callers can update progress from their own thread.
+        If cancel (a CancelToken) is cancelled, or the caller stops iterating,
+        batches that haven't started are dropped; cancellation then raises
+        OperationCancelled.
+        """
+        limiter = self.limiter(endpoint)
+        breaker = self.breaker(endpoint)
+        session_id, priority = current_work_context()
+        items = list(items)
+        futures = {}
+        next_to_submit = 0
+        next_to_yield = 0
+
+        try:
+            while next_to_yield < len(items):
+                if cancel is not None:
+                    cancel.raise_if_cancelled()
+
+                # Top up to the current limit (always keep at least one call going),
+                # without running too far ahead of a slow head-of-line item
+                while (next_to_submit < len(items)
+                       and next_to_submit - next_to_yield < self.max_workers * 4
+                       and (limiter.capacity > 0 or not futures)):
+                    if breaker.allow():
+                        limiter.started()
+                        futures[next_to_submit] = self._pool.submit(
+                            self._run, limiter, breaker, fn, items[next_to_submit],
+                            session_id=session_id, priority=priority
+                        )
+                    else:
+                        # Fail fast while the endpoint's circuit is open
+                        futures[next_to_submit] = Future()
+                        futures[next_to_submit].set_exception(CircuitOpenError(f"{endpoint} is temporarily unavailable"))
+                    next_to_submit += 1
+
+                future = futures[next_to_yield]
+                if not future.done():
+                    pending = [f for i, f in futures.items() if i >= next_to_yield and not f.done()]
+                    # With a cancel token, wake up regularly to check it
+                    wait(pending, timeout=0.1 if cancel is not None else None, return_when=FIRST_COMPLETED)
+                    continue
+
+                del futures[next_to_yield]
+                error = future.exception()
+                yield items[next_to_yield], (None if error else future.result()), error
+                next_to_yield += 1
+        finally:
+            # Drop batches still queued in the pool and hand back their concurrency slots
+            for future in futures.values():
+                if future.cancel():
+                    limiter.finished(0.0, OperationCancelled())
+                    breaker.release()
+
+    def stats(self):
+        with self._lock:
+            limiters = list(self._limiters.values())
+            breakers = dict(self._breakers)
+        stats = {limiter.name: limiter.stats() for limiter in limiters}
+        for name, breaker in breakers.items():
+            stats.setdefault(name, {}).update(circuit=breaker.stats())
+        return stats
+
+    def shutdown(self):
+        self._pool.shutdown()
@@ -0,0 +1,318 @@
+import json
+import random
+import re
+import string
+import threading
+import time
+import logging
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger(__name__)
+
+GENRES = [
+    "pop", "rock", "indie", "electronic", "hip hop", "rap", "r&b", "soul", "jazz",
+    "blues", "classical", "folk", "country", "metal", "punk", "house", "techno",
+    "ambient", "dance pop", "indie pop", "indie rock", "alternative rock", "trap",
+    "drill", "grime", "uk garage", "drum and bass", "dubstep", "lo-fi", "k-pop",
+    "latin", "reggaeton", "afrobeats", "reggae", "funk", "disco", "synthpop",
+    "shoegaze", "post-punk", "emo", "singer-songwriter", "soundtrack", "opera",
+    "bossa nova", "gospel", "bluegrass", "grunge", "hard rock", "trance", "edm",
+]
+MARKETS = [a + b for a in string.ascii_uppercase[:14] for b in string.ascii_uppercase[:13]]
+AUDIO_FEATURES = ["valence", "energy", "danceability", "acousticness", "instrumentalness", "liveness"]
+
+
+def make_id(rng, length=22):
+    """Random base62 id in the same shape as a Spotify id."""
+    return "".join(rng.choice(string.ascii_letters + string.digits) for _ in range(length))
+
+
+class FakeLibrary:
+    """Synthetic Spotify catalogue: tracks, artists with genres and audio features.
+
+    Artist popularity follows a power law so a few prolific artists own most of
+    the tracks, like a real library.
+    """
+
+    def __init__(self, num_tracks=500, num_artists=None, seed=0):
+        rng = random.Random(seed)
+        num_artists = num_artists or max(1, num_tracks // 8)
+        genre_weights = [1.0 / (rank + 1) for rank in range(len(GENRES))]
+
+        self.artists = {}
+        artist_ids = []
+        for i in range(num_artists):
+            artist_id = make_id(rng)
+            genres = sorted(set(rng.choices(GENRES, weights=genre_weights, k=rng.randint(0, 4))))
+            self.artists[artist_id] = {
+                "id": artist_id,
+                "name": f"Artist {i}",
+                "type": "artist",
+                "uri": f"spotify:artist:{artist_id}",
+                "genres": genres,
+                "popularity": rng.randint(0, 100),
+            }
+            artist_ids.append(artist_id)
+
+        self.items = []
+        self.audio_features = {}
+        for i in range(num_tracks):
+            track_id = make_id(rng)
+            # Power-law artist choice, occasionally a featured second artist
+            credited = [artist_ids[int(num_artists * rng.random() ** 3)]]
+            if rng.random() < 0.15:
+                credited.append(rng.choice(artist_ids))
+            artists = [
+                {"id": a, "name": self.artists[a]["name"], "type": "artist", "uri": f"spotify:artist:{a}"}
+                for a in dict.fromkeys(credited)
+            ]
+            self.items.append({
+                "added_at": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T12:00:00Z",
+                "track": {
+                    "id": track_id,
+                    "name": f"Track {i}",
+                    "type": "track",
+                    "uri": f"spotify:track:{track_id}",
+                    "duration_ms": rng.randint(90000, 420000),
+                    "popularity": rng.randint(0, 100),
+                    "explicit": rng.random() < 0.2,
+                    "artists": artists,
+                    "album": {
+                        "id": make_id(rng),
+                        "name": f"Album {i // 10}",
+                        "images": [
+                            {"url": f"https://i.scdn.co/image/{track_id}", "height": 640, "width": 640},
+                            {"url": f"https://i.scdn.co/image/{track_id}-300", "height": 300, "width": 300},
+                        ],
+                        "available_markets": MARKETS,
+                    },
+                    "available_markets": MARKETS,
+                    "external_ids": {"isrc": f"GB{rng.randint(0, 10**10):010d}"},
+                },
+            })
+            features = {name: round(rng.random(), 3) for name in AUDIO_FEATURES}
+            features.update(id=track_id, tempo=round(rng.uniform(60, 180), 1), type="audio_features")
+            self.audio_features[track_id] = features
+
+        self.track_ids = [item["track"]["id"] for item in self.items]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Routes the subset of the Web API that EchoMood uses."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method):
+        server = self.server.fake
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        body = b""
+        if self.headers.get("Content-Length"):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+
+        if url.path == "/_stats":
+            return self._send(200, server.stats())
+
+        token = self.headers.get("Authorization", "").replace("Bearer ", "")
+        route = server.match(method, url.path)
+        if route is None:
+            return self._send(404, {"error": {"status": 404, "message": "Not found"}})
+        name, handler, args = route
+        server.record(token, name)
+
+        throttled, retry_after = server.next_throttle()
+        if throttled:
+            headers = {} if retry_after is None else {"Retry-After": retry_after}
+            return self._send(429, {"error": {"status": 429, "message": "API rate limit exceeded"}}, headers)
+
+        if server.latency:
+            time.sleep(server.latency)
+        status, payload = handler(server, token, query, body, *args)
+        self._send(status, payload)
+
+    def _send(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def _page(items, query, default_limit):
+    limit = int(query.get("limit", default_limit))
+    offset = int(query.get("offset", 0))
+    return {"items": items[offset:offset + limit], "total": len(items), "limit": limit, "offset": offset}
+
+
+def _me(server, token, query, body):
+    return 200, {"id": token or "anonymous", "display_name": f"Load test {token}", "type": "user"}
+
+
+def _saved_tracks(server, token, query, body):
+    return 200, _page(server.library.items, query, 20)
+
+
+def _playlist(server, token, query, body, playlist_id):
+    return 200, {
+        "id": playlist_id,
+        "name": "Shared playlist",
+        "snapshot_id": server.snapshot_id,
+        "tracks": {"total": len(server.library.items)},
+    }
+
+
+def _playlist_items(server, token, query, body, playlist_id):
+    return 200, _page(server.library.items, query, 100)
+
+
+def _recently_played(server, token, query, body):
+    limit = int(query.get("limit", 20))
+    return 200, {"items": [{"track": item["track"]} for item in server.library.items[:limit]]}
+
+
+def _top_tracks(server, token, query, body):
+    limit = int(query.get("limit", 20))
+    items = server.library.items[::7][:limit]
+    return 200, {"items": [item["track"] for item in items], "total": len(items)}
+
+
+def _artists(server, token, query, body):
+    ids = [i for i in query.get("ids", "").split(",") if i]
+    return 200, {"artists": [server.library.artists.get(i) for i in ids]}
+
+
+def _audio_features(server, token, query, body):
+    ids = [i for i in query.get("ids", "").split(",") if i]
+    return 200, {"audio_features": [server.library.audio_features.get(i) for i in ids]}
+
+
+def _create_playlist(server, token, query, body, user_id):
+    playlist_id = make_id(server.rng)
+    return 201, {
+        "id": playlist_id,
+        "name": json.loads(body or b"{}").get("name", ""),
+        "external_urls": {"spotify": f"https://open.spotify.com/playlist/{playlist_id}"},
+    }
+
+
+def _add_items(server, token, query, body, playlist_id):
+    return 201, {"snapshot_id": make_id(server.rng)}
+
+
+ROUTES = [
+    ("GET", r"/v1/me/?", "me", _me),
+    ("GET", r"/v1/me/tracks/?", "saved_tracks", _saved_tracks),
+    ("GET", r"/v1/me/player/recently-played/?", "recently_played", _recently_played),
+    ("GET", r"/v1/me/top/tracks/?", "top_tracks", _top_tracks),
+    ("GET", r"/v1/playlists/([^/]+)/?", "playlist", _playlist),
+    ("GET", r"/v1/playlists/([^/]+)/(?:tracks|items)/?", "playlist_items", _playlist_items),
+    ("GET", r"/v1/artists/?", "artists", _artists),
+    ("GET", r"/v1/audio-features/?", "audio_features", _audio_features),
+    ("POST", r"/v1/users/([^/]+)/playlists/?", "create_playlist", _create_playlist),
+    ("POST", r"/v1/playlists/([^/]+)/(?:tracks|items)/?", "add_items", _add_items),
+]
+
+
+class FakeSpotifyServer:
+    """Local HTTP server that answers Spotify Web API calls from a FakeLibrary.
+
+    Every request is counted per bearer token and per endpoint so callers can
+    report API usage per simulated user. throttle() makes the next requests
+    fail with 429, like Spotify's rate limit.
+    """
+
+    def __init__(self, library, latency=0.0, host="127.0.0.1", port=0):
+        self.library = library
+        self.latency = latency
+        self.snapshot_id = "snapshot-1"
+        self.rng = random.Random(1)
+        self._routes = [(m, re.compile(p + "$"), name, fn) for m, p, name, fn in ROUTES]
+        self._lock = threading.Lock()
+        self._calls_by_token = Counter()
+        self._calls_by_endpoint = Counter()
+        self._throttles = deque()
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.fake = self
+        self._thread = None
+
+    @property
+    def prefix(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1/"
+
+    def match(self, method, path):
+        for route_method, pattern, name, fn in self._routes:
+            match = pattern.match(path)
+            if route_method == method and match:
+                return name, fn, match.groups()
+        return None
+
+    def record(self, token, endpoint):
+        with self._lock:
+            self._calls_by_token[token] += 1
+            self._calls_by_endpoint[endpoint] += 1
+
+    def throttle(self, count=1, retry_after="1"):
+        """Answer the next count API requests with 429 and this Retry-After header (None to omit it)."""
+        with self._lock:
+            self._throttles.extend([retry_after] * count)
+
+    def next_throttle(self):
+        """(True, Retry-After) if the current request should be throttled, else (False, None)."""
+        with self._lock:
+            if self._throttles:
+                return True, self._throttles.popleft()
+            return False, None
+
+    def stats(self):
+        with self._lock:
+            return {"by_token": dict(self._calls_by_token), "by_endpoint": dict(self._calls_by_endpoint)}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class StubAuthManager:
+    """Auth manager that hands spotipy a fixed token instead of running OAuth."""
+
+    def __init__(self, token):
+        self.token = token
+
+    def get_access_token(self, as_dict=False):
+        return {"access_token": self.token} if as_dict else self.token
+
+    def get_cached_token(self):
+        return {"access_token": self.token}
+
+
+def make_client(prefix, token):
+    """spotipy client pointed at a fake server and authenticated with a stub token."""
+    import spotipy
+
+    sp = spotipy.Spotify(auth_manager=StubAuthManager(token), requests_timeout=30)
+    sp.prefix = prefix
+    return sp
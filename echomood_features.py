@@ -0,0 +1,234 @@
+"""Local audio-features store built from an offline dataset.
+
+Spotify's audio-features endpoint is unavailable to many new apps, so
+EchoMood can look features up in a SQLite file imported from a public
+track-features dataset (CSV or Parquet, keyed by Spotify track id and/or
+ISRC). filter_by_audio_features consults the store before calling the API.
+
+    python echomood_features.py import tracks_features.csv
+    python echomood_features.py import tracks.parquet --id-column track_id --isrc-column isrc
+    python echomood_features.py stats
+
+Imports stream the file in chunks, so memory stays flat however many rows
+the dataset has.
+"""
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+FEATURE_COLUMNS = ["valence", "energy", "danceability", "acousticness", "instrumentalness", "liveness", "tempo"]
+DEFAULT_STORE_PATH = "echomood_features.db"
+
+# Rows written per transaction during import, and ids per lookup query
+IMPORT_CHUNK_SIZE = 10000
+LOOKUP_CHUNK_SIZE = 500
+
+
+def normalize_track_id(value):
+    """Bare base62 id from an id, spotify:track: URI or open.spotify.com URL."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.startswith("spotify:track:"):
+        return value.rsplit(":", 1)[1]
+    if "open.spotify.com/track/" in value:
+        return value.split("/track/", 1)[1].split("?", 1)[0]
+    return value
+
+
+def _to_float(value):
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class FeatureStore:
+    """SQLite-backed audio features keyed by track id, or by ISRC for rows without one.
+
+    Lookups are indexed point queries batched LOOKUP_CHUNK_SIZE ids at a
+    time, so their cost per track doesn't grow with the dataset. One
+    connection is shared behind a lock, so a single instance can serve every
+    session.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS features ("
+            "track_id TEXT UNIQUE, isrc TEXT, "
+            + ", ".join(f"{column} REAL" for column in FEATURE_COLUMNS)
+            + ")"
+        )
+        # track_id's UNIQUE never fires for ISRC-only rows (NULLs don't conflict), so key those by ISRC
+        has_key = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'features_key'"
+        ).fetchone()
+        if not has_key:
+            # Stores written before the key existed may hold repeated ISRC-only rows; keep the newest
+            self._conn.execute(
+                "DELETE FROM features WHERE track_id IS NULL AND rowid NOT IN "
+                "(SELECT MAX(rowid) FROM features WHERE track_id IS NULL GROUP BY isrc)"
+            )
+            self._conn.execute("CREATE UNIQUE INDEX features_key ON features (COALESCE(track_id, isrc))")
+        self._conn.commit()
+
+    def import_rows(self, rows, chunk_size=IMPORT_CHUNK_SIZE):
+        """Insert (track_id, isrc, *features) tuples from any iterable; returns the row count."""
+        placeholders = ", ".join("?" * (len(FEATURE_COLUMNS) + 2))
+        sql = f"INSERT OR REPLACE INTO features VALUES ({placeholders})"
+        imported = 0
+        chunk = []
+        with self._lock:
+            # The store can be rebuilt from the dataset, so trade durability for import speed
+            self._conn.execute("PRAGMA synchronous = OFF")
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    self._conn.executemany(sql, chunk)
+                    self._conn.commit()
+                    imported += len(chunk)
+                    chunk = []
+            if chunk:
+                self._conn.executemany(sql, chunk)
+                imported += len(chunk)
+            # Building the ISRC index once after a bulk load is much faster than maintaining it per row
+            self._conn.execute("CREATE INDEX IF NOT EXISTS features_isrc ON features (isrc)")
+            self._conn.commit()
+            self._conn.execute("PRAGMA synchronous = FULL")
+        return imported
+
+    def lookup(self, tracks):
+        """Features for (track_id, isrc) pairs, as {track_id: {feature: value}}.
+
+        Tracks are matched by id first, then by ISRC for the ones not found.
+        """
+        tracks = list(tracks)
+        found = {}
+        with self._lock:
+            ids = [track_id for track_id, _ in tracks if track_id]
+            for start in range(0, len(ids), LOOKUP_CHUNK_SIZE):
+                chunk = ids[start:start + LOOKUP_CHUNK_SIZE]
+                cursor = self._conn.execute(
+                    f"SELECT track_id, {', '.join(FEATURE_COLUMNS)} FROM features "
+                    f"WHERE track_id IN ({', '.join('?' * len(chunk))})", chunk
+                )
+                for row in cursor:
+                    found[row[0]] = dict(zip(FEATURE_COLUMNS, row[1:]))
+
+            by_isrc = {}
+            for track_id, isrc in tracks:
+                if isrc and track_id not in found:
+                    by_isrc.setdefault(isrc.upper(), []).append(track_id)
+            isrcs = list(by_isrc)
+            for start in range(0, len(isrcs), LOOKUP_CHUNK_SIZE):
+                chunk = isrcs[start:start + LOOKUP_CHUNK_SIZE]
+                cursor = self._conn.execute(
+                    f"SELECT isrc, {', '.join(FEATURE_COLUMNS)} FROM features "
+                    f"WHERE isrc IN ({', '.join('?' * len(chunk))})", chunk
+                )
+                for row in cursor:
+                    for track_id in by_isrc.get(row[0], []):
+                        found[track_id] = dict(zip(FEATURE_COLUMNS, row[1:]))
+        return found
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM features").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _dataset_row(record, id_column, isrc_column):
+    track_id = normalize_track_id(str(record[id_column])) if record.get(id_column) else None
+    isrc = str(record[isrc_column]).strip().upper() if isrc_column and record.get(isrc_column) else None
+    if not track_id and not isrc:
+        return None
+    return (track_id, isrc) + tuple(_to_float(record.get(column)) for column in FEATURE_COLUMNS)
+
+
+def read_csv(path, id_column="id", isrc_column="isrc"):
+    """Yield store rows from a CSV file, one line at a time."""
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        missing = [c for c in FEATURE_COLUMNS if c not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"{path} is missing feature columns: {', '.join(missing)}")
+        if isrc_column not in reader.fieldnames:
+            isrc_column = None
+        for record in reader:
+            row = _dataset_row(record, id_column, isrc_column)
+            if row:
+                yield row
+
+
+def read_parquet(path, id_column="id", isrc_column="isrc", batch_size=IMPORT_CHUNK_SIZE):
+    """Yield store rows from a Parquet file, one record batch at a time."""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Importing Parquet needs pyarrow: pip install pyarrow")
+
+    parquet = pq.ParquetFile(path)
+    available = set(parquet.schema_arrow.names)
+    missing = [c for c in FEATURE_COLUMNS if c not in available]
+    if missing:
+        raise ValueError(f"{path} is missing feature columns: {', '.join(missing)}")
+    if isrc_column not in available:
+        isrc_column = None
+    columns = [c for c in [id_column, isrc_column] + FEATURE_COLUMNS if c in available]
+    for batch in parquet.iter_batches(batch_size=batch_size, columns=columns):
+        for record in batch.to_pylist():
+            row = _dataset_row(record, id_column, isrc_column)
+            if row:
+                yield row
+
+
+def import_dataset(store, path, id_column="id", isrc_column="isrc"):
+    """Import a CSV or Parquet dataset into the store; returns the number of rows."""
+    if path.lower().endswith((".parquet", ".pq")):
+        rows = read_parquet(path, id_column, isrc_column)
+    else:
+        rows = read_csv(path, id_column, isrc_column)
+    return store.import_rows(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage EchoMood's offline audio-features store")
+    parser.add_argument("--store", default=os.getenv("ECHOMOOD_FEATURE_STORE", DEFAULT_STORE_PATH),
+                        help="SQLite file to write to")
+    commands = parser.add_subparsers(dest="command", required=True)
+    importer = commands.add_parser("import", help="Import a CSV or Parquet track-features dataset")
+    importer.add_argument("dataset")
+    importer.add_argument("--id-column", default="id", help="Column holding Spotify track ids or URIs")
+    importer.add_argument("--isrc-column", default="isrc", help="Column holding ISRCs, if any")
+    commands.add_parser("stats", help="Show how many tracks the store holds")
+    args = parser.parse_args(argv)
+
+    store = FeatureStore(args.store)
+    try:
+        if args.command == "import":
+            started = time.perf_counter()
+            count = import_dataset(store, args.dataset, args.id_column, args.isrc_column)
+            print(f"Imported {count} rows into {args.store} in {time.perf_counter() - started:.1f}s")
+        print(f"{args.store}: {len(store)} tracks")
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+import heapq
+import random
+import threading
+from collections import Counter
+
+
+class GenreStats:
+    """Track-weighted genre counts, updated as tracks and artist genres arrive.
+
+    A genre's weight is the number of track credits by artists carrying it,
+    so a genre that fills half the library outranks one a single track
+    touches. Tracks and artist genres can arrive in any order. Genres are
+    kept ranked by weight, then name, as they change (weights only grow),
+    so top(n) is a slice rather than a sort.
+    """
+
+    def __init__(self):
+        self._artist_tracks = Counter()
+        self._artist_genres = {}
+        self._weights = {}
+        self._ranked = []
+        self._position = {}
+        self._tracks = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Picklable (e.g. when an idle session is spilled to disk); the lock is recreated
+        state = dict(self.__dict__)
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def add_tracks(self, items):
+        """Count a page of track items; returns the artist ids seen for the first time."""
+        new_artists = []
+        with self._lock:
+            for item in items:
+                track = item.get('track')
+                if not track or not track.get('id'):
+                    continue
+                self._tracks += 1
+                for artist in track.get('artists') or []:
+                    artist_id = artist.get('id')
+                    if not artist_id:
+                        continue
+                    if artist_id not in self._artist_tracks:
+                        new_artists.append(artist_id)
+                    self._artist_tracks[artist_id] += 1
+                    for genre in self._artist_genres.get(artist_id, ()):
+                        self._add_weight(genre, 1)
+        return new_artists
+
+    def add_artist_genres(self, artist_genres):
+        """Record resolved artists (artist id -> genres), crediting the tracks already counted."""
+        with self._lock:
+            for artist_id, genres in artist_genres.items():
+                if artist_id in self._artist_genres:
+                    continue
+                self._artist_genres[artist_id] = genres
+                weight = self._artist_tracks.get(artist_id, 0)
+                if weight:
+                    for genre in genres:
+                        self._add_weight(genre, weight)
+
+    def _add_weight(self, genre, weight):
+        # Called with the lock held: raise the weight, then move the genre up past any lighter ones
+        if genre not in self._position:
+            self._position[genre] = len(self._ranked)
+            self._ranked.append(genre)
+            self._weights[genre] = 0
+        self._weights[genre] += weight
+        key = (-self._weights[genre], genre)
+        i = self._position[genre]
+        # Equal weights rank by name, so the order doesn't depend on which arrived first
+        while i > 0 and (-self._weights[self._ranked[i - 1]], self._ranked[i - 1]) > key:
+            above = self._ranked[i - 1]
+            self._ranked[i - 1], self._ranked[i] = genre, above
+            self._position[above] = i
+            i -= 1
+        self._position[genre] = i
+
+    def top(self, n=30):
+        """The n heaviest genres, heaviest first."""
+        with self._lock:
+            return self._ranked[:n]
+
+    def top_weights(self, n=30):
+        with self._lock:
+            return [(genre, self._weights[genre]) for genre in self._ranked[:n]]
+
+    def sample_unresolved(self, k, rng=random):
+        """Priority-sample k unresolved artists, weighted by track count.
+
+        Each artist gets priority tracks / u for a uniform u and the k highest
+        are kept, so heavy artists are almost always in the sample. Returns
+        (artist_ids, threshold) where threshold is the (k+1)-th priority;
+        pass it to estimate_top once the sampled artists are resolved.
+        """
+        with self._lock:
+            heap = []
+            for artist_id, tracks in self._artist_tracks.items():
+                if artist_id in self._artist_genres:
+                    continue
+                entry = (tracks / (1.0 - rng.random()), artist_id)
+                if len(heap) <= k:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+        if len(heap) <= k:
+            # Everything fits in the sample, so the estimate is exact
+            return [artist_id for _, artist_id in heap], 0.0
+        threshold = heap[0][0]
+        return [artist_id for _, artist_id in heap[1:]], threshold
+
+    def estimate_top(self, sample, n=30, z=1.96, min_coverage=0.5):
+        """Estimated top-n genres from a resolved priority sample, and a confidence.
+
+        Resolved artists count exactly. Each sampled artist lighter than the
+        threshold also stands in for the unsampled ones: it counts as
+        threshold tracks (the priority-sampling estimator, unbiased for any
+        genre's total). Returns ([(genre, estimate, stderr)], confidence),
+        confidence being the share of listed genres whose z-interval clears
+        the best genre left out, scaled by the share of the sample's weight
+        that actually resolved. Sampled artists whose lookup failed are
+        unknowns, so below min_coverage there is no estimate: ([], 0.0).
+        """
+        artist_ids, threshold = sample
+        with self._lock:
+            estimates = dict(self._weights)
+            variances = Counter()
+            sampled_weight = resolved_weight = 0.0
+            for artist_id in artist_ids:
+                tracks = self._artist_tracks.get(artist_id, 0)
+                # The tracks this artist stands for in the estimate
+                weight = max(tracks, threshold)
+                sampled_weight += weight
+                if artist_id not in self._artist_genres:
+                    continue
+                resolved_weight += weight
+                genres = self._artist_genres[artist_id]
+                if not genres or tracks >= threshold:
+                    continue
+                for genre in genres:
+                    estimates[genre] = estimates.get(genre, 0) + threshold - tracks
+                    variances[genre] += threshold * (threshold - tracks)
+
+        coverage = resolved_weight / sampled_weight if sampled_weight else 1.0
+        if coverage < min_coverage:
+            return [], 0.0
+        ranked = sorted(estimates.items(), key=lambda item: item[1], reverse=True)
+        top = [(genre, estimate, variances[genre] ** 0.5) for genre, estimate in ranked[:n]]
+        if not top:
+            return [], coverage
+        cutoff = ranked[n][1] if len(ranked) > n else 0
+        confident = sum(1 for _, estimate, stderr in top if estimate - z * stderr > cutoff)
+        return top, coverage * confident / len(top)
+
+    def unresolved_artists(self):
+        with self._lock:
+            return [a for a in self._artist_tracks if a not in self._artist_genres]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tracks": self._tracks,
+                "artists": len(self._artist_tracks),
+                "resolved_artists": len(self._artist_genres),
+                "genres": len(self._ranked),
+            }
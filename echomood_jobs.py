@@ -0,0 +1,144 @@
+import itertools
+import threading
+import time
+import logging
+import uuid
+
+from echomood_workers import BACKGROUND, CancelToken, OperationCancelled, work_context
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class Job:
+    """A unit of background work whose progress and outcome a page can poll.
+
+    The job function receives the Job, reports progress through it and
+    passes job.cancel_token to the work it runs. The checkpoint dict survives
+    a failure or cancellation, so a new job given the same checkpoint
+    carries on from where this one stopped.
+    """
+
+    def __init__(self, name, session_id=None, checkpoint=None):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.session_id = session_id
+        self.checkpoint = checkpoint if checkpoint is not None else {}
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = "Waiting to start..."
+        self.result = None
+        self.error = None
+        self.cancel_token = CancelToken()
+        self.created = time.monotonic()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def report(self, progress, message=None):
+        """Record progress (0.0-1.0) and an optional status message."""
+        with self._lock:
+            self.progress = max(0.0, min(1.0, progress))
+            if message is not None:
+                self.message = message
+
+    def cancel(self, reason="Cancelled"):
+        self.cancel_token.cancel(reason)
+
+    def release(self):
+        """Drop the result and checkpoint once the session has taken them, keeping just the status."""
+        self.result = None
+        self.checkpoint = {}
+
+    @property
+    def done(self):
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "name": self.name,
+                "status": self.status,
+                "progress": self.progress,
+                "message": self.message,
+                "error": str(self.error) if self.error else None,
+            }
+
+
+class JobRunner:
+    """Runs jobs on their own threads, outside any Streamlit script run.
+
+    Jobs get dedicated threads rather than worker pool slots because they
+    wait on pool work themselves. They aren't capped: a job thread mostly
+    waits, and the worker pool and quota scheduler already bound its Spotify
+    work and share it fairly between sessions. Finished jobs are kept for
+    keep_seconds so the page that started one can pick up its result on a
+    later rerun, then release() it.
+    """
+
+    def __init__(self, keep_seconds=3600):
+        self.keep_seconds = keep_seconds
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+
+    def submit(self, name, fn, *args, session_id=None, checkpoint=None, **kwargs):
+        """Start fn(job, *args, **kwargs) in the background and return its Job."""
+        job = Job(name, session_id=session_id, checkpoint=checkpoint)
+        with self._lock:
+            self._purge()
+            self._jobs[job.id] = job
+        thread = threading.Thread(
+            target=self._run, args=(job, fn, args, kwargs), daemon=True,
+            name=f"echomood-job-{next(self._counter)}"
+        )
+        thread.start()
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = RUNNING
+        try:
+            job.cancel_token.raise_if_cancelled()
+            # Pool work and Spotify calls from this job count as the starting session's background work
+            with work_context(job.session_id, BACKGROUND):
+                job.result = fn(job, *args, **kwargs)
+            job.report(1.0)
+            job.status = DONE
+        except OperationCancelled as e:
+            job.error = e
+            job.status = CANCELLED
+        except Exception as e:
+            logger.warning(f"Job {job.name} ({job.id}) failed: {e}")
+            job.error = e
+            job.status = FAILED
+        finally:
+            job.finished = time.monotonic()
+
+    def get(self, job_id):
+        with self._lock:
+            self._purge()
+            return self._jobs.get(job_id)
+
+    def held(self, session_id):
+        """Results and checkpoints kept for session_id's jobs (memory the session hasn't taken yet)."""
+        with self._lock:
+            self._purge()
+            jobs = [job for job in self._jobs.values() if job.session_id == session_id]
+        return [value for job in jobs for value in (job.result, job.checkpoint) if value]
+
+    def _purge(self):
+        # Called with the lock held, from every lookup so expiry doesn't wait for the next submit
+        cutoff = time.monotonic() - self.keep_seconds
+        for job_id in [j.id for j in self._jobs.values() if j.finished is not None and j.finished < cutoff]:
+            del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            self._purge()
+            statuses = [job.status for job in self._jobs.values()]
+        return {status: statuses.count(status) for status in (QUEUED, RUNNING, DONE, FAILED, CANCELLED)}
@@ -0,0 +1,203 @@
+"""Multi-session load test for EchoMood.
+
+Drives N simulated users through the full flow (login, fetch, familiarity,
+genres, mood apply, playlist create) against a local fake Spotify server and
+reports throughput, per-stage latency percentiles, peak RSS and API calls per
+user. Runs headlessly:
+
+    python echomood_loadtest.py --users 50 --concurrency 10 --tracks 2000
+"""
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import resource
+import sys
+import time
+import warnings
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from echomood_fake_spotify import FakeLibrary, FakeSpotifyServer, make_client
+from echomood_workers import work_context
+
+STAGES = ["login", "fetch", "familiarity", "genres", "apply", "create"]
+DEFAULT_MOOD = {
+    "valence": 0.5,
+    "energy": 0.5,
+    "danceability": 0.5,
+    "acousticness": 0.5,
+    "instrumentalness": 0.5,
+    "liveness": 0.5
+}
+
+
+def _serve(num_tracks, latency, ready):
+    """Child process entry point: run the fake server until terminated."""
+    server = FakeSpotifyServer(FakeLibrary(num_tracks=num_tracks), latency=latency)
+    ready.put(server.prefix)
+    server.serve_forever()
+
+
+def start_fake_server(num_tracks, latency):
+    """Start the fake server in its own process so it doesn't count towards our RSS."""
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(num_tracks, latency, ready), daemon=True)
+    process.start()
+    return process, ready.get(timeout=120)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    # pct * n / 100 rather than pct / 100 * n, which can land just above a whole rank (10 / 100 * 30)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct * len(ordered) / 100) - 1))
+    return ordered[rank]
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def simulate_user(app, prefix, user_index, source, playlist_size):
+    """Run one user through the whole flow, returning seconds spent per stage."""
+    token = f"loadtest-user-{user_index}"
+    # Queue this user's pool work under its own session, like a real browser tab
+    with work_context(token):
+        return _user_flow(app, prefix, token, user_index, source, playlist_size)
+
+
+def _user_flow(app, prefix, token, user_index, source, playlist_size):
+    timings = {}
+
+    def timed(stage, fn):
+        started = time.perf_counter()
+        result = fn()
+        timings[stage] = time.perf_counter() - started
+        return result
+
+    def login():
+        client = make_client(prefix, token)
+        client.current_user()
+        return client
+
+    sp = timed("login", login)
+
+    if source == "playlist":
+        data = timed("fetch", lambda: app.get_spotify_data(
+            "Playlist", "https://open.spotify.com/playlist/loadtestplaylist", sp=sp))
+    else:
+        data = timed("fetch", lambda: app.get_spotify_data("Liked Songs", sp=sp))
+    if not data:
+        raise RuntimeError("fetch returned no tracks")
+
+    timed("familiarity", lambda: app.add_familiarity_scores(data, sp))
+    genres, _ = timed("genres", lambda: app.get_spotify_genres_from_tracks(data, sp))
+    filtered = timed("apply", lambda: app.apply_mood_filters(data, genres[:3], DEFAULT_MOOD, 0, sp))
+
+    chosen = (filtered or range(len(data)))[:playlist_size]
+    track_ids = [data[i]['track']['id'] for i in chosen]
+    timed("create", lambda: app.create_playlist(sp, f"Load test {user_index}", track_ids))
+    return timings
+
+
+def run(args):
+    # Imported late so the Streamlit bare-mode warnings can be silenced first
+    import streamlit.logger
+    streamlit.logger.set_log_level("error")
+    import echomood_app as app
+
+    server_process, prefix = start_fake_server(args.tracks, args.latency_ms / 1000)
+    try:
+        stage_timings = defaultdict(list)
+        failures = 0
+        started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            futures = [
+                pool.submit(simulate_user, app, prefix, i, args.source, args.playlist_size)
+                for i in range(args.users)
+            ]
+            for future in futures:
+                try:
+                    for stage, seconds in future.result().items():
+                        stage_timings[stage].append(seconds)
+                except Exception as e:
+                    failures += 1
+                    logging.getLogger(__name__).warning(f"Simulated user failed: {e}")
+
+        elapsed = time.perf_counter() - started
+        stats = requests.get(prefix.replace("/v1/", "/_stats"), timeout=10).json()
+    finally:
+        server_process.terminate()
+
+    calls_per_user = [count for token, count in stats["by_token"].items() if token.startswith("loadtest-user-")]
+    completed = args.users - failures
+    return {
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "tracks": args.tracks,
+        "source": args.source,
+        "latency_ms": args.latency_ms,
+        "completed": completed,
+        "failed": failures,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_users_per_s": round(completed / elapsed, 3) if elapsed else 0.0,
+        "stages_ms": {
+            stage: {
+                "p50": round(percentile(stage_timings[stage], 50) * 1000, 1),
+                "p95": round(percentile(stage_timings[stage], 95) * 1000, 1),
+                "p99": round(percentile(stage_timings[stage], 99) * 1000, 1),
+            }
+            for stage in STAGES if stage_timings[stage]
+        },
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "api_calls_per_user": round(sum(calls_per_user) / len(calls_per_user), 1) if calls_per_user else 0.0,
+        "api_calls_by_endpoint": stats["by_endpoint"],
+        "worker_pool": app.get_worker_pool().stats(),
+    }
+
+
+def print_report(report):
+    print(f"Users: {report['completed']}/{report['users']} completed "
+          f"({report['failed']} failed) at concurrency {report['concurrency']}")
+    print(f"Elapsed: {report['elapsed_s']}s  Throughput: {report['throughput_users_per_s']} users/s")
+    print(f"Peak RSS: {report['peak_rss_mb']} MB  API calls per user: {report['api_calls_per_user']}")
+    print(f"\n{'stage':<12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, values in report["stages_ms"].items():
+        print(f"{stage:<12}{values['p50']:>10}{values['p95']:>10}{values['p99']:>10}")
+    pool = report["worker_pool"]["interactive"]
+    print(f"\nWorker pool queue wait: p50 {pool['wait_p50_ms']} ms, p95 {pool['wait_p95_ms']} ms, "
+          f"max {pool['wait_max_ms']} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test EchoMood against a fake Spotify API")
+    parser.add_argument("--users", type=int, default=20, help="Number of simulated users")
+    parser.add_argument("--concurrency", type=int, default=10, help="Users running at the same time")
+    parser.add_argument("--tracks", type=int, default=1000, help="Tracks in the fake library")
+    parser.add_argument("--source", choices=["liked", "playlist"], default="liked")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Simulated API latency per request")
+    parser.add_argument("--playlist-size", type=int, default=20)
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args(argv)
+
+    warnings.simplefilter("ignore", DeprecationWarning)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
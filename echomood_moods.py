@@ -0,0 +1,89 @@
+import numpy as np
+
+# Words for a cluster that sits below / above the library's average on a dimension
+DESCRIPTORS = {
+    "valence": ("Melancholy", "Upbeat"),
+    "energy": ("Calm", "Energetic"),
+    "danceability": ("Laid-back", "Danceable"),
+    "acousticness": ("Electric", "Acoustic"),
+    "instrumentalness": ("Vocal", "Instrumental"),
+    "liveness": ("Studio", "Live"),
+}
+
+
+def _assign(points, centroids):
+    # Index of the nearest centroid for every point, via |x|^2 - 2x.c + |c|^2
+    scores = (centroids ** 2).sum(axis=1) - 2.0 * points @ centroids.T
+    return np.argmin(scores, axis=1)
+
+
+def _cluster_sums(points, labels, k):
+    # Per-cluster sums of points (bincount per dimension is much faster than np.add.at)
+    columns = [np.bincount(labels, weights=points[:, j], minlength=k) for j in range(points.shape[1])]
+    return np.stack(columns, axis=1)
+
+
+def _init_centroids(points, k, rng, sample_size=5000):
+    # k-means++ seeding on a sample, so a huge library doesn't pay O(n k) per seed
+    if len(points) > sample_size:
+        points = points[rng.choice(len(points), sample_size, replace=False)]
+    centroids = [points[rng.integers(len(points))]]
+    nearest = ((points - centroids[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        total = nearest.sum()
+        if total <= 0:
+            centroids.append(points[rng.integers(len(points))])
+        else:
+            centroids.append(points[rng.choice(len(points), p=nearest / total)])
+        nearest = np.minimum(nearest, ((points - centroids[-1]) ** 2).sum(axis=1))
+    return np.array(centroids, dtype=float)
+
+
+def kmeans(points, k, batch_size=None, max_iter=50, tol=1e-4, seed=0):
+    """Cluster an (n x d) array into k groups; returns (centroids, labels).
+
+    Lloyd's algorithm over every point, or mini-batch k-means when
+    batch_size is set and smaller than n: each step assigns a random batch
+    and moves centroids towards it by a per-centroid running mean.
+    """
+    points = np.asarray(points, dtype=float)
+    rng = np.random.default_rng(seed)
+    k = min(k, len(points))
+    centroids = _init_centroids(points, k, rng)
+
+    if batch_size and batch_size < len(points):
+        counts = np.zeros(k)
+        for _ in range(max_iter):
+            batch = points[rng.integers(0, len(points), batch_size)]
+            labels = _assign(batch, centroids)
+            sizes = np.bincount(labels, minlength=k)
+            sums = _cluster_sums(batch, labels, k)
+            moved = sizes > 0
+            counts[moved] += sizes[moved]
+            updated = centroids.copy()
+            updated[moved] += (sums[moved] - sizes[moved, None] * centroids[moved]) / counts[moved, None]
+            shift = np.abs(updated - centroids).max()
+            centroids = updated
+            if shift < tol:
+                break
+    else:
+        for _ in range(max_iter):
+            labels = _assign(points, centroids)
+            sizes = np.bincount(labels, minlength=k)
+            sums = _cluster_sums(points, labels, k)
+            updated = centroids.copy()
+            # An empty cluster keeps its old centroid
+            updated[sizes > 0] = sums[sizes > 0] / sizes[sizes > 0, None]
+            shift = np.abs(updated - centroids).max()
+            centroids = updated
+            if shift < tol:
+                break
+    return centroids, _assign(points, centroids)
+
+
+def name_cluster(centroid, average, features, words=2):
+    """Name a centroid by the dimensions where it differs most from the library average."""
+    offsets = [(abs(centroid[i] - average[i]), feature, int(centroid[i] > average[i]))
+               for i, feature in enumerate(features) if feature in DESCRIPTORS]
+    offsets.sort(reverse=True)
+    return " & ".join(DESCRIPTORS[feature][above] for _, feature, above in offsets[:words]) or "Mixed"
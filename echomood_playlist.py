@@ -0,0 +1,151 @@
+import math
+
+import numpy as np
+
+
+def _ranked(scores, window):
+    # Positions in (score, position) order. Only the best window are found by partition and
+    # sorted up front; the rest are sorted if the caller keeps going past them.
+    window = min(len(scores), window)
+    if not window:
+        return
+    threshold = np.partition(scores, window - 1)[window - 1]
+    for part in (np.flatnonzero(scores <= threshold), np.flatnonzero(scores > threshold)):
+        yield from part[np.argsort(scores[part], kind="stable")].tolist()
+
+
+def select_diverse(scores, k, artists_of, album_of, genres_of=None, max_per_artist=2, max_per_album=2,
+                   max_genre_share=0.5):
+    """Pick the k best-scoring candidates (lowest score first) under diversity caps.
+
+    scores[p] is candidate p's score; artists_of(p), album_of(p) and
+    genres_of(p) give the ids it counts against. A candidate is skipped
+    while any of its artists has max_per_artist picks, its album has
+    max_per_album, or any of its genres already fills max_genre_share of
+    the playlist (None turns a cap off).
+
+    The best max(4k, 64) candidates are partitioned out in O(n) and sorted,
+    so the cost is O(n + k log k) unless the caps skip most of them. Tight
+    caps can make every candidate worth checking; only then are the rest
+    sorted too. If the caps leave fewer than k, the best skipped candidates
+    fill the rest, so the result is only short when there are fewer than k
+    candidates. Returns candidate positions in score order.
+    """
+    scores = np.asarray(scores, dtype=float)
+    genre_cap = math.ceil(max_genre_share * k) if max_genre_share is not None and genres_of else None
+
+    chosen = []
+    skipped = []
+    artist_counts = {}
+    album_counts = {}
+    genre_counts = {}
+    for p in _ranked(scores, max(4 * k, 64)):
+        if len(chosen) >= k:
+            break
+        artists = artists_of(p)
+        album = album_of(p)
+        genres = genres_of(p) if genre_cap is not None else ()
+        if (max_per_artist is not None and any(artist_counts.get(a, 0) >= max_per_artist for a in artists)) \
+                or (max_per_album is not None and album and album_counts.get(album, 0) >= max_per_album) \
+                or any(genre_counts.get(g, 0) >= genre_cap for g in genres):
+            skipped.append(p)
+            continue
+        chosen.append(p)
+        for a in artists:
+            artist_counts[a] = artist_counts.get(a, 0) + 1
+        if album:
+            album_counts[album] = album_counts.get(album, 0) + 1
+        for g in genres:
+            genre_counts[g] = genre_counts.get(g, 0) + 1
+
+    if len(chosen) < k:
+        # Every candidate was checked; relax the caps rather than come up short, best skipped first
+        chosen = sorted(chosen + skipped[:k - len(chosen)], key=lambda p: (scores[p], p))
+    return chosen
+
+
+ARCS = ("smooth", "build up", "wind down", "peak")
+
+
+def _path_from(distances, nodes, start):
+    # Greedy nearest-neighbour walk over nodes (positions into distances), starting at start
+    remaining = np.zeros(len(distances), dtype=bool)
+    remaining[nodes] = True
+    path = [start]
+    remaining[start] = False
+    for _ in range(len(nodes) - 1):
+        row = np.where(remaining, distances[path[-1]], np.inf)
+        path.append(int(np.argmin(row)))
+        remaining[path[-1]] = False
+    return path
+
+
+def _two_opt(distances, path, max_passes=3):
+    # Reverse path[i..j] while that shortens the open path; path[0] stays first
+    path = np.array(path)
+    n = len(path)
+    if n < 4:
+        return path.tolist()
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, n - 1):
+            before, first = path[i - 1], path[i]
+            ends = path[i + 1:]
+            nexts = np.append(path[i + 2:], -1)
+            # Gain of reversing path[i..j] for every j > i at once (the last j has no edge after it)
+            old = distances[before, first] + np.where(nexts >= 0, distances[ends, nexts], 0.0)
+            new = distances[before, ends] + np.where(nexts >= 0, distances[first, nexts], 0.0)
+            delta = new - old
+            j = int(np.argmin(delta))
+            if delta[j] < -1e-9:
+                path[i:i + j + 2] = path[i:i + j + 2][::-1]
+                improved = True
+        if not improved:
+            break
+    return path.tolist()
+
+
+def sequence_tracks(vectors, arc="smooth", energy_column=0, window=None, max_passes=3):
+    """Order tracks so consecutive ones are close in feature space.
+
+    vectors is an (n tracks x features) array scaled to comparable ranges,
+    with the energy used by the arcs in energy_column. "smooth" starts at
+    the calmest track and walks to the nearest unplayed one, then improves
+    the path with 2-opt (an approximate travelling-salesman path). The arcs
+    sort by energy into windows of about sqrt(n) tracks and order each
+    window smoothly: "build up" rises, "wind down" falls, "peak" rises then
+    falls. Returns positions into vectors in play order.
+    """
+    vectors = np.asarray(vectors, dtype=float)
+    n = len(vectors)
+    if n < 3:
+        return [int(p) for p in np.argsort(vectors[:, energy_column], kind="stable")] if n else []
+    distances = np.sqrt(((vectors[:, None, :] - vectors[None, :, :]) ** 2).sum(axis=2))
+    energy = vectors[:, energy_column]
+
+    if arc == "smooth":
+        start = int(np.argmin(energy))
+        return _two_opt(distances, _path_from(distances, np.arange(n), start), max_passes)
+
+    def rising(nodes):
+        # Energy windows in rising order, each walked smoothly from where the last one ended
+        nodes = nodes[np.argsort(energy[nodes], kind="stable")]
+        size = window or max(4, int(math.sqrt(len(nodes))))
+        order = []
+        for start in range(0, len(nodes), size):
+            group = nodes[start:start + size]
+            if order:
+                first = group[int(np.argmin(distances[order[-1], group]))]
+            else:
+                first = group[0]
+            order += _two_opt(distances, _path_from(distances, group, first), max_passes)
+        return order
+
+    ranked = np.argsort(energy, kind="stable")
+    if arc == "build up":
+        return rising(ranked)
+    if arc == "wind down":
+        return rising(ranked)[::-1]
+    if arc == "peak":
+        return rising(ranked[0::2]) + rising(ranked[1::2])[::-1]
+    raise ValueError(f"Unknown arc {arc!r} (choose from {', '.join(ARCS)})")
@@ -0,0 +1,173 @@
+import threading
+import time
+import logging
+from collections import OrderedDict, deque, Counter
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from echomood_workers import INTERACTIVE, BACKGROUND, current_work_context
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaScheduler:
+    """Process-wide budget of Spotify requests per rolling window, granted fairly.
+
+    Every session shares one client id and so one rate limit. Callers ask
+    for a grant before each request and wait while limit requests have
+    been granted in the last window seconds. Waiting callers are served
+    like the worker pool serves tasks: interactive before background (with
+    every background_every-th grant reserved for background so it keeps
+    moving), and round robin across sessions within a lane, so one big
+    import can't hold the quota while another session's Apply waits.
+    A 429 from Spotify pauses all grants for its Retry-After.
+    """
+
+    def __init__(self, limit, window=30.0, background_every=5):
+        self.limit = limit
+        self.window = window
+        self.background_every = background_every
+        self._granted = deque()
+        self._lanes = {INTERACTIVE: OrderedDict(), BACKGROUND: OrderedDict()}
+        self._picks = 0
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+        self._waits = {INTERACTIVE: deque(maxlen=1000), BACKGROUND: deque(maxlen=1000)}
+        self._by_session = deque()
+        self.total_granted = 0
+        self.throttled = 0
+
+    def _expire(self, now):
+        # Called with the lock held
+        while self._granted and self._granted[0] <= now - self.window:
+            self._granted.popleft()
+        while self._by_session and self._by_session[0][0] <= now - self.window:
+            self._by_session.popleft()
+
+    def _head(self):
+        # Called with the lock held: the waiter the next grant belongs to
+        interactive, background = self._lanes[INTERACTIVE], self._lanes[BACKGROUND]
+        if background and (not interactive or (self._picks + 1) % self.background_every == 0):
+            lane = background
+        else:
+            lane = interactive
+        session_id, waiters = next(iter(lane.items()))
+        return lane, session_id, waiters
+
+    def acquire(self, session_id=None, priority=INTERACTIVE):
+        """Block until a request may be sent; returns the seconds spent waiting."""
+        lane_name = priority if priority in self._lanes else INTERACTIVE
+        waiter = object()
+        started = time.monotonic()
+        with self._cond:
+            lane = self._lanes[lane_name]
+            lane.setdefault(session_id, deque()).append(waiter)
+            while True:
+                now = time.monotonic()
+                self._expire(now)
+                head_lane, head_session, head_waiters = self._head()
+                if head_waiters[0] is waiter:
+                    if now < self._paused_until:
+                        self._cond.wait(self._paused_until - now)
+                        continue
+                    if len(self._granted) < self.limit:
+                        break
+                    # Wait until the oldest grant leaves the window
+                    self._cond.wait(self._granted[0] + self.window - now)
+                    continue
+                self._cond.wait(1.0)
+
+            # Grant, then move this session to the back of its lane (round robin)
+            head_waiters.popleft()
+            del head_lane[head_session]
+            if head_waiters:
+                head_lane[head_session] = head_waiters
+            self._picks += 1
+            self._granted.append(now)
+            self._by_session.append((now, session_id))
+            self.total_granted += 1
+            waited = now - started
+            self._waits[lane_name].append(waited)
+            self._cond.notify_all()
+        return waited
+
+    def pause(self, seconds):
+        """Hold every grant for seconds, e.g. after Spotify answered 429."""
+        with self._cond:
+            self.throttled += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def stats(self, session_id=None):
+        """Live quota usage: grants in the current window, waiters per lane and the busiest sessions.
+
+        Sessions are anonymous in the busiest list, except that session_id's
+        own entry is labelled "you".
+        """
+        with self._cond:
+            now = time.monotonic()
+            self._expire(now)
+            stats = {
+                "used": len(self._granted),
+                "limit": self.limit,
+                "window_s": self.window,
+                "utilization": round(len(self._granted) / self.limit, 2) if self.limit else 0.0,
+                "paused_s": round(max(0.0, self._paused_until - now), 1),
+                "total_granted": self.total_granted,
+                "throttled": self.throttled,
+                "top_sessions": [
+                    {"session": "you" if session_id is not None and sid == session_id else "other",
+                     "requests": count}
+                    for sid, count in Counter(s for _, s in self._by_session).most_common(5)
+                ],
+            }
+            for lane in (INTERACTIVE, BACKGROUND):
+                waits = sorted(self._waits[lane])
+                stats[lane] = {
+                    "waiting": sum(len(w) for w in self._lanes[lane].values()),
+                    "sessions_waiting": len(self._lanes[lane]),
+                    "wait_p50_ms": round(waits[len(waits) // 2] * 1000, 1) if waits else 0.0,
+                    "wait_p95_ms": round(waits[int(len(waits) * 0.95)] * 1000, 1) if waits else 0.0,
+                }
+        return stats
+
+
+class QuotaSession(requests.Session):
+    """requests session for spotipy that takes a QuotaScheduler grant before every request.
+
+    Requests are attributed to the current work context (session and
+    priority lane). A 429 pauses the scheduler for its Retry-After and the
+    request is retried through the scheduler, up to retries times; server
+    errors are retried by the adapter like spotipy's own session does.
+    """
+
+    def __init__(self, scheduler, retries=3, backoff_factor=0.3):
+        super().__init__()
+        self.scheduler = scheduler
+        self.retries = retries
+        retry = Retry(
+            total=retries, connect=None, read=False, status=retries,
+            allowed_methods=frozenset(["GET", "POST", "PUT", "DELETE"]),
+            backoff_factor=backoff_factor, status_forcelist=(500, 502, 503, 504),
+            # Otherwise urllib3 would sleep through a 429 itself instead of pausing every session
+            respect_retry_after_header=False,
+        )
+        self.mount("https://", HTTPAdapter(max_retries=retry))
+        self.mount("http://", HTTPAdapter(max_retries=retry))
+
+    def request(self, method, url, *args, **kwargs):
+        session_id, priority = current_work_context()
+        for attempt in range(self.retries + 1):
+            self.scheduler.acquire(session_id, priority)
+            response = super().request(method, url, *args, **kwargs)
+            if response.status_code != 429 or attempt == self.retries:
+                return response
+            try:
+                retry_after = float(response.headers.get("Retry-After", 1))
+            except ValueError:
+                retry_after = 1.0
+            logger.warning(f"Spotify rate limit hit, pausing all requests for {retry_after}s")
+            self.scheduler.pause(retry_after)
+        return response
@@ -0,0 +1,298 @@
+import atexit
+import gc
+import os
+import pickle
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import logging
+import zlib
+from array import array
+
+logger = logging.getLogger(__name__)
+
+SPILL_SUFFIX = ".session.z"
+SPILL_DIR_PREFIX = "process-"
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # e.g. EPERM: the pid belongs to another user's process
+        return True
+    return True
+
+
+def _newest_mtime(path):
+    newest = os.path.getmtime(path)
+    for entry in os.scandir(path):
+        try:
+            newest = max(newest, entry.stat().st_mtime)
+        except OSError:
+            pass
+    return newest
+
+
+def remove_orphaned_spill_dirs(spill_dir, max_age_seconds):
+    """Delete spill directories left by processes that died without cleaning up; returns how many.
+
+    A directory goes if it was made on this host by a pid that is no longer
+    running, or if nothing in it has changed for max_age_seconds (which
+    covers other hosts sharing spill_dir and reused pids).
+    """
+    host = socket.gethostname()
+    removed = 0
+    for entry in os.scandir(spill_dir):
+        if not entry.name.startswith(SPILL_DIR_PREFIX) or not entry.is_dir(follow_symlinks=False):
+            continue
+        try:
+            # process-<host>-<pid>-<random>; the host name may itself contain dashes
+            owner, pid, _ = entry.name[len(SPILL_DIR_PREFIX):].rsplit("-", 2)
+            pid = int(pid)
+        except ValueError:
+            continue
+        try:
+            dead = owner == host and pid != os.getpid() and not _process_alive(pid)
+            if dead or time.time() - _newest_mtime(entry.path) >= max_age_seconds:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def estimate_bytes(value, depth=4, sample=20):
+    """Rough in-memory size of value, sampling large containers instead of walking them."""
+    size = sys.getsizeof(value)
+    if depth == 0:
+        return size
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, int):
+        return size + nbytes
+    if isinstance(value, array):
+        return size
+    if isinstance(value, dict):
+        items = list(value.items()) if len(value) <= sample else [
+            item for _, item in zip(range(sample), value.items())
+        ]
+        # String keys are mostly shared (interned field names), so only values are counted for them
+        per_item = sum((0 if isinstance(k, str) else estimate_bytes(k, depth - 1)) + estimate_bytes(v, depth - 1)
+                       for k, v in items)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        items = list(value) if len(value) <= sample else [item for _, item in zip(range(sample), value)]
+        per_item = sum(estimate_bytes(item, depth - 1) for item in items)
+    elif hasattr(value, "__dict__"):
+        return size + estimate_bytes(vars(value), depth - 1)
+    else:
+        return size
+    return size + (per_item * len(value) // len(items) if items else 0)
+
+
+class SessionMemoryManager:
+    """Spills idle sessions' library data to disk and reloads it when they come back.
+
+    Each script run calls begin() and end() with its session's state
+    mapping and, if other threads also use that mapping, the lock they hold
+    while doing so; spilling and restoring change the state only under it.
+    A session that is not running, has no background job and has
+    been idle for idle_seconds has its spill keys pickled (zlib-compressed)
+    into spill_dir and reset to defaults. Sessions idle for at least
+    min_idle_seconds are spilled least recently used first while the
+    estimated resident total is over budget_bytes. begin() restores a
+    spilled session before its page renders.
+
+    Files go to a subdirectory of spill_dir that belongs to this manager, so
+    several processes or replicas can share spill_dir. It is removed when the
+    process exits, or by the next manager to start if the process was killed
+    (see remove_orphaned_spill_dirs). A closed tab's state is kept until it is
+    spilled like any idle one; sessions idle for expire_seconds are forgotten
+    and their files deleted.
+    held_bytes(session_id), if given, estimates memory kept for a session
+    outside its state (e.g. finished jobs' results). It counts towards the
+    budget but spilling can't free it.
+    """
+
+    def __init__(self, spill_dir, keys, defaults, budget_bytes, idle_seconds=900, min_idle_seconds=30,
+                 expire_seconds=86400, held_bytes=None):
+        self.keys = tuple(keys)
+        self.defaults = defaults
+        self.budget_bytes = budget_bytes
+        self.idle_seconds = idle_seconds
+        self.min_idle_seconds = min_idle_seconds
+        self.expire_seconds = expire_seconds
+        self.held_bytes = held_bytes
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._enforcing = False
+        self.spills = 0
+        self.restores = 0
+        os.makedirs(spill_dir, exist_ok=True)
+        # Other processes may be spilling into spill_dir too, so only dead or long-idle ones' directories are cleaned
+        removed = remove_orphaned_spill_dirs(spill_dir, expire_seconds)
+        if removed:
+            logger.info(f"Removed {removed} orphaned spill directories from {spill_dir}")
+        self.spill_dir = tempfile.mkdtemp(
+            prefix=f"{SPILL_DIR_PREFIX}{socket.gethostname()}-{os.getpid()}-", dir=spill_dir
+        )
+        atexit.register(shutil.rmtree, self.spill_dir, ignore_errors=True)
+
+    def _path(self, session_id):
+        return os.path.join(self.spill_dir, session_id + SPILL_SUFFIX)
+
+    def begin(self, session_id, state, state_lock=None):
+        """Mark session_id as running, restoring its spilled data into state first.
+
+        Returns False if spilled data could not be restored (state then
+        holds the defaults).
+        """
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = self._sessions[session_id] = {
+                    "lock": threading.Lock(), "state": None, "state_lock": None, "running": 0, "busy": False,
+                    "spilled": False, "bytes": 0, "held": 0, "last_active": time.monotonic(),
+                }
+        with entry["lock"]:
+            entry["state"] = state
+            entry["state_lock"] = state_lock or threading.RLock()
+            entry["running"] += 1
+            entry["last_active"] = time.monotonic()
+            if not entry["spilled"]:
+                return True
+            entry["spilled"] = False
+            try:
+                with open(self._path(session_id), "rb") as f:
+                    data = zlib.decompress(f.read())
+                # Unpickling a big library creates millions of objects; pausing GC makes it several times faster
+                gc_was_enabled = gc.isenabled()
+                gc.disable()
+                try:
+                    payload = pickle.loads(data)
+                finally:
+                    if gc_was_enabled:
+                        gc.enable()
+                with entry["state_lock"]:
+                    for key, value in payload.items():
+                        state[key] = value
+                self.restores += 1
+                return True
+            except Exception as e:
+                logger.warning(f"Failed to restore spilled session {session_id}: {e}")
+                return False
+            finally:
+                try:
+                    os.remove(self._path(session_id))
+                except OSError:
+                    pass
+
+    def end(self, session_id, busy=False):
+        """Mark a run finished; busy sessions (e.g. with a job running) are never spilled."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+        if entry is None:
+            return
+        with entry["lock"]:
+            entry["running"] = max(0, entry["running"] - 1)
+            entry["busy"] = busy
+            entry["last_active"] = time.monotonic()
+            state = entry["state"]
+            if state is not None:
+                entry["bytes"] = sum(estimate_bytes(state[key]) for key in self.keys if key in state)
+        self._enforce_in_background()
+
+    def _enforce_in_background(self):
+        with self._lock:
+            if self._enforcing:
+                return
+            self._enforcing = True
+        threading.Thread(target=self.enforce, daemon=True, name="echomood-session-spill").start()
+
+    def enforce(self):
+        """Spill sessions idle past idle_seconds, then least recently used ones while over budget."""
+        try:
+            now = time.monotonic()
+            with self._lock:
+                # Forget sessions nobody has come back to (most likely closed tabs)
+                for session_id in [s for s, e in self._sessions.items()
+                                   if now - e["last_active"] >= self.expire_seconds and not e["running"]]:
+                    entry = self._sessions.pop(session_id)
+                    if entry["spilled"]:
+                        try:
+                            os.remove(self._path(session_id))
+                        except OSError:
+                            pass
+                entries = list(self._sessions.items())
+                resident = [(e["last_active"], s, e) for s, e in entries if not e["spilled"]]
+            if self.held_bytes is not None:
+                for session_id, entry in entries:
+                    try:
+                        entry["held"] = self.held_bytes(session_id)
+                    except Exception as e:
+                        logger.warning(f"Could not estimate memory held for session {session_id}: {e}")
+            resident.sort()
+            total = sum(e["bytes"] for _, _, e in resident) + sum(e["held"] for _, e in entries)
+            for last_active, session_id, entry in resident:
+                idle = now - last_active
+                if idle >= self.idle_seconds or (total > self.budget_bytes and idle >= self.min_idle_seconds):
+                    if self._spill(session_id, entry):
+                        total -= entry["bytes"]
+        finally:
+            with self._lock:
+                self._enforcing = False
+
+    def _spill(self, session_id, entry):
+        with entry["lock"]:
+            state = entry["state"]
+            if state is None or entry["running"] or entry["busy"] or entry["spilled"]:
+                return False
+            # This runs on the spill thread, while Streamlit may be preparing the session's next run
+            with entry["state_lock"]:
+                payload = {key: state[key] for key in self.keys if key in state}
+            path = self._path(session_id)
+            try:
+                data = zlib.compress(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL), 1)
+                # Another process may have removed the directory after it sat empty for expire_seconds
+                os.makedirs(self.spill_dir, exist_ok=True)
+                with open(path + ".tmp", "wb") as f:
+                    f.write(data)
+                os.replace(path + ".tmp", path)
+            except Exception as e:
+                logger.warning(f"Failed to spill session {session_id}: {e}")
+                return False
+            with entry["state_lock"]:
+                # Data that changed while it was being written stays resident
+                unchanged = all(key in state and state[key] is value for key, value in payload.items())
+                if unchanged:
+                    for key, value in self.defaults().items():
+                        if key in payload:
+                            state[key] = value
+            if not unchanged:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                return False
+            entry["spilled"] = True
+            self.spills += 1
+            return True
+
+    def stats(self):
+        with self._lock:
+            entries = list(self._sessions.values())
+        resident = [e for e in entries if not e["spilled"]]
+        return {
+            "sessions": len(entries),
+            "resident": len(resident),
+            "spilled": len(entries) - len(resident),
+            "resident_mb": round(sum(e["bytes"] for e in resident) / 2 ** 20, 1),
+            "job_held_mb": round(sum(e["held"] for e in entries) / 2 ** 20, 1),
+            "budget_mb": round(self.budget_bytes / 2 ** 20, 1),
+            "spills": self.spills,
+            "restores": self.restores,
+        }
@@ -0,0 +1,64 @@
+import math
+
+import numpy as np
+
+from echomood_moods import kmeans
+
+
+class SimilarityIndex:
+    """Approximate nearest-neighbour index over track feature vectors (IVF).
+
+    k-means splits the tracks into about sqrt(n) lists. A query scans only
+    the n_probe lists whose centroids are nearest its vector. The closest
+    candidates by feature distance are then reranked with a genre-overlap
+    bonus. ids[i] names row i of the matrix (e.g. its music_data index).
+    """
+
+    def __init__(self, ids, matrix, n_lists=None, batch_size=5000, seed=0):
+        self.ids = np.asarray(ids)
+        self.matrix = np.asarray(matrix, dtype=float)
+        self._row = {int(item_id): row for row, item_id in enumerate(self.ids)}
+        n_lists = n_lists or max(1, int(math.sqrt(len(self.matrix))))
+        if len(self.matrix) <= 4 * batch_size:
+            batch_size = None
+        self.centroids, labels = kmeans(self.matrix, n_lists, batch_size=batch_size, max_iter=20, seed=seed)
+        # Rows grouped by list, so each list is one contiguous slice
+        self._order = np.argsort(labels, kind="stable")
+        self._starts = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=len(self.centroids)))])
+
+    def __contains__(self, item_id):
+        return item_id in self._row
+
+    def __len__(self):
+        return len(self.ids)
+
+    def query(self, item_id, k=10, genres_of=None, genre_weight=0.3, n_probe=8, rerank=200):
+        """The k items most like item_id, as [(id, feature distance, shared genres)].
+
+        Score is feature distance plus genre_weight * (1 - Jaccard overlap of
+        genres_of(id)), so tracks that also share genres rank higher.
+        """
+        row = self._row[item_id]
+        vector = self.matrix[row]
+        probes = np.argsort(((self.centroids - vector) ** 2).sum(axis=1))[:n_probe]
+        rows = np.concatenate([self._order[self._starts[p]:self._starts[p + 1]] for p in probes])
+        rows = rows[rows != row]
+        distances = np.sqrt(((self.matrix[rows] - vector) ** 2).sum(axis=1))
+        if len(rows) > rerank:
+            nearest = np.argpartition(distances, rerank)[:rerank]
+            rows, distances = rows[nearest], distances[nearest]
+
+        seed_genres = set(genres_of(item_id)) if genres_of else set()
+        scored = []
+        for r, distance in zip(rows.tolist(), distances.tolist()):
+            item = int(self.ids[r])
+            shared = ()
+            score = distance
+            if genres_of:
+                genres = set(genres_of(item))
+                union = seed_genres | genres
+                shared = tuple(sorted(seed_genres & genres))
+                score += genre_weight * (1.0 - len(shared) / len(union) if union else 1.0)
+            scored.append((score, item, distance, shared))
+        scored.sort()
+        return [(item, distance, shared) for _, item, distance, shared in scored[:k]]
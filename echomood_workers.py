@@ -0,0 +1,193 @@
+import contextvars
+import threading
+import time
+import logging
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Priority lanes: interactive work (Apply, playlist creation) runs ahead of background prefetch
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+_work_context = contextvars.ContextVar("echomood_work_context", default=(None, INTERACTIVE))
+
+
+@contextmanager
+def work_context(session_id=None, priority=INTERACTIVE):
+    """Attribute pool work submitted inside this block to a session and priority lane."""
+    token = _work_context.set((session_id, priority))
+    try:
+        yield
+    finally:
+        _work_context.reset(token)
+
+
+def current_work_context():
+    """(session_id, priority) for work submitted from the current thread."""
+    return _work_context.get()
+
+
+class OperationCancelled(Exception):
+    """Raised by work that stopped because its CancelToken was cancelled."""
+
+
+class CancelToken:
+    """Cooperative cancellation flag passed from a page run to the work it starts.
+
+    Long operations check it between batches; queued batches are dropped
+    and in-flight requests are left to finish.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason = None
+
+    def cancel(self, reason="Cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise OperationCancelled(self.reason)
+
+    def wait(self, timeout):
+        """Sleep up to timeout seconds, returning True early if cancelled."""
+        return self._event.wait(timeout)
+
+
+class _Task:
+    __slots__ = ("future", "fn", "args", "kwargs", "session_id", "lane", "enqueued")
+
+    def __init__(self, future, fn, args, kwargs, session_id, lane):
+        self.future = future
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.session_id = session_id
+        self.lane = lane
+        self.enqueued = time.monotonic()
+
+
+class FairWorkerPool:
+    """Process-wide bounded thread pool with per-session fair queuing.
+
+    Each lane keeps one FIFO per session and workers take one task from each
+    waiting session in turn, so one session's thousand batches can't starve
+    another session's ten. The interactive lane is served first, with a small
+    share of picks reserved for background work so it still makes progress.
+
+    Tasks must not block waiting on other tasks from the same pool.
+    """
+
+    def __init__(self, max_workers=16, background_every=5, thread_name_prefix="echomood-worker"):
+        self.max_workers = max_workers
+        self.background_every = background_every
+        self.thread_name_prefix = thread_name_prefix
+        self._lanes = {INTERACTIVE: OrderedDict(), BACKGROUND: OrderedDict()}
+        self._depth = {INTERACTIVE: 0, BACKGROUND: 0}
+        self._waits = {INTERACTIVE: deque(maxlen=1000), BACKGROUND: deque(maxlen=1000)}
+        self._completed = 0
+        self._picks = 0
+        self._idle = 0
+        self._active = 0
+        self._threads = []
+        self._shutdown = False
+        self._cond = threading.Condition()
+
+    def submit(self, fn, *args, session_id=None, priority=INTERACTIVE, **kwargs):
+        lane = priority if priority in self._lanes else INTERACTIVE
+        future = Future()
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("Worker pool has been shut down")
+            queue = self._lanes[lane].setdefault(session_id, deque())
+            queue.append(_Task(future, fn, args, kwargs, session_id, lane))
+            self._depth[lane] += 1
+            # Idle workers may already have been woken for earlier tasks, so grow whenever they're outnumbered
+            if self._depth[INTERACTIVE] + self._depth[BACKGROUND] > self._idle \
+                    and len(self._threads) < self.max_workers:
+                thread = threading.Thread(
+                    target=self._worker, daemon=True,
+                    name=f"{self.thread_name_prefix}-{len(self._threads)}"
+                )
+                self._threads.append(thread)
+                thread.start()
+            self._cond.notify()
+        return future
+
+    def _next_task(self):
+        # Called with the lock held and at least one task queued
+        self._picks += 1
+        serve_background = self._depth[BACKGROUND] and (
+            not self._depth[INTERACTIVE] or self._picks % self.background_every == 0
+        )
+        lane = BACKGROUND if serve_background else INTERACTIVE
+        sessions = self._lanes[lane]
+
+        # Round robin: take the head of the longest-waiting session, then move it to the back
+        session_id, queue = next(iter(sessions.items()))
+        task = queue.popleft()
+        del sessions[session_id]
+        if queue:
+            sessions[session_id] = queue
+        self._depth[lane] -= 1
+        return task
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not (self._depth[INTERACTIVE] or self._depth[BACKGROUND]):
+                    if self._shutdown:
+                        return
+                    self._idle += 1
+                    self._cond.wait()
+                    self._idle -= 1
+                task = self._next_task()
+                self._waits[task.lane].append(time.monotonic() - task.enqueued)
+                self._active += 1
+
+            try:
+                if task.future.set_running_or_notify_cancel():
+                    try:
+                        # Run under the submitter's context so e.g. the Spotify quota sees who is asking
+                        with work_context(task.session_id, task.lane):
+                            task.future.set_result(task.fn(*task.args, **task.kwargs))
+                    except BaseException as e:
+                        task.future.set_exception(e)
+            finally:
+                with self._cond:
+                    self._active -= 1
+                    self._completed += 1
+
+    def stats(self):
+        """Queue depth and recent queue wait times per lane."""
+        with self._cond:
+            stats = {
+                "workers": len(self._threads),
+                "max_workers": self.max_workers,
+                "active": self._active,
+                "completed": self._completed,
+            }
+            for lane in (INTERACTIVE, BACKGROUND):
+                waits = sorted(self._waits[lane])
+                stats[lane] = {
+                    "queue_depth": self._depth[lane],
+                    "sessions_waiting": len(self._lanes[lane]),
+                    "wait_p50_ms": round(waits[len(waits) // 2] * 1000, 1) if waits else 0.0,
+                    "wait_p95_ms": round(waits[int(len(waits) * 0.95)] * 1000, 1) if waits else 0.0,
+                    "wait_max_ms": round(waits[-1] * 1000, 1) if waits else 0.0,
+                }
+        return stats
+
+    def shutdown(self):
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
@@ -0,0 +1,71 @@
+import streamlit.logger
+
+from echomood_cache import StageCache
+
+# Imported after quieting Streamlit's bare-mode warnings
+streamlit.logger.set_log_level("error")
+import echomood_app as app  # noqa: E402
+
+
+class CountingSpotify:
+    """Answers artist lookups from a fixed genre table and counts the calls."""
+
+    def __init__(self, genres):
+        self.genres = genres
+        self.artist_calls = 0
+
+    def artists(self, artist_ids):
+        self.artist_calls += 1
+        return {'artists': [{'id': a, 'genres': self.genres[a]} for a in artist_ids]}
+
+    def audio_features(self, track_ids):
+        raise AssertionError("features are all cached")
+
+
+def library():
+    music_data = [{'track': {'id': f't{i}', 'artists': [{'id': f'a{i % 2}'}]}, 'familiarity_score': i * 10}
+                  for i in range(10)]
+    features = {f't{i}': {'energy': i / 10, 'valence': 0.5} for i in range(10)}
+    return music_data, features
+
+
+def test_changing_only_the_mood_reuses_earlier_stages():
+    music_data, features = library()
+    sp = CountingSpotify({'a0': ['rock'], 'a1': ['jazz']})
+    stage_cache = StageCache()
+
+    def apply(mood):
+        modes = {}
+        indices = app.apply_mood_filters(music_data, ['Rock'], mood, 20, sp, feature_cache=features, modes=modes,
+                                         stage_cache=stage_cache, library_version=1)
+        return list(indices)
+
+    # Familiarity >= 20 keeps t2..t9, rock keeps the even ones, then energy within 0.3 of the target
+    assert apply({'energy': 0.2}) == [2, 4]
+    assert stage_cache.stats()["hits"] == 0
+    assert apply({'energy': 0.8}) == [6, 8]
+    # The familiarity and genre results came from the cache, so artists were only looked up once
+    assert sp.artist_calls == 1
+    assert stage_cache.stats()["hits"] == 2
+    assert apply({'energy': 0.2}) == [2, 4]
+    assert stage_cache.stats()["hits"] == 5
+
+
+def test_changing_an_earlier_stage_recomputes_the_later_ones():
+    music_data, features = library()
+    sp = CountingSpotify({'a0': ['rock'], 'a1': ['jazz']})
+    stage_cache = StageCache()
+    mood = {'energy': 0.45}
+    rock = app.apply_mood_filters(music_data, ['rock'], mood, 0, sp, feature_cache=features,
+                                  stage_cache=stage_cache, library_version=1)
+    jazz = app.apply_mood_filters(music_data, ['jazz'], mood, 0, sp, feature_cache=features,
+                                  stage_cache=stage_cache, library_version=1)
+    assert list(rock) == [2, 4, 6]
+    assert list(jazz) == [3, 5, 7]
+    assert sp.artist_calls == 2
+
+    # A new library version invalidates everything
+    music_data[2]['familiarity_score'] = 0
+    fewer = app.apply_mood_filters(music_data, ['rock'], mood, 10, sp, feature_cache=features,
+                                   stage_cache=stage_cache, library_version=2)
+    assert list(fewer) == [4, 6]
@@ -0,0 +1,48 @@
+from echomood_cache import PlaylistCache
+
+
+def items(*ids):
+    return [{'track': {'id': track_id}} for track_id in ids]
+
+
+def test_hit_for_the_cached_snapshot_only():
+    cache = PlaylistCache()
+    cache.put("p1", "snap1", items("a", "b"))
+    assert cache.get("p1", "snap1") == items("a", "b")
+    assert cache.get("p1", "snap2") is None
+    assert cache.get("p2", "snap1") is None
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 2}
+
+
+def test_new_snapshot_replaces_the_old_one():
+    cache = PlaylistCache()
+    cache.put("p1", "snap1", items("a"))
+    cache.put("p2", "snap1", items("x"))
+    cache.put("p1", "snap2", items("a", "b"))
+    assert cache.get("p1", "snap1") is None
+    assert cache.get("p1", "snap2") == items("a", "b")
+    assert cache.get("p2", "snap1") == items("x")
+    assert cache.stats()["entries"] == 2
+
+
+def test_readers_get_copies():
+    cache = PlaylistCache()
+    original = items("a")
+    cache.put("p1", "snap1", original)
+    # Neither the caller's list nor a reader's annotations reach the shared entry
+    original[0]['familiarity_score'] = 10
+    first = cache.get("p1", "snap1")
+    first[0]['familiarity_score'] = 90
+    first.append({'track': {'id': 'b'}})
+    assert cache.get("p1", "snap1") == items("a")
+
+
+def test_least_recently_used_playlist_is_evicted():
+    cache = PlaylistCache(max_entries=2)
+    cache.put("p1", "s", items("a"))
+    cache.put("p2", "s", items("b"))
+    cache.get("p1", "s")
+    cache.put("p3", "s", items("c"))
+    assert cache.get("p2", "s") is None
+    assert cache.get("p1", "s") == items("a")
+    assert cache.get("p3", "s") == items("c")
@@ -0,0 +1,74 @@
+import logging
+
+import pytest
+import spotipy
+import streamlit.logger
+
+import echomood_fake_spotify as fake
+from echomood_cassette import Cassette, CassetteSession, RECORD, REPLAY, request_key
+from echomood_jobs import Job
+
+# Imported after quieting Streamlit's bare-mode warnings
+streamlit.logger.set_log_level("error")
+import echomood_app as app  # noqa: E402
+
+# spotipy flags every audio_features call as deprecated
+pytestmark = pytest.mark.filterwarnings("ignore::DeprecationWarning")
+
+
+class KeyLog(Cassette):
+    """Cassette that remembers every request key it was asked to replay."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.keys = []
+
+    def lookup(self, key):
+        self.keys.append(key)
+        return super().lookup(key)
+
+
+def load(cassette, prefix):
+    sp = spotipy.Spotify(auth="test", requests_session=CassetteSession(cassette))
+    sp.prefix = prefix
+    result = app.load_library_job(Job("library_load"), "Liked Songs", None, sp, {}, {}, {})
+    return result["spotify_genres"], result["genre_stats"].stats()["resolved_artists"]
+
+
+@pytest.fixture(scope="module")
+def recording(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("cassette") / "library.jsonl.gz")
+    server = fake.FakeSpotifyServer(fake.FakeLibrary(2000, num_artists=800), latency=0.005).start()
+    try:
+        cassette = Cassette(path, RECORD)
+        recorded = load(cassette, server.prefix)
+        cassette.close()
+    finally:
+        server.stop()
+    return path, recorded
+
+
+def test_request_key_ignores_host_and_query_order():
+    assert request_key("get", "https://api.spotify.com/v1/artists/?ids=a,b&market=US") == \
+        request_key("GET", "http://127.0.0.1:8080/v1/artists", params={"market": "US", "ids": "a,b"})
+
+
+@pytest.mark.parametrize("latency", [None, 0.0, 0.02])
+def test_replayed_library_load_matches_the_recording(recording, latency, caplog):
+    path, recorded = recording
+    with caplog.at_level(logging.WARNING, logger="echomood_cassette"):
+        # Nothing listens here: every response has to come from the cassette
+        replayed = load(Cassette(path, REPLAY, latency=latency), "http://127.0.0.1:9/v1/")
+    assert not [r for r in caplog.records if "No recorded response" in r.getMessage()]
+    assert replayed == recorded
+    assert recorded[0] and recorded[1]
+
+
+def test_replays_make_the_same_requests(recording):
+    path, _ = recording
+    requests = []
+    for latency in (0.0, 0.01):
+        cassette = KeyLog(path, REPLAY, latency=latency)
+        load(cassette, "http://127.0.0.1:9/v1/")
+        requests.append(sorted(cassette.keys))
+    assert requests[0] == requests[1]
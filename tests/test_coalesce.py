@@ -0,0 +1,206 @@
+import threading
+import time
+
+from spotipy import SpotifyException
+
+from echomood_coalesce import BatchCoalescer
+from echomood_workers import CancelToken, OperationCancelled
+
+
+class InlineExecutor:
+    """Runs batches one by one in the caller's thread, checking for cancellation between them."""
+
+    def map(self, endpoint, fn, items, cancel=None):
+        for item in items:
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            try:
+                yield item, fn(item), None
+            except Exception as e:
+                yield item, None, e
+
+
+class Stopped(BaseException):
+    """Stands in for Streamlit stopping a script run mid-lookup."""
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_ids_are_packed_into_full_batches_once():
+    coalescer = BatchCoalescer("artists", InlineExecutor(), batch_size=2, linger=0)
+    calls = []
+
+    def call(batch):
+        calls.append(batch)
+        return [item.upper() for item in batch]
+
+    results, errors = coalescer.fetch(["a", "b", "a", "c"], call)
+    assert calls == [["a", "b"], ["c"]]
+    assert results == {"a": "A", "b": "B", "c": "C"}
+    assert errors == {}
+
+
+def test_concurrent_callers_share_in_flight_ids():
+    coalescer = BatchCoalescer("artists", InlineExecutor(), batch_size=2, linger=0)
+    ids = ["a", "b", "c"]
+    first_started = threading.Event()
+    second_calls = []
+
+    def first_call(batch):
+        first_started.set()
+        # Answer only once the second caller is waiting on every id
+        wait_until(lambda: coalescer.stats()["shared_ids"] == len(ids))
+        return [item.upper() for item in batch]
+
+    def second_call(batch):
+        second_calls.append(batch)
+        return [item.upper() for item in batch]
+
+    thread = threading.Thread(target=coalescer.fetch, args=(ids, first_call))
+    thread.start()
+    first_started.wait(5)
+    results, errors = coalescer.fetch(ids, second_call)
+    thread.join(5)
+
+    assert second_calls == []
+    assert results == {"a": "A", "b": "B", "c": "C"}
+    assert errors == {}
+    assert coalescer.stats()["in_flight_ids"] == 0
+
+
+def test_waiter_fetches_batches_a_stopped_claimer_abandoned():
+    coalescer = BatchCoalescer("artists", InlineExecutor(), batch_size=2, linger=0)
+    ids = ["a", "b", "c", "d"]
+    first_started = threading.Event()
+    second_calls = []
+    outcome = {}
+
+    def first_call(batch):
+        first_started.set()
+        wait_until(lambda: coalescer.stats()["shared_ids"] == len(ids))
+        raise Stopped()
+
+    def second_call(batch):
+        second_calls.append(batch)
+        return [f"{item}!" for item in batch]
+
+    def first():
+        try:
+            coalescer.fetch(ids, first_call)
+        except Stopped:
+            outcome["first"] = "stopped"
+
+    thread = threading.Thread(target=first)
+    thread.start()
+    first_started.wait(5)
+    results, errors = coalescer.fetch(ids, second_call)
+    thread.join(5)
+
+    assert outcome == {"first": "stopped"}
+    # Both of the stopped caller's batches, the one it was running and the one it never reached, are refetched
+    assert second_calls == [["a", "b"], ["c", "d"]]
+    assert results == {item: f"{item}!" for item in ids}
+    assert errors == {}
+    assert coalescer.stats()["in_flight_ids"] == 0
+
+
+def test_waiter_fetches_a_batch_its_claimer_abandoned():
+    coalescer = BatchCoalescer("artists", InlineExecutor(), batch_size=2, linger=0)
+    ids = ["a", "b", "c", "d"]
+    first_cancel = CancelToken()
+    first_calls = []
+    second_calls = []
+    first_started = threading.Event()
+
+    def first_call(batch):
+        first_calls.append(batch)
+        first_started.set()
+        # Stop the first caller only once the second is waiting on every id it claimed
+        wait_until(lambda: coalescer.stats()["shared_ids"] == len(ids))
+        first_cancel.cancel("Stopped")
+        return [f"{item}!" for item in batch]
+
+    def second_call(batch):
+        second_calls.append(batch)
+        return [f"{item}!" for item in batch]
+
+    outcome = {}
+
+    def first():
+        try:
+            coalescer.fetch(ids, first_call, cancel=first_cancel)
+        except OperationCancelled:
+            outcome["first"] = "cancelled"
+
+    thread = threading.Thread(target=first)
+    thread.start()
+    first_started.wait(5)
+    results, errors = coalescer.fetch(ids, second_call)
+    thread.join(5)
+
+    assert outcome == {"first": "cancelled"}
+    assert first_calls == [["a", "b"]]
+    # The batch the first caller claimed but never ran is fetched by the waiter instead
+    assert second_calls == [["c", "d"]]
+    assert results == {item: f"{item}!" for item in ids}
+    assert errors == {}
+    assert coalescer.stats()["in_flight_ids"] == 0
+
+
+def claimer_fails(coalescer, ids, error):
+    """Have a first caller claim ids and fail with error once a second caller waits on all of them."""
+    first_started = threading.Event()
+    outcome = {}
+
+    def first_call(batch):
+        first_started.set()
+        wait_until(lambda: coalescer.stats()["shared_ids"] == len(ids))
+        raise error
+
+    def first():
+        outcome["first"] = coalescer.fetch(ids, first_call)
+
+    thread = threading.Thread(target=first)
+    thread.start()
+    first_started.wait(5)
+    return thread, outcome
+
+
+def test_request_errors_stay_with_the_caller_that_got_them():
+    coalescer = BatchCoalescer("artists", InlineExecutor(), batch_size=2, linger=0)
+    ids = ["a", "b"]
+    expired = SpotifyException(401, -1, "The access token expired")
+    thread, outcome = claimer_fails(coalescer, ids, expired)
+    second_calls = []
+
+    def second_call(batch):
+        second_calls.append(batch)
+        return [item.upper() for item in batch]
+
+    results, errors = coalescer.fetch(ids, second_call)
+    thread.join(5)
+
+    # The waiter looks the ids up again with its own, valid client
+    assert second_calls == [["a", "b"]]
+    assert (results, errors) == ({"a": "A", "b": "B"}, {})
+    assert outcome["first"] == ({}, {"a": expired, "b": expired})
+
+
+def test_endpoint_failures_are_shared_with_waiters():
+    coalescer = BatchCoalescer("artists", InlineExecutor(), batch_size=2, linger=0)
+    ids = ["a", "b"]
+    unavailable = SpotifyException(503, -1, "Service unavailable")
+    thread, outcome = claimer_fails(coalescer, ids, unavailable)
+    second_calls = []
+
+    results, errors = coalescer.fetch(ids, second_calls.append)
+    thread.join(5)
+
+    assert second_calls == []
+    assert (results, errors) == ({}, {"a": unavailable, "b": unavailable})
+    assert outcome["first"] == ({}, {"a": unavailable, "b": unavailable})
@@ -0,0 +1,145 @@
+import pytest
+import requests
+from spotipy import SpotifyException
+
+from echomood_executor import AIMDLimiter, AdaptiveExecutor, CircuitOpenError, is_endpoint_failure
+
+
+def failing(status):
+    def call(*args):
+        raise SpotifyException(status, -1, f"HTTP {status}")
+    return call
+
+
+def finish(limiter, latency, error=None, times=1):
+    for _ in range(times):
+        limiter.started()
+        limiter.finished(latency, error)
+
+
+def call_ignoring_errors(executor, fn, times):
+    for _ in range(times):
+        with pytest.raises(Exception):
+            executor.call("artists", fn)
+
+
+@pytest.mark.parametrize("error, counts", [
+    (SpotifyException(500, -1, "server error"), True),
+    (SpotifyException(503, -1, "unavailable"), True),
+    (SpotifyException(429, -1, "rate limited"), True),
+    (requests.exceptions.ConnectTimeout(), True),
+    (requests.exceptions.ConnectionError(), True),
+    (SpotifyException(400, -1, "bad request"), False),
+    (SpotifyException(401, -1, "expired token"), False),
+    (SpotifyException(403, -1, "missing scope"), False),
+    (SpotifyException(404, -1, "not found"), False),
+    (ValueError("bad data"), False),
+])
+def test_is_endpoint_failure(error, counts):
+    assert is_endpoint_failure(error) is counts
+
+
+def test_audio_features_counts_403_as_an_endpoint_failure():
+    forbidden = SpotifyException(403, -1, "forbidden")
+    assert is_endpoint_failure(forbidden, "audio_features")
+    assert not is_endpoint_failure(forbidden, "artists")
+
+
+def test_forbidden_audio_features_open_the_circuit():
+    executor = AdaptiveExecutor(max_workers=2, failure_threshold=3)
+    for _ in range(3):
+        with pytest.raises(SpotifyException):
+            executor.call("audio_features", failing(403))
+    assert executor.breaker("audio_features").state == "open"
+    with pytest.raises(CircuitOpenError):
+        executor.call("audio_features", lambda: "never called")
+    executor.shutdown()
+
+
+def test_server_errors_open_the_circuit():
+    executor = AdaptiveExecutor(max_workers=2, failure_threshold=3)
+    call_ignoring_errors(executor, failing(502), 3)
+    assert executor.breaker("artists").state == "open"
+    with pytest.raises(CircuitOpenError):
+        executor.call("artists", lambda: "never called")
+    executor.shutdown()
+
+
+def test_client_errors_do_not_open_the_circuit():
+    executor = AdaptiveExecutor(max_workers=2, failure_threshold=3)
+    for status in (404, 404, 404, 401, 403):
+        with pytest.raises(SpotifyException):
+            executor.call("artists", failing(status))
+    assert executor.breaker("artists").stats() == {"state": "closed", "failures": 0}
+    assert executor.call("artists", lambda: "ok") == "ok"
+    executor.shutdown()
+
+
+def test_client_errors_do_not_reset_server_failures():
+    executor = AdaptiveExecutor(max_workers=2, failure_threshold=3)
+    call_ignoring_errors(executor, failing(500), 2)
+    call_ignoring_errors(executor, failing(404), 1)
+    call_ignoring_errors(executor, failing(500), 1)
+    assert executor.breaker("artists").state == "open"
+    executor.shutdown()
+
+
+def test_map_reports_client_errors_per_item_without_tripping():
+    executor = AdaptiveExecutor(max_workers=2, failure_threshold=2)
+
+    def lookup(item):
+        if item % 2:
+            raise SpotifyException(404, -1, "not found")
+        return item
+
+    results = list(executor.map("artists", lookup, range(6)))
+    assert [result for _, result, error in results if error is None] == [0, 2, 4]
+    assert executor.breaker("artists").state == "closed"
+    executor.shutdown()
+
+
+def test_limiter_grows_by_about_one_per_round_trip_on_fast_successes():
+    limiter = AIMDLimiter("artists", initial=2, max_limit=16)
+    finish(limiter, 0.01)
+    assert limiter.limit == 2.5
+    # Each success adds 1/limit, so a round trip's worth of successes adds about one
+    finish(limiter, 0.01, times=3)
+    assert 3.3 < limiter.limit < 3.6
+    assert limiter.capacity == 3 and limiter.stats()["successes"] == 4
+
+
+def test_limiter_halves_on_429():
+    limiter = AIMDLimiter("artists", initial=8)
+    finish(limiter, 0.01, SpotifyException(429, -1, "rate limited"))
+    assert limiter.limit == 4.0
+    assert limiter.stats()["throttled"] == 1
+
+
+def test_limiter_backs_off_when_latency_rises_well_above_baseline():
+    limiter = AIMDLimiter("artists", initial=8, latency_tolerance=2.0, slow_backoff=0.8)
+    finish(limiter, 0.01)
+    grown = limiter.limit
+    finish(limiter, 0.05)
+    assert limiter.limit == pytest.approx(grown * 0.8)
+    # Latency within tolerance still counts as fast
+    finish(limiter, 0.015)
+    assert limiter.limit > grown * 0.8
+
+
+def test_limiter_decreases_once_per_round_trip():
+    limiter = AIMDLimiter("artists", initial=8)
+    # A 10s baseline means a burst of 429s inside it is one congestion signal
+    finish(limiter, 10.0)
+    limit = limiter.limit
+    finish(limiter, 0.01, SpotifyException(429, -1, "rate limited"), times=3)
+    assert limiter.limit == limit * 0.5
+    assert limiter.stats()["throttled"] == 3
+
+
+def test_limiter_stays_within_its_bounds():
+    limiter = AIMDLimiter("artists", initial=2, min_limit=1, max_limit=4)
+    finish(limiter, 0.001, times=100)
+    assert limiter.limit == 4
+    limiter = AIMDLimiter("artists", initial=4, min_limit=1, max_limit=4)
+    finish(limiter, 0.0, SpotifyException(429, -1, "rate limited"), times=10)
+    assert limiter.limit == 1 and limiter.capacity == 1
@@ -0,0 +1,71 @@
+import csv
+
+import pytest
+
+from echomood_features import FEATURE_COLUMNS, FeatureStore, import_dataset
+
+
+def write_csv(path, rows, columns=("id", "isrc") + tuple(FEATURE_COLUMNS)):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(rows)
+
+
+def features(value):
+    return [value] * (len(FEATURE_COLUMNS) - 1) + [120.0]
+
+
+@pytest.fixture
+def store(tmp_path):
+    path = tmp_path / "tracks.csv"
+    write_csv(path, [
+        ["spotify:track:aaa", "usabc0000001"] + features(0.1),
+        ["https://open.spotify.com/track/bbb?si=x", ""] + features(0.2),
+        ["", "GBXYZ0000002"] + features(0.3),
+        ["", ""] + features(0.9),
+    ])
+    store = FeatureStore(str(tmp_path / "features.db"))
+    assert import_dataset(store, str(path)) == 3
+    yield store
+    store.close()
+
+
+def test_lookup_by_track_id(store):
+    found = store.lookup([("aaa", None), ("bbb", None), ("zzz", None)])
+    assert sorted(found) == ["aaa", "bbb"]
+    assert found["bbb"]["energy"] == 0.2
+    assert found["bbb"]["tempo"] == 120.0
+
+
+def test_lookup_falls_back_to_isrc(store):
+    # A relinked or regional copy of a track has another id but the same recording's ISRC
+    found = store.lookup([("other", "gbxyz0000002"), ("copy", "USABC0000001"), ("none", "XX0000000000")])
+    assert found == {"other": dict(zip(FEATURE_COLUMNS, features(0.3))),
+                     "copy": dict(zip(FEATURE_COLUMNS, features(0.1)))}
+
+
+def test_reimport_replaces_rows(store, tmp_path):
+    path = tmp_path / "update.csv"
+    write_csv(path, [["aaa", "USABC0000001"] + features(0.5)])
+    import_dataset(store, str(path))
+    assert len(store) == 3
+    assert store.lookup([("aaa", None)])["aaa"]["valence"] == 0.5
+
+
+def test_reimport_replaces_isrc_only_rows(store, tmp_path):
+    path = tmp_path / "update.csv"
+    write_csv(path, [["", "GBXYZ0000002"] + features(0.6)])
+    for _ in range(3):
+        import_dataset(store, str(path))
+    assert len(store) == 3
+    assert store.lookup([("other", "GBXYZ0000002")])["other"]["valence"] == 0.6
+
+
+def test_missing_feature_columns_are_rejected(tmp_path):
+    path = tmp_path / "bad.csv"
+    write_csv(path, [["aaa", 0.1]], columns=("id", "energy"))
+    store = FeatureStore(str(tmp_path / "features.db"))
+    with pytest.raises(ValueError, match="missing feature columns"):
+        import_dataset(store, str(path))
+    store.close()
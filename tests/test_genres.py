@@ -0,0 +1,92 @@
+import random
+
+from echomood_genres import GenreStats
+
+
+def tracks(artist_ids):
+    return [{'track': {'id': f't{i}', 'artists': [{'id': artist_id}]}} for i, artist_id in enumerate(artist_ids)]
+
+
+def library(num_tracks=20000, num_artists=3000):
+    stats = GenreStats()
+    stats.add_tracks(tracks([f'a{i % num_artists}' for i in range(num_tracks)]))
+    return stats
+
+
+def genres_of(artist_id):
+    # Three genres cover most artists, so the top three stand well clear of the rest
+    k = int(artist_id[1:])
+    return [f"big{k % 3}"] if k % 10 < 7 else [f"small{k % 40}"]
+
+
+def test_counts_are_track_weighted():
+    stats = GenreStats()
+    stats.add_tracks(tracks(['big'] * 8 + ['small'] * 2))
+    stats.add_artist_genres({'small': ['jazz'], 'big': ['pop', 'jazz']})
+    assert stats.top_weights() == [('jazz', 10), ('pop', 8)]
+
+
+def test_tracks_and_genres_can_arrive_in_any_order():
+    artists = [f'a{i % 7}' for i in range(200)]
+    genres = {f'a{k}': [f'g{k % 3}', f'g{k}'] for k in range(7)}
+    expected = GenreStats()
+    expected.add_tracks(tracks(artists))
+    expected.add_artist_genres(genres)
+
+    stats = GenreStats()
+    pages = [tracks(artists)[start:start + 30] for start in range(0, 200, 30)]
+    resolved = list(genres.items())
+    random.Random(3).shuffle(resolved)
+    for page, artist in zip(pages, resolved):
+        stats.add_tracks(page)
+        stats.add_artist_genres(dict([artist]))
+    stats.add_artist_genres(genres)
+    assert stats.top_weights() == expected.top_weights()
+    assert stats.unresolved_artists() == []
+
+
+def test_equal_weights_rank_by_name():
+    stats = GenreStats()
+    stats.add_tracks(tracks(['a', 'b', 'c', 'c']))
+    stats.add_artist_genres({'b': ['rock']})
+    stats.add_artist_genres({'a': ['blues']})
+    stats.add_artist_genres({'c': ['ambient']})
+    assert stats.top() == ['ambient', 'blues', 'rock']
+
+
+def test_new_artists_are_reported_once():
+    stats = GenreStats()
+    assert stats.add_tracks(tracks(['a', 'b', 'a'])) == ['a', 'b']
+    assert stats.add_tracks(tracks(['b', 'c'])) == ['c']
+    assert sorted(stats.unresolved_artists()) == ['a', 'b', 'c']
+    assert stats.stats() == {"tracks": 5, "artists": 3, "resolved_artists": 0, "genres": 0}
+
+
+def test_fully_resolved_sample_gives_an_estimate():
+    stats = library()
+    sample = stats.sample_unresolved(1000, random.Random(1))
+    stats.add_artist_genres({artist_id: genres_of(artist_id) for artist_id in sample[0]})
+    top, confidence = stats.estimate_top(sample, n=3)
+    assert sorted(genre for genre, _, _ in top) == ["big0", "big1", "big2"]
+    assert confidence == 1.0
+
+
+def test_unresolved_sampled_artists_give_no_confidence():
+    stats = library()
+    sample = stats.sample_unresolved(1000, random.Random(1))
+    assert stats.estimate_top(sample, n=30) == ([], 0.0)
+
+    # A lookup that resolved only a tenth of the sample is still not an estimate
+    stats.add_artist_genres({artist_id: genres_of(artist_id) for artist_id in sample[0][:100]})
+    assert stats.estimate_top(sample, n=30) == ([], 0.0)
+
+
+def test_partly_resolved_sample_lowers_confidence():
+    full, partial = library(), library()
+    sample = full.sample_unresolved(1000, random.Random(1))
+    full.add_artist_genres({artist_id: genres_of(artist_id) for artist_id in sample[0]})
+    partial.add_artist_genres({artist_id: genres_of(artist_id) for artist_id in sample[0][:800]})
+    _, full_confidence = full.estimate_top(sample, n=3)
+    _, partial_confidence = partial.estimate_top(sample, n=3)
+    assert full_confidence == 1.0
+    assert 0 < partial_confidence < full_confidence
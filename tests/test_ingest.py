@@ -0,0 +1,43 @@
+import streamlit.logger
+
+streamlit.logger.set_log_level("error")
+import echomood_app as app  # noqa: E402
+
+
+def raw_item(**track):
+    markets = ["GB", "US", "SE"] * 60
+    base = {
+        'id': 't1', 'name': 'Song', 'type': 'track', 'popularity': 50, 'available_markets': markets,
+        'artists': [{'id': 'a1', 'name': 'Artist', 'uri': 'spotify:artist:a1', 'external_urls': {}}],
+        'album': {'id': 'al1', 'name': 'Album', 'available_markets': markets,
+                  'images': [{'url': 'big.jpg'}, {'url': 'medium.jpg'}, {'url': 'small.jpg'}]},
+        'external_ids': {'isrc': 'GBABC0000001', 'ean': '123'},
+    }
+    base.update(track)
+    return {'added_at': '2024-01-02T03:04:05Z', 'track': base}
+
+
+def test_projection_keeps_only_the_fields_echomood_uses():
+    assert app.project_track_item(raw_item()) == {
+        'added_at': '2024-01-02T03:04:05Z',
+        'track': {
+            'id': 't1',
+            'name': 'Song',
+            'artists': [{'id': 'a1', 'name': 'Artist'}],
+            'album': {'id': 'al1', 'images': [{'url': 'big.jpg'}]},
+            'external_ids': {'isrc': 'GBABC0000001'},
+        },
+    }
+
+
+def test_projection_tolerates_a_missing_album_or_isrc():
+    track = app.project_track_item(raw_item(album=None, external_ids=None))['track']
+    assert track['album'] == {'id': None, 'images': []}
+    assert track['external_ids'] == {'isrc': None}
+    assert app.project_track_item(raw_item(external_ids={}))['track']['external_ids'] == {'isrc': None}
+
+
+def test_unavailable_tracks_and_episodes_project_to_none():
+    assert app.project_track_item({'added_at': 'x', 'track': None}) == {'added_at': 'x', 'track': None}
+    assert app.project_track_item(raw_item(type='episode'))['track'] is None
+    assert app.project_page({'items': [raw_item(), {'track': None}]})[1] == {'added_at': None, 'track': None}
@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+import streamlit.logger
+
+from echomood_jobs import JobRunner, CANCELLED, DONE, FAILED
+
+# Imported after quieting Streamlit's bare-mode warnings
+streamlit.logger.set_log_level("error")
+import echomood_app as app  # noqa: E402
+
+
+class SavedTracks:
+    """Liked Songs of num_tracks tracks whose page at fail_offset errors while failing is set."""
+
+    def __init__(self, num_tracks, fail_offset):
+        self.num_tracks = num_tracks
+        self.fail_offset = fail_offset
+        self.failing = True
+        self.offsets = []
+
+    def current_user_saved_tracks(self, limit=20, offset=0, market=None):
+        self.offsets.append(offset)
+        if self.failing and offset == self.fail_offset:
+            raise ValueError("page unavailable")
+        items = [{'track': {'id': f't{i}', 'name': f'Track {i}', 'artists': []}}
+                 for i in range(offset, min(offset + limit, self.num_tracks))]
+        return {'total': self.num_tracks, 'items': items}
+
+
+def run(runner, fn, **kwargs):
+    job = runner.submit("library_load", fn, **kwargs)
+    deadline = time.monotonic() + 10
+    while not job.done:
+        assert time.monotonic() < deadline, "job didn't finish"
+        time.sleep(0.01)
+    return job
+
+
+@pytest.fixture
+def no_page_retries(monkeypatch):
+    monkeypatch.setattr(app.Config, "PAGE_RETRIES", 0)
+    monkeypatch.setattr(app.Config, "PAGE_RETRY_BACKOFF", 0.0)
+
+
+def test_failed_load_resumes_from_its_checkpoint(no_page_retries):
+    page_size = app.Config.SAVED_TRACKS_PAGE_SIZE
+    sp = SavedTracks(page_size * 6 + 7, fail_offset=page_size * 3)
+    load = lambda job: app.fetch_library("Liked Songs", sp=sp, checkpoint=job.checkpoint)
+    runner = JobRunner()
+
+    failed = run(runner, load)
+    assert failed.status == FAILED
+    assert isinstance(failed.error, ValueError)
+    # Every page but the failed one was kept
+    assert sorted(failed.checkpoint['pages']) == [o for o in range(0, sp.num_tracks, page_size) if o != sp.fail_offset]
+
+    sp.failing = False
+    sp.offsets.clear()
+    resumed = run(runner, load, checkpoint=failed.checkpoint)
+    assert resumed.status == DONE
+    # Only the missing page was fetched again
+    assert sp.offsets == [sp.fail_offset]
+    assert [item['track']['id'] for item in resumed.result] == [f't{i}' for i in range(sp.num_tracks)]
+
+
+def test_cancelled_load_keeps_its_pages(no_page_retries):
+    page_size = app.Config.SAVED_TRACKS_PAGE_SIZE
+    sp = SavedTracks(page_size * 6, fail_offset=None)
+
+    def load(job):
+        def on_progress(loaded, total):
+            if loaded >= page_size * 3:
+                job.cancel()
+        return app.fetch_library("Liked Songs", sp=sp, checkpoint=job.checkpoint, on_progress=on_progress,
+                                 cancel=job.cancel_token)
+
+    runner = JobRunner()
+    cancelled = run(runner, load)
+    assert cancelled.status == CANCELLED
+    assert sorted(cancelled.checkpoint['pages']) == [0, page_size, page_size * 2]
+
+    sp.offsets.clear()
+    resumed = run(runner, lambda job: app.fetch_library("Liked Songs", sp=sp, checkpoint=job.checkpoint),
+                  checkpoint=cancelled.checkpoint)
+    assert resumed.status == DONE
+    assert sorted(sp.offsets) == [page_size * 3, page_size * 4, page_size * 5]
+    assert len(resumed.result) == sp.num_tracks
+
+
+def test_jobs_do_not_wait_for_other_sessions_jobs():
+    # Every job waits for all the others to be running, so none can finish while any is held back
+    count = 12
+    barrier = threading.Barrier(count, timeout=5)
+    runner = JobRunner()
+    jobs = [runner.submit("library_load", lambda job: barrier.wait(), session_id=f"s{i}") for i in range(count)]
+    for job in jobs:
+        while not job.done:
+            time.sleep(0.01)
+    assert [job.status for job in jobs] == [DONE] * count
+
+
+def test_checkpoint_from_another_source_is_discarded(no_page_retries):
+    sp = SavedTracks(120, fail_offset=None)
+    stale = {'source': ("playlist", "p1", "snap1"), 'total': 3, 'pages': {0: [{'track': None}]}}
+    tracks = app.fetch_library("Liked Songs", sp=sp, checkpoint=stale)
+    assert len(tracks) == 120
+    assert stale['source'] == ("liked",)
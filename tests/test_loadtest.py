@@ -0,0 +1,18 @@
+import pytest
+
+from echomood_loadtest import percentile
+
+
+@pytest.mark.parametrize("values, pct, expected", [
+    ([1, 2], 50, 1),
+    ([3, 1, 2], 50, 2),
+    ([1, 2, 3, 4], 50, 2),
+    ([1, 2, 3, 4], 75, 3),
+    (list(range(1, 31)), 10, 3),
+    (list(range(1, 21)), 95, 19),
+    (list(range(1, 21)), 100, 20),
+    ([5, 7], 0, 5),
+    ([], 50, 0.0),
+])
+def test_percentile_uses_the_nearest_rank(values, pct, expected):
+    assert percentile(values, pct) == expected
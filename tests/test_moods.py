@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+import streamlit.logger
+
+from echomood_moods import kmeans
+
+streamlit.logger.set_log_level("error")
+import echomood_app as app  # noqa: E402
+
+CENTERS = np.array([[0.1, 0.1], [0.9, 0.2], [0.5, 0.9]])
+
+
+def blobs(sizes, centers, spread=0.03, seed=1):
+    rng = np.random.default_rng(seed)
+    points = np.concatenate([center + rng.normal(0, spread, (size, len(center)))
+                             for size, center in zip(sizes, centers)])
+    truth = np.repeat(np.arange(len(sizes)), sizes)
+    return points, truth
+
+
+def same_partition(labels, truth):
+    # Cluster numbering is arbitrary, so compare which points end up together
+    return {frozenset(np.nonzero(labels == c)[0]) for c in set(labels)} == \
+        {frozenset(np.nonzero(truth == c)[0]) for c in set(truth)}
+
+
+@pytest.mark.parametrize("batch_size", [None, 64])
+def test_kmeans_recovers_separated_clusters(batch_size):
+    points, truth = blobs([300, 200, 100], CENTERS)
+    centroids, labels = kmeans(points, 3, batch_size=batch_size, max_iter=200)
+    assert same_partition(labels, truth)
+    for c in range(3):
+        assert np.abs(centroids[labels[truth == c][0]] - CENTERS[c]).max() < 0.05
+
+
+def test_kmeans_caps_k_at_the_number_of_points():
+    centroids, labels = kmeans([[0.1, 0.2], [0.5, 0.5], [0.9, 0.8]], 5)
+    assert centroids.shape == (3, 2)
+    assert sorted(labels) == [0, 1, 2]
+
+
+def mood_library(groups):
+    """music_data and track_features with one group of tracks per (size, features) pair."""
+    music_data, features = [], {}
+    rng = np.random.default_rng(2)
+    for size, mood in groups:
+        for _ in range(size):
+            track_id = f"t{len(music_data)}"
+            music_data.append({'track': {'id': track_id}})
+            features[track_id] = {f: float(np.clip(mood.get(f, 0.5) + rng.normal(0, 0.01), 0, 1))
+                                  for f in app.MOOD_FEATURES}
+    return music_data, features
+
+
+def test_too_few_tracks_give_no_clusters():
+    music_data, features = mood_library([(5, {})])
+    assert app.discover_mood_clusters(music_data, features, k=3) == []
+
+
+def test_clusters_come_largest_first_with_unique_names():
+    happy = {'valence': 0.9, 'energy': 0.9}
+    # Close to happy on its two strongest dimensions, so it would get the same name
+    also_happy = {'valence': 0.85, 'energy': 0.85, 'danceability': 0.8}
+    sad = {'valence': 0.1, 'energy': 0.1}
+    music_data, features = mood_library([(20, also_happy), (60, sad), (40, happy)])
+
+    clusters = app.discover_mood_clusters(music_data, features, k=3)
+    assert [cluster["size"] for cluster in clusters] == [60, 40, 20]
+    assert sorted(clusters[0]["indices"]) == list(range(20, 80))
+    assert sorted(clusters[1]["indices"]) == list(range(80, 120))
+    names = [cluster["name"] for cluster in clusters]
+    assert len(set(names)) == 3
+    base = names[1].removesuffix(" 2")
+    assert {names[1], names[2]} == {base, base + " 2"}
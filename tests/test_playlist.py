@@ -0,0 +1,86 @@
+import random
+from collections import Counter
+
+from echomood_playlist import select_diverse, sequence_tracks
+
+
+def catalogue(n, artists, albums, genres):
+    """Candidates p = 0..n-1 scored p (lower is better) with round-robin artists, albums and genres."""
+    scores = [float(p) for p in range(n)]
+    return (scores, lambda p: [f"artist{p % artists}"], lambda p: f"album{p % albums}",
+            lambda p: [f"genre{p % genres}"])
+
+
+def test_caps_limit_artists_albums_and_genres():
+    scores, artists_of, album_of, genres_of = catalogue(200, artists=5, albums=7, genres=3)
+    chosen = select_diverse(scores, 10, artists_of, album_of, genres_of,
+                            max_per_artist=2, max_per_album=2, max_genre_share=0.4)
+    assert len(chosen) == 10
+    assert max(Counter(artists_of(p)[0] for p in chosen).values()) <= 2
+    assert max(Counter(album_of(p) for p in chosen).values()) <= 2
+    assert max(Counter(genres_of(p)[0] for p in chosen).values()) <= 4
+    assert chosen == sorted(chosen, key=lambda p: scores[p])
+
+
+def test_best_candidates_win_when_caps_allow():
+    scores, artists_of, album_of, genres_of = catalogue(50, artists=50, albums=50, genres=50)
+    assert select_diverse(scores, 5, artists_of, album_of, genres_of) == [0, 1, 2, 3, 4]
+
+
+def test_caps_relax_rather_than_come_up_short():
+    # Two artists can fill only 4 slots at 2 each; the best skipped candidates fill the rest
+    scores, artists_of, album_of, _ = catalogue(20, artists=2, albums=20, genres=1)
+    chosen = select_diverse(scores, 8, artists_of, album_of, max_per_artist=2)
+    assert len(chosen) == 8
+    assert chosen[:4] == [0, 1, 2, 3]
+
+
+def test_tight_caps_reach_past_the_best_candidates():
+    # The best 100 share one artist, so all but one of the picks come from further down
+    scores = [float(p) for p in range(1000)]
+    chosen = select_diverse(scores, 5, lambda p: ["one"] if p < 100 else [f"artist{p}"], lambda p: None,
+                            max_per_artist=1)
+    assert chosen == [0, 100, 101, 102, 103]
+    # With a single artist nothing else fits, so the best skipped candidates fill in
+    assert select_diverse(scores, 5, lambda p: ["one"], lambda p: None, max_per_artist=1) == [0, 1, 2, 3, 4]
+
+
+def test_equal_scores_keep_candidate_order():
+    scores = [1.0] * 200
+    assert select_diverse(scores, 3, lambda p: [p], lambda p: None) == [0, 1, 2]
+
+
+def test_none_turns_a_cap_off():
+    scores, artists_of, album_of, genres_of = catalogue(20, artists=1, albums=1, genres=1)
+    chosen = select_diverse(scores, 6, artists_of, album_of, genres_of,
+                            max_per_artist=None, max_per_album=None, max_genre_share=None)
+    assert chosen == list(range(6))
+
+
+def path_length(vectors, order):
+    return sum(sum((a - b) ** 2 for a, b in zip(vectors[p], vectors[q])) ** 0.5 for p, q in zip(order, order[1:]))
+
+
+def test_sequence_visits_every_track_once():
+    vectors = [[i % 7 / 7, i % 5 / 5, i % 3 / 3] for i in range(40)]
+    for arc in ("smooth", "build up", "wind down", "peak"):
+        assert sorted(sequence_tracks(vectors, arc=arc)) == list(range(40))
+
+
+def test_smooth_sequence_shortens_the_path():
+    rng = random.Random(5)
+    vectors = [[rng.random(), rng.random(), rng.random()] for _ in range(60)]
+    order = sequence_tracks(vectors)
+    assert order[0] == min(range(60), key=lambda p: vectors[p][0])
+    assert path_length(vectors, order) < path_length(vectors, list(range(60))) / 2
+
+
+def test_arcs_follow_energy():
+    vectors = [[i / 63, (i * 7 % 64) / 64] for i in range(64)]
+    energy = lambda part: sum(vectors[p][0] for p in part) / len(part)
+    up = sequence_tracks(vectors, arc="build up")
+    down = sequence_tracks(vectors, arc="wind down")
+    peak = sequence_tracks(vectors, arc="peak")
+    assert energy(up[:16]) < energy(up[-16:])
+    assert energy(down[:16]) > energy(down[-16:])
+    assert energy(peak[24:40]) > max(energy(peak[:16]), energy(peak[-16:]))
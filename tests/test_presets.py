@@ -0,0 +1,45 @@
+import random
+
+import streamlit.logger
+
+# Imported after quieting Streamlit's bare-mode warnings
+streamlit.logger.set_log_level("error")
+import echomood_app as app  # noqa: E402
+
+
+def library(n=3000, seed=7):
+    rng = random.Random(seed)
+    music_data = [{'track': {'id': f't{i}'}} for i in range(n)]
+    features = {}
+    for i in range(n):
+        if i % 10 == 0:
+            continue  # no features known
+        # Two decimals put plenty of values exactly on the tolerance boundary
+        features[f't{i}'] = {f: (None if rng.random() < 0.05 else round(rng.random(), 2))
+                             for f in app.MOOD_FEATURES}
+    return music_data, features
+
+
+def test_presets_match_the_per_track_rule():
+    music_data, features = library()
+    # A small chunk size exercises the chunked pass
+    results = app.precompute_presets(music_data, features, chunk_size=700)
+    assert list(results) == list(app.MOOD_PRESETS)
+    for name, preset in app.MOOD_PRESETS.items():
+        expected = {i for i, item in enumerate(music_data)
+                    if item['track']['id'] in features and app.matches_mood(features[item['track']['id']], preset)}
+        assert set(results[name]) == expected
+        assert len(results[name]) == len(expected)
+
+
+def test_preset_results_are_closest_first():
+    music_data, features = library()
+    results = app.precompute_presets(music_data, features)
+    for name, preset in app.MOOD_PRESETS.items():
+        distances = [app.mood_distance(features[music_data[i]['track']['id']], preset) for i in results[name]]
+        assert all(a <= b + 1e-9 for a, b in zip(distances, distances[1:]))
+
+
+def test_no_known_features_gives_empty_results():
+    results = app.precompute_presets([{'track': {'id': 't0'}}], {})
+    assert {name: list(indices) for name, indices in results.items()} == {name: [] for name in app.MOOD_PRESETS}
@@ -0,0 +1,146 @@
+import threading
+import time
+
+import pytest
+import spotipy
+
+import echomood_fake_spotify as fake
+from echomood_quota import QuotaScheduler, QuotaSession
+from echomood_workers import INTERACTIVE, BACKGROUND, work_context
+
+
+class RecordingScheduler(QuotaScheduler):
+    """Scheduler that records pauses and grants instead of sleeping through them."""
+
+    def __init__(self):
+        super().__init__(limit=1000)
+        self.pauses = []
+        self.grants = []
+
+    def acquire(self, session_id=None, priority=INTERACTIVE):
+        self.grants.append((session_id, priority))
+        return super().acquire(session_id, priority)
+
+    def pause(self, seconds):
+        self.pauses.append(seconds)
+
+
+@pytest.fixture
+def server():
+    server = fake.FakeSpotifyServer(fake.FakeLibrary(10)).start()
+    yield server
+    server.stop()
+
+
+def me_calls(server):
+    return server.stats()["by_endpoint"].get("me", 0)
+
+
+def queue_waiters(scheduler, waiters):
+    """Start one acquiring thread per (session, priority), each queued before the next starts."""
+    order = []
+    threads = []
+    for count, (session_id, priority) in enumerate(waiters, start=1):
+        thread = threading.Thread(target=lambda s=session_id, p=priority: (scheduler.acquire(s, p), order.append(s)))
+        thread.start()
+        threads.append(thread)
+        deadline = time.monotonic() + 5
+        while sum(scheduler.stats()[lane]["waiting"] for lane in (INTERACTIVE, BACKGROUND)) < count:
+            assert time.monotonic() < deadline
+            time.sleep(0.001)
+    return order, threads
+
+
+def test_grants_never_exceed_the_limit_per_window():
+    scheduler = QuotaScheduler(limit=3, window=0.2)
+    started = time.monotonic()
+    grants = []
+    for _ in range(7):
+        scheduler.acquire("s")
+        grants.append(time.monotonic() - started)
+    assert all(t < 0.2 for t in grants[:3])
+    # The 4th waits for the 1st to leave the window, the 7th for the 4th
+    assert grants[3] >= 0.19 and grants[6] >= 0.39
+    assert scheduler.stats()["total_granted"] == 7
+
+
+def test_waiting_sessions_share_fairly_and_interactive_goes_first():
+    scheduler = QuotaScheduler(limit=1, window=0.2)
+    scheduler.acquire("import", BACKGROUND)
+    order, threads = queue_waiters(scheduler, [
+        ("import", BACKGROUND), ("import", BACKGROUND), ("import", BACKGROUND),
+        ("other-import", BACKGROUND), ("apply", INTERACTIVE),
+    ])
+    for thread in threads:
+        thread.join(5)
+    # Apply arrived last but is served first; the small import doesn't wait behind the big one
+    assert order == ["apply", "import", "other-import", "import", "import"]
+
+
+def test_background_keeps_a_share_while_interactive_waits():
+    scheduler = QuotaScheduler(limit=1, window=0.1, background_every=3)
+    scheduler.acquire("ui")
+    order, threads = queue_waiters(scheduler, [("import", BACKGROUND)] + [("ui", INTERACTIVE)] * 4)
+    for thread in threads:
+        thread.join(5)
+    assert order == ["ui", "import", "ui", "ui", "ui"]
+
+
+def test_pause_holds_every_grant():
+    scheduler = QuotaScheduler(limit=100, window=1.0)
+    scheduler.pause(0.2)
+    assert scheduler.stats()["paused_s"] > 0
+    waited = scheduler.acquire("s")
+    assert waited >= 0.15
+    assert scheduler.stats()["throttled"] == 1
+
+
+def test_stats_only_name_the_viewers_own_session():
+    scheduler = QuotaScheduler(limit=10)
+    for session_id in ("a1b2c3d4-secret", "a1b2c3d4-secret", "viewer"):
+        scheduler.acquire(session_id)
+    assert scheduler.stats("viewer")["top_sessions"] == [
+        {"session": "other", "requests": 2}, {"session": "you", "requests": 1},
+    ]
+    assert all(entry["session"] == "other" for entry in scheduler.stats()["top_sessions"])
+
+
+def test_session_pauses_every_grant_for_retry_after_then_retries(server):
+    scheduler = QuotaScheduler(limit=100, window=1.0)
+    server.throttle(1, retry_after="0.2")
+    sp = spotipy.Spotify(auth_manager=fake.StubAuthManager("user-1"), requests_session=QuotaSession(scheduler))
+    sp.prefix = server.prefix
+    started = time.monotonic()
+    assert sp.me()["id"] == "user-1"
+    # The retry had to wait out the pause like every other request
+    assert time.monotonic() - started >= 0.15
+    assert scheduler.stats()["throttled"] == 1
+    assert scheduler.stats()["total_granted"] == 2
+    assert me_calls(server) == 2
+
+
+def test_session_attributes_retries_to_the_work_context(server):
+    scheduler = RecordingScheduler()
+    server.throttle(1, retry_after="0")
+    with work_context("s1", BACKGROUND):
+        response = QuotaSession(scheduler).get(server.prefix + "me")
+    assert response.status_code == 200
+    assert scheduler.grants == [("s1", BACKGROUND), ("s1", BACKGROUND)]
+    assert scheduler.pauses == [0.0]
+
+
+@pytest.mark.parametrize("retry_after", ["soon", None])
+def test_session_pauses_a_second_without_a_usable_retry_after(server, retry_after):
+    scheduler = RecordingScheduler()
+    server.throttle(1, retry_after=retry_after)
+    assert QuotaSession(scheduler).get(server.prefix + "me").status_code == 200
+    assert scheduler.pauses == [1.0]
+
+
+def test_session_returns_the_429_once_retries_run_out(server):
+    scheduler = RecordingScheduler()
+    server.throttle(10, retry_after="0")
+    response = QuotaSession(scheduler, retries=2).get(server.prefix + "me")
+    assert response.status_code == 429
+    assert me_calls(server) == 3
+    assert len(scheduler.grants) == 3 and len(scheduler.pauses) == 2
@@ -0,0 +1,145 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from echomood_sessions import SessionMemoryManager, SPILL_SUFFIX, estimate_bytes
+
+KEYS = ("music_data", "track_features")
+
+
+def defaults():
+    return {"music_data": [], "track_features": {}, "page": "login"}
+
+
+def library(n):
+    return [{'track': {'id': f't{i}', 'name': f'Track {i}'}} for i in range(n)]
+
+
+@pytest.fixture
+def manager(tmp_path):
+    def make(**kwargs):
+        kwargs.setdefault("budget_bytes", 10 ** 9)
+        manager = SessionMemoryManager(str(tmp_path), KEYS, defaults, **kwargs)
+        # Tests call enforce() themselves
+        manager._enforce_in_background = lambda: None
+        return manager
+    return make
+
+
+def run(manager, session_id, state, busy=False):
+    restored = manager.begin(session_id, state)
+    manager.end(session_id, busy=busy)
+    return restored
+
+
+def spill_files(path):
+    return sorted(name for name in os.listdir(path) if name.endswith(SPILL_SUFFIX))
+
+
+def test_idle_session_round_trips_through_disk(manager):
+    sessions = manager(idle_seconds=0)
+    state = {"music_data": library(500), "track_features": {"t1": {"energy": 0.5}}, "page": "mood"}
+    original = {key: state[key] for key in KEYS}
+    run(sessions, "s1", state)
+
+    sessions.enforce()
+    assert state == {"music_data": [], "track_features": {}, "page": "mood"}
+    assert spill_files(sessions.spill_dir) == ["s1" + SPILL_SUFFIX]
+
+    assert sessions.begin("s1", state)
+    assert {key: state[key] for key in KEYS} == original
+    assert spill_files(sessions.spill_dir) == []
+    assert sessions.stats()["spills"] == 1 and sessions.stats()["restores"] == 1
+
+
+def test_managers_sharing_a_spill_dir_keep_each_others_files(manager, tmp_path):
+    first = manager(idle_seconds=0)
+    run(first, "s1", {"music_data": library(10)})
+    first.enforce()
+
+    second = manager(idle_seconds=0)
+    assert second.spill_dir != first.spill_dir
+    assert os.path.dirname(second.spill_dir) == str(tmp_path)
+    assert spill_files(first.spill_dir) == ["s1" + SPILL_SUFFIX]
+
+
+def leftover_dir(base, host, pid, age=0):
+    path = base / f"process-{host}-{pid}-abc123"
+    path.mkdir()
+    (path / ("s1" + SPILL_SUFFIX)).write_bytes(b"x")
+    stamp = time.time() - age
+    for item in (path / ("s1" + SPILL_SUFFIX), path):
+        os.utime(item, (stamp, stamp))
+    return path
+
+
+def test_dead_or_stale_processes_spill_dirs_are_removed(manager, tmp_path):
+    finished = subprocess.Popen([sys.executable, "-c", "pass"])
+    finished.wait()
+    host = socket.gethostname()
+    dead = leftover_dir(tmp_path, host, finished.pid)
+    alive = leftover_dir(tmp_path, host, os.getppid())
+    other_host = leftover_dir(tmp_path, "other-host", 1)
+    stale = leftover_dir(tmp_path, "other-host", 2, age=7200)
+
+    manager(expire_seconds=3600)
+    assert not dead.exists() and not stale.exists()
+    assert alive.exists() and other_host.exists()
+
+
+def test_spilling_waits_for_the_state_lock(manager):
+    sessions = manager(idle_seconds=0)
+    state = {"music_data": library(10)}
+    lock = threading.RLock()
+    sessions.begin("s1", state, lock)
+    sessions.end("s1")
+
+    with lock:
+        # Streamlit holds this lock while it prepares the session's next run
+        spiller = threading.Thread(target=sessions.enforce)
+        spiller.start()
+        spiller.join(0.2)
+        assert spiller.is_alive()
+        assert len(state["music_data"]) == 10
+    spiller.join(5)
+    assert state["music_data"] == []
+    assert sessions.begin("s1", state, lock)
+    assert len(state["music_data"]) == 10
+
+
+def test_running_and_busy_sessions_stay_resident(manager):
+    sessions = manager(idle_seconds=0)
+    running = {"music_data": library(10)}
+    busy = {"music_data": library(10)}
+    sessions.begin("running", running)
+    run(sessions, "busy", busy, busy=True)
+
+    sessions.enforce()
+    assert len(running["music_data"]) == 10 and len(busy["music_data"]) == 10
+    assert sessions.stats()["spilled"] == 0
+
+
+def test_least_recently_used_sessions_spill_first_while_over_budget(manager):
+    sessions = manager(idle_seconds=3600, min_idle_seconds=0)
+    states = {session_id: {"music_data": library(2000)} for session_id in ("a", "b", "c")}
+    for session_id in ("a", "b", "c", "a"):
+        run(sessions, session_id, states[session_id])
+    sessions.budget_bytes = int(2.5 * estimate_bytes(states["a"]["music_data"]))
+
+    sessions.enforce()
+    # b is the least recently used now that a came back, and spilling it brings the total under budget
+    assert [session_id for session_id, state in states.items() if not state["music_data"]] == ["b"]
+    assert sessions.stats()["resident"] == 2
+
+
+def test_recently_active_sessions_stay_resident_over_budget(manager):
+    sessions = manager(idle_seconds=3600, min_idle_seconds=3600, budget_bytes=1)
+    state = {"music_data": library(100)}
+    run(sessions, "s1", state)
+    sessions.enforce()
+    assert len(state["music_data"]) == 100
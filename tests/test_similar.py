@@ -0,0 +1,62 @@
+import numpy as np
+import streamlit.logger
+
+from echomood_similar import SimilarityIndex
+
+streamlit.logger.set_log_level("error")
+import echomood_app as app  # noqa: E402
+
+
+def clustered(n_clusters=10, size=50, dims=6, seed=3):
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(0, 1, (n_clusters, dims))
+    return np.concatenate([center + rng.normal(0, 0.05, (size, dims)) for center in centers])
+
+
+def test_query_excludes_the_seed():
+    matrix = clustered()
+    index = SimilarityIndex(np.arange(len(matrix)), matrix)
+    results = index.query(7, k=20)
+    assert len(results) == 20
+    assert 7 not in [item for item, _, _ in results]
+
+
+def test_recall_matches_brute_force():
+    matrix = clustered()
+    index = SimilarityIndex(np.arange(len(matrix)), matrix)
+    found = 0
+    queries = range(0, len(matrix), 25)
+    for seed in queries:
+        distances = np.sqrt(((matrix - matrix[seed]) ** 2).sum(axis=1))
+        distances[seed] = np.inf
+        exact = set(np.argsort(distances)[:10].tolist())
+        found += len(exact & {item for item, _, _ in index.query(seed, k=10)})
+    assert found / (10 * len(queries)) >= 0.95
+
+
+def library(vectors, artists):
+    music_data = [{'track': {'id': f't{i}', 'artists': [{'id': artist}]}} for i, artist in enumerate(artists)]
+    features = {f't{i}': dict(zip(app.MOOD_FEATURES, vector)) for i, vector in enumerate(vectors) if vector}
+    return music_data, features
+
+
+def test_shared_genres_outrank_a_slightly_closer_track():
+    music_data, features = library(
+        [[0.5] * 6, [0.52] * 6, [0.54] * 6, [0.9] * 6],
+        ["seed-artist", "pop-artist", "rock-artist", "other"],
+    )
+    index = app.build_similarity_index(music_data, features)
+    genre_cache = {"seed-artist": ["rock", "indie"], "pop-artist": ["pop"], "rock-artist": ["rock", "indie"]}
+
+    by_features = app.find_similar_tracks(music_data, index, 0, k=2)
+    assert [i for i, _, _ in by_features] == [1, 2]
+    with_genres = app.find_similar_tracks(music_data, index, 0, genre_cache=genre_cache, k=2)
+    assert with_genres[0] == (2, with_genres[0][1], ("indie", "rock"))
+    assert [i for i, _, _ in with_genres] == [2, 1]
+
+
+def test_track_without_features_has_no_similar_tracks():
+    music_data, features = library([[0.5] * 6, None, [0.6] * 6, [0.7] * 6], ["a", "b", "c", "d"])
+    index = app.build_similarity_index(music_data, features)
+    assert app.find_similar_tracks(music_data, index, 1) == []
+    assert app.find_similar_tracks(music_data, None, 0) == []
@@ -0,0 +1,64 @@
+import threading
+
+from echomood_workers import FairWorkerPool, INTERACTIVE, BACKGROUND, current_work_context
+
+
+def run_queued(pool, submit_all):
+    """Hold the pool's only worker while submit_all queues tasks, then return the order they ran in."""
+    gate = threading.Event()
+    order = []
+    blocker = pool.submit(gate.wait)
+    futures = submit_all(order)
+    gate.set()
+    blocker.result(timeout=5)
+    for future in futures:
+        future.result(timeout=5)
+    return order
+
+
+def test_sessions_take_turns_within_a_lane():
+    pool = FairWorkerPool(max_workers=1)
+
+    def submit_all(order):
+        futures = [pool.submit(order.append, ("big", i), session_id="big") for i in range(6)]
+        futures += [pool.submit(order.append, ("small", i), session_id="small") for i in range(2)]
+        return futures
+
+    order = run_queued(pool, submit_all)
+    assert [session for session, _ in order] == ["big", "small", "big", "small", "big", "big", "big", "big"]
+    # Each session's own tasks keep their order
+    assert [i for session, i in order if session == "big"] == list(range(6))
+    pool.shutdown()
+
+
+def test_interactive_lane_goes_first_with_a_background_share():
+    pool = FairWorkerPool(max_workers=1, background_every=5)
+
+    def submit_all(order):
+        futures = [pool.submit(order.append, "bg", session_id="a", priority=BACKGROUND) for _ in range(3)]
+        futures += [pool.submit(order.append, "ui", session_id="b", priority=INTERACTIVE) for _ in range(8)]
+        return futures
+
+    order = run_queued(pool, submit_all)
+    # The blocker was pick 1; every 5th pick goes to background while interactive work waits
+    assert order == ["ui", "ui", "ui", "bg", "ui", "ui", "ui", "ui", "bg", "ui", "bg"]
+    pool.shutdown()
+
+
+def test_warm_pool_runs_a_burst_in_parallel():
+    pool = FairWorkerPool(max_workers=8)
+    pool.submit(lambda: None).result(timeout=5)
+    # Every task waits for all the others, so this only finishes if they run on separate threads
+    barrier = threading.Barrier(6)
+    futures = [pool.submit(barrier.wait, 5) for _ in range(6)]
+    for future in futures:
+        future.result(timeout=10)
+    pool.shutdown()
+
+
+def test_tasks_run_under_the_submitters_work_context():
+    pool = FairWorkerPool(max_workers=2)
+    assert pool.submit(current_work_context, session_id="s1", priority=BACKGROUND).result(timeout=5) == \
+        ("s1", BACKGROUND)
+    assert pool.submit(current_work_context).result(timeout=5) == (None, INTERACTIVE)
+    pool.shutdown()